@@ -338,6 +338,8 @@ push_file(WALSegno *xlogfile, const char *archive_status_dir,
 
 	elog(LOG, "pushing file \"%s\"", xlogfile->name);
 
+	fault_injection_point("push_file");
+
 	/* If compression is not required, then just copy it as is */
 	if (!is_compress)
 		rc = push_file_internal_uncompressed(xlogfile, pg_xlog_dir,
@@ -540,6 +540,8 @@ do_backup_pg(InstanceState *instanceState, PGconn *backup_conn,
 		parray_free(prev_backup_filelist);
 	}
 
+	fault_injection_point("stop_backup");
+
 	/* Notify end of backup */
 	pg_stop_backup(instanceState, &current, backup_conn, nodeInfo);
 
@@ -786,13 +788,13 @@ do_backup(InstanceState *instanceState, pgSetBackupParams *set_backup_params,
 		 */
 		int	attempts = 10;
 
-		if (time(NULL) < latest_backup_id)
+		if (backup_clock_time() < latest_backup_id)
 			elog(ERROR, "Can't assign backup_id, there is already a backup in future (%s)",
 				base36enc(latest_backup_id));
 
 		do
 		{
-			current.backup_id = time(NULL);
+			current.backup_id = backup_clock_time();
 			pgBackupInitDir(&current, instanceState->instance_backup_subdir_path);
 			if (current.backup_id == INVALID_BACKUP_ID)
 				sleep(1);
@@ -906,7 +908,7 @@ do_backup(InstanceState *instanceState, pgSetBackupParams *set_backup_params,
 	}
 
 	/* Backup is done. Update backup status */
-	current.end_time = time(NULL);
+	current.end_time = backup_clock_time();
 	current.status = BACKUP_STATUS_DONE;
 	write_backup(&current, true);
 
@@ -2074,7 +2076,7 @@ backup_cleanup(bool fatal, void *userdata)
 	{
 		elog(WARNING, "Backup %s is running, setting its status to ERROR",
 			 backup_id_of(&current));
-		current.end_time = time(NULL);
+		current.end_time = backup_clock_time();
 		current.status = BACKUP_STATUS_ERROR;
 		write_backup(&current, true);
 	}
@@ -2139,6 +2141,8 @@ backup_files(void *arg)
 		if (interrupted || thread_interrupted)
 			elog(ERROR, "Interrupted during backup");
 
+		fault_injection_point("backup_file");
+
 		elog(progress ? INFO : LOG, "Progress: (%d/%d). Process file \"%s\"",
 			 i + 1, n_backup_files_list, file->rel_path);
 
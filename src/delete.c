@@ -782,6 +782,8 @@ delete_backup_files(pgBackup *backup)
 		if (interrupted)
 			elog(ERROR, "interrupted during delete backup");
 
+		fault_injection_point("delete_file");
+
 		if (progress)
 			elog(INFO, "Progress: (%zd/%zd). Delete file \"%s\"",
 				 i + 1, num_files, full_path);
@@ -644,7 +644,7 @@ merge_chain(InstanceState *instanceState,
 	threads_args = (merge_files_arg *) palloc(sizeof(merge_files_arg) * num_threads);
 
 	thread_interrupted = false;
-	merge_time = time(NULL);
+	merge_time = backup_clock_time();
 	elog(INFO, "Start merging backup files");
 	for (i = 0; i < num_threads; i++)
 	{
@@ -685,7 +685,7 @@ merge_chain(InstanceState *instanceState,
 		//total_in_place_merge_bytes += threads_args[i].in_place_merge_bytes;
 	}
 
-	time(&end_time);
+	end_time = backup_clock_time();
 	pretty_time_interval(difftime(end_time, merge_time),
 						 pretty_time, lengthof(pretty_time));
 
@@ -740,7 +740,7 @@ merge_chain(InstanceState *instanceState,
 	full_backup->primary_conninfo = pgut_strdup(dest_backup->primary_conninfo);
 
 	full_backup->merge_time = merge_time;
-	full_backup->end_time = time(NULL);
+	full_backup->end_time = backup_clock_time();
 
 	full_backup->compress_alg = dest_backup->compress_alg;
 	full_backup->compress_level = dest_backup->compress_level;
@@ -945,6 +945,8 @@ merge_files(void *arg)
 		if (S_ISDIR(dest_file->mode))
 			goto done;
 
+		fault_injection_point("merge_file");
+
 		elog(progress ? INFO : LOG, "Progress: (%d/%lu). Merging file \"%s\"",
 			i + 1, n_files, dest_file->rel_path);
 
@@ -660,6 +660,9 @@ main(int argc, char *argv[])
 	/* Initialize logger */
 	init_logger(backup_path, &instance_config.logger);
 
+	/* Fault injection points of tests */
+	init_fault_injection();
+
 	/* command was initialized for a few commands */
 	if (command)
 	{
@@ -1223,6 +1223,9 @@ extern const char *base36enc_to(long unsigned int value, char buf[ARG_SIZE_HINT
 /* Abuse C99 Compound Literal's lifetime */
 #define base36enc(value) (base36enc_to((value), (char[base36bufsize]){0}))
 extern long unsigned int base36dec(const char *text);
+extern time_t backup_clock_time(void);
+extern void init_fault_injection(void);
+extern void fault_injection_point(const char *name);
 extern uint32 parse_server_version(const char *server_version_str);
 extern uint32 parse_program_version(const char *program_version);
 extern bool   parse_page(Page page, XLogRecPtr *lsn);
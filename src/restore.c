@@ -1221,6 +1221,8 @@ restore_files(void *arg)
 		if (interrupted || thread_interrupted)
 			elog(ERROR, "Interrupted during restore");
 
+		fault_injection_point("restore_file");
+
 		elog(progress ? INFO : LOG, "Progress: (%d/%lu). Restore file \"%s\"",
 			 i + 1, n_files, dest_file->rel_path);
 
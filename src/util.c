@@ -10,6 +10,7 @@
 
 #include "pg_probackup.h"
 
+#include <signal.h>
 #include <time.h>
 
 #include <unistd.h>
@@ -56,6 +57,155 @@ base36dec(const char *text)
 	return strtoul(text, NULL, 36);
 }
 
+/*
+ * Current time used for backup_id, start, end and merge time.
+ *
+ * The regression tests may shift it forward with
+ * PGPROBACKUP_TESTS_CLOCK_OFFSET (in seconds) to take several backups
+ * within one wall-clock second without waiting for the next one.
+ */
+time_t
+backup_clock_time(void)
+{
+	static bool		initialized = false;
+	static int64	offset = 0;
+
+	if (!initialized)
+	{
+		const char *value = getenv("PGPROBACKUP_TESTS_CLOCK_OFFSET");
+
+		if (value != NULL && value[0] != '\0' &&
+			(!parse_int64(value, &offset, 0) || offset < 0))
+			elog(ERROR, "Invalid value of PGPROBACKUP_TESTS_CLOCK_OFFSET: \"%s\"",
+				 value);
+		initialized = true;
+	}
+
+	return time(NULL) + (time_t) offset;
+}
+
+/*
+ * Fault injection points for tests.
+ *
+ * PGPROBACKUP_TESTS_FAULTS is a comma separated list of "name:action[:hit]".
+ * When point "name" is reached for the hit-th time (1 by default) the
+ * action is taken: "pause" stops the process with SIGSTOP until SIGCONT,
+ * "kill" kills it with SIGKILL, "error" raises ERROR. Points are counted
+ * across all threads.
+ */
+#define MAX_FAULT_POINTS	16
+
+typedef enum FaultAction
+{
+	FAULT_PAUSE,
+	FAULT_KILL,
+	FAULT_ERROR
+} FaultAction;
+
+typedef struct FaultPoint
+{
+	char		name[64];
+	FaultAction	action;
+	uint32		hit;
+	pg_atomic_uint32 hits;
+} FaultPoint;
+
+static FaultPoint fault_points[MAX_FAULT_POINTS];
+static int	n_fault_points = 0;
+
+/*
+ * Parse PGPROBACKUP_TESTS_FAULTS. Must be called before threads are started.
+ */
+void
+init_fault_injection(void)
+{
+	const char *value = getenv("PGPROBACKUP_TESTS_FAULTS");
+	char	   *list;
+	char	   *item;
+	char	   *saveptr = NULL;
+
+	if (value == NULL || value[0] == '\0')
+		return;
+
+	list = pgut_strdup(value);
+	for (item = strtok_r(list, ",", &saveptr); item != NULL;
+		 item = strtok_r(NULL, ",", &saveptr))
+	{
+		FaultPoint *point;
+		char	   *action = strchr(item, ':');
+		char	   *hit;
+
+		if (n_fault_points >= MAX_FAULT_POINTS)
+			elog(ERROR, "Too many fault injection points in PGPROBACKUP_TESTS_FAULTS");
+
+		if (action == NULL || action - item >= sizeof(point->name))
+			elog(ERROR, "Invalid fault injection point \"%s\"", item);
+		*action++ = '\0';
+
+		point = &fault_points[n_fault_points];
+		strlcpy(point->name, item, sizeof(point->name));
+		point->hit = 1;
+		pg_atomic_init_u32(&point->hits, 0);
+
+		hit = strchr(action, ':');
+		if (hit != NULL)
+		{
+			*hit++ = '\0';
+			if (!parse_uint32(hit, &point->hit, 0) || point->hit == 0)
+				elog(ERROR, "Invalid hit \"%s\" of fault injection point \"%s\"",
+					 hit, point->name);
+		}
+
+		if (strcmp(action, "pause") == 0)
+			point->action = FAULT_PAUSE;
+		else if (strcmp(action, "kill") == 0)
+			point->action = FAULT_KILL;
+		else if (strcmp(action, "error") == 0)
+			point->action = FAULT_ERROR;
+		else
+			elog(ERROR, "Invalid action \"%s\" of fault injection point \"%s\"",
+				 action, point->name);
+
+		n_fault_points++;
+	}
+	pfree(list);
+}
+
+void
+fault_injection_point(const char *name)
+{
+	int			i;
+
+	for (i = 0; i < n_fault_points; i++)
+	{
+		FaultPoint *point = &fault_points[i];
+
+		if (strcmp(point->name, name) != 0 ||
+			pg_atomic_add_fetch_u32(&point->hits, 1) != point->hit)
+			continue;
+
+		switch (point->action)
+		{
+			case FAULT_PAUSE:
+				elog(LOG, "Fault injection point \"%s\": pause", name);
+#ifndef WIN32
+				kill(getpid(), SIGSTOP);
+#endif
+				break;
+			case FAULT_KILL:
+				elog(LOG, "Fault injection point \"%s\": kill", name);
+#ifndef WIN32
+				kill(getpid(), SIGKILL);
+#endif
+				_exit(1);
+				break;
+			case FAULT_ERROR:
+				elog(ERROR, "Fault injection point \"%s\": error", name);
+				break;
+		}
+	}
+}
+
 static void
 checkControlFile(ControlFileData *ControlFile)
 {
@@ -1,6 +1,8 @@
 import unittest
 import os
 
+from .helpers.timings import TimingDatabase
+
 from . import init_test, merge_test, option_test, show_test, compatibility_test, \
     backup_test, delete_test, delta_test, restore_test, validate_test, \
     retention_test, pgpro560_test, pgpro589_test, pgpro2068_test, false_positive_test, replica_test, \
@@ -64,7 +66,17 @@ def load_tests(loader, tests, pattern):
     suite.addTests(loader.loadTestsFromModule(validate_test))
     suite.addTests(loader.loadTestsFromModule(CVE_2018_1058_test))
 
-    return suite
+    # run the longest tests first, so they don't become stragglers
+    # in parallel runs
+    return unittest.TestSuite(TimingDatabase().longest_first(iterate_tests(suite)))
+
+
+def iterate_tests(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from iterate_tests(test)
+        else:
+            yield test
 
 #   test_pgpro434_2 unexpected success
 # ToDo:
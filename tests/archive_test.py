@@ -8,7 +8,6 @@ from datetime import datetime, timedelta
 import subprocess
 from sys import exit
 from time import sleep
-from distutils.dir_util import copy_tree
 
 
 class ArchiveTest(ProbackupTest, unittest.TestCase):
@@ -239,8 +238,8 @@ class ArchiveTest(ProbackupTest, unittest.TestCase):
         gdb.set_breakpoint('pg_stop_backup')
         gdb.run_until_break()
 
-        self.set_auto_conf(node, {'archive_command': 'exit 1'})
-        node.reload()
+        with self.auto_conf(node) as conf:
+            conf.set(archive_command='exit 1')
 
         gdb.continue_execution_until_exit()
 
@@ -300,10 +299,8 @@ class ArchiveTest(ProbackupTest, unittest.TestCase):
         gdb.set_breakpoint('pg_stop_backup')
         gdb.run_until_break()
 
-        self.set_auto_conf(node, {'archive_command': 'exit 1'})
-        node.reload()
-
-        os.environ["PGAPPNAME"] = "foo"
+        with self.auto_conf(node) as conf:
+            conf.set(archive_command='exit 1')
 
         pid = node.safe_psql(
             "postgres",
@@ -311,8 +308,6 @@ class ArchiveTest(ProbackupTest, unittest.TestCase):
             "FROM pg_stat_activity "
             "WHERE application_name = 'pg_probackup'").decode('utf-8').rstrip()
 
-        os.environ["PGAPPNAME"] = "pg_probackup"
-
         postgres_gdb = self.gdb_attach(pid)
         if self.get_version(node) < 150000:
             postgres_gdb.set_breakpoint('do_pg_stop_backup')
@@ -1243,7 +1238,7 @@ class ArchiveTest(ProbackupTest, unittest.TestCase):
         self.add_instance(backup_dir, 'replica', replica)
         self.set_archiving(backup_dir, 'replica', replica, replica=True)
 
-        copy_tree(
+        self.clone_backup_catalog(
             os.path.join(backup_dir, 'wal', 'master'),
             os.path.join(backup_dir, 'wal', 'replica'))
 
@@ -2107,9 +2102,8 @@ class ArchiveTest(ProbackupTest, unittest.TestCase):
                 'Failed to start pg_receivexlog: {0}'.format(
                     pg_receivexlog.communicate()[1]))
 
-        self.set_auto_conf(node, {'synchronous_standby_names': app_name})
-        self.set_auto_conf(node, {'synchronous_commit': 'on'})
-        node.reload()
+        with self.auto_conf(node) as conf:
+            conf.set(synchronous_standby_names=app_name, synchronous_commit='on')
 
         # FULL
         self.backup_node(backup_dir, 'node', node, options=['--stream'])
@@ -2307,9 +2301,13 @@ class ArchiveTest(ProbackupTest, unittest.TestCase):
             replica.append_conf(
                 'recovery.conf', "restore_command = '{0}'".format(restore_command))
 
+        log_offset = os.path.getsize(
+            os.path.join(replica.logs_dir, 'postgresql.log'))
         replica.restart()
 
-        sleep(5)
+        tail_file(
+            os.path.join(replica.logs_dir, 'postgresql.log'), offset=log_offset,
+            linetimeout=30).wait(contains='prefetch state: 8/10')
 
         with open(os.path.join(replica.logs_dir, 'postgresql.log'), 'r') as f:
             postgres_log_content = f.read()
@@ -2369,9 +2367,13 @@ class ArchiveTest(ProbackupTest, unittest.TestCase):
             replica.append_conf(
                 'recovery.conf', "restore_command = '{0}'".format(restore_command))
 
+        log_offset = os.path.getsize(
+            os.path.join(replica.logs_dir, 'postgresql.log'))
         replica.restart()
 
-        sleep(5)
+        tail_file(
+            os.path.join(replica.logs_dir, 'postgresql.log'), offset=log_offset,
+            linetimeout=30).wait(contains='prefetch state: 8/10')
 
         with open(os.path.join(replica.logs_dir, 'postgresql.log'), 'r') as f:
             postgres_log_content = f.read()
@@ -2388,7 +2390,9 @@ class ArchiveTest(ProbackupTest, unittest.TestCase):
         # generate WAL, copy it into prefetch directory, then corrupt
         # some segment
         node.pgbench_init(scale=20)
-        sleep(20)
+        self.assertTrue(
+            self.wait_wal_archived(node, None),
+            'WAL of pgbench_init() is not archived')
 
         # now copy WAL files into prefetch directory and corrupt some of them
         archive_dir = os.path.join(backup_dir, 'wal', 'node')
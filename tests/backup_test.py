@@ -3,8 +3,8 @@ import os
 import re
 from time import sleep, time
 from .helpers.ptrack_helpers import base36enc, ProbackupTest, ProbackupException
+from .helpers.pgdata_generator import SyntheticPgdata
 import shutil
-from distutils.dir_util import copy_tree
 from testgres import ProcessType, QueryException
 import subprocess
 
@@ -403,8 +403,6 @@ class BackupTest(ProbackupTest, unittest.TestCase):
                 '\n Unexpected Error Message: {0}\n CMD: {1}'.format(
                     repr(e.message), self.cmd))
 
-        sleep(1)
-
         try:
             self.backup_node(
                 backup_dir, 'node', node,
@@ -424,8 +422,6 @@ class BackupTest(ProbackupTest, unittest.TestCase):
                 '\n Unexpected Error Message: {0}\n CMD: {1}'.format(
                     repr(e.message), self.cmd))
 
-        sleep(1)
-
         try:
             self.backup_node(
                 backup_dir, 'node', node,
@@ -445,8 +441,6 @@ class BackupTest(ProbackupTest, unittest.TestCase):
                 '\n Unexpected Error Message: {0}\n CMD: {1}'.format(
                     repr(e.message), self.cmd))
 
-        sleep(1)
-
         if self.ptrack:
             try:
                 self.backup_node(
@@ -543,8 +537,6 @@ class BackupTest(ProbackupTest, unittest.TestCase):
                 '\n Unexpected Error Message: {0}\n CMD: {1}'.format(
                     repr(e.message), self.cmd))
 
-        sleep(1)
-
         try:
             self.backup_node(
                 backup_dir, 'node', node,
@@ -563,8 +555,6 @@ class BackupTest(ProbackupTest, unittest.TestCase):
                 '\n Unexpected Error Message: {0}\n CMD: {1}'.format(
                     repr(e.message), self.cmd))
 
-        sleep(1)
-
         try:
             self.backup_node(
                 backup_dir, 'node', node,
@@ -583,8 +573,6 @@ class BackupTest(ProbackupTest, unittest.TestCase):
                 '\n Unexpected Error Message: {0}\n CMD: {1}'.format(
                     repr(e.message), self.cmd))
 
-        sleep(1)
-
         if self.ptrack:
             try:
                 self.backup_node(
@@ -680,8 +668,6 @@ class BackupTest(ProbackupTest, unittest.TestCase):
                 '\n Unexpected Error Message: {0}\n CMD: {1}'.format(
                     repr(e.message), self.cmd))
 
-        sleep(1)
-
         try:
             self.backup_node(
                 backup_dir, 'node', node,
@@ -700,8 +686,6 @@ class BackupTest(ProbackupTest, unittest.TestCase):
                 '\n Unexpected Error Message: {0}\n CMD: {1}'.format(
                     repr(e.message), self.cmd))
 
-        sleep(1)
-
         try:
             self.backup_node(
                 backup_dir, 'node', node,
@@ -720,8 +704,6 @@ class BackupTest(ProbackupTest, unittest.TestCase):
                 '\n Unexpected Error Message: {0}\n CMD: {1}'.format(
                     repr(e.message), self.cmd))
 
-        sleep(1)
-
         if self.ptrack:
             try:
                 self.backup_node(
@@ -2330,7 +2312,7 @@ class BackupTest(ProbackupTest, unittest.TestCase):
         # bgwriter_pid = node.auxiliary_pids[ProcessType.BackgroundWriter][0]
         # gdb_checkpointer = self.gdb_attach(bgwriter_pid)
 
-        copy_tree(
+        self.clone_backup_catalog(
             os.path.join(backup_dir, 'wal', 'node'),
             os.path.join(backup_dir, 'wal', 'replica'))
 
@@ -2779,6 +2761,9 @@ class BackupTest(ProbackupTest, unittest.TestCase):
         """
         https://github.com/postgrespro/pg_probackup/issues/231
         """
+        # we need two backups in the same wall-clock second
+        self.backup_clock = False
+
         backup_dir = os.path.join(self.tmp_path, self.module_name, self.fname, 'backup')
         node = self.make_simple_node(
             base_dir=os.path.join(self.module_name, self.fname, 'node'))
@@ -3656,3 +3641,56 @@ class BackupTest(ProbackupTest, unittest.TestCase):
         self.assertFalse(
             os.path.exists(conf_file),
             "File should not exist: {0}".format(conf_file))
+
+    def test_delta_backup_synthetic_relations(self):
+        """
+        FULL and DELTA backups of thousands of relation files with
+        checksummed pages which are unknown to server
+        """
+        node = self.make_simple_node(
+            base_dir=os.path.join(self.module_name, self.fname, 'node'),
+            initdb_params=['--data-checksums'])
+
+        backup_dir = os.path.join(self.tmp_path, self.module_name, self.fname, 'backup')
+        self.init_pb(backup_dir)
+        self.add_instance(backup_dir, 'node', node)
+        node.slow_start()
+
+        if node.major_version >= 10:
+            lsn_function = 'pg_catalog.pg_current_wal_lsn()'
+        else:
+            lsn_function = 'pg_catalog.pg_current_xlog_location()'
+
+        generator = SyntheticPgdata(
+            node.data_dir, n_databases=2, n_relations=1000, blocks=4)
+        generator.generate(node.execute('SELECT {0}'.format(lsn_function))[0][0])
+
+        full_id = self.backup_node(
+            backup_dir, 'node', node, options=['--stream'])
+        self.assertGreaterEqual(
+            len(self.get_backup_filelist(backup_dir, 'node', full_id)),
+            generator.n_files())
+
+        node.safe_psql('postgres', 'CHECKPOINT')
+        changed = generator.change(
+            0.05, node.execute('SELECT {0}'.format(lsn_function))[0][0])
+
+        delta_id = self.backup_node(
+            backup_dir, 'node', node, backup_type='delta', options=['--stream'])
+
+        # DELTA backup copies changed pages only
+        filelist = self.get_backup_filelist(backup_dir, 'node', delta_id)
+        for path, _ in changed[:10]:
+            entry = filelist[os.path.relpath(path, node.data_dir)]
+            self.assertGreater(int(entry['size']), 0)
+
+        pgdata = self.pgdata_content(node.data_dir)
+        node.stop()
+
+        node_restored = self.make_empty_node(
+            os.path.join(self.module_name, self.fname, 'node_restored'))
+        self.restore_node(
+            backup_dir, 'node', node_restored, options=['-j', '4'])
+
+        pgdata_restored = self.pgdata_content(node_restored.data_dir)
+        self.compare_pgdata(pgdata, pgdata_restored)
@@ -0,0 +1,12 @@
+import unittest
+
+from . import archive_test, catalog_test, file_count_test, throughput_test
+
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    suite.addTests(loader.loadTestsFromModule(throughput_test))
+    suite.addTests(loader.loadTestsFromModule(archive_test))
+    suite.addTests(loader.loadTestsFromModule(file_count_test))
+    suite.addTests(loader.loadTestsFromModule(catalog_test))
+    return suite
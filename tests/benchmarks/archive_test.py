@@ -0,0 +1,292 @@
+import os
+import shutil
+import threading
+import time
+import unittest
+
+from ..helpers.catalog_generator import wal_segment_name
+from .bench import BenchmarkTest, MB, compression_options, env_int, env_list
+from .bench import latency_stats
+
+# Segments are not real WAL: archive-push doesn't parse them, archive-get
+# is run with --no-validate-wal when prefetching. The node is never
+# started, so the emulated archiver and startup process are the only
+# users of WAL directory.
+
+# the first synthetic segment, far from segments of initdb
+first_segno = 0x100
+
+
+def xlog_dir(node):
+    if node.major_version >= 10:
+        return 'pg_wal'
+    return 'pg_xlog'
+
+
+def segment_template(seg_size):
+    """ content of synthetic segment, compressible about 2 times """
+    page = bytearray(8192)
+    template = bytearray()
+    while len(template) < seg_size:
+        page[:4096] = os.urandom(4096)
+        template += page
+    return template[:seg_size]
+
+
+class WalProducer(threading.Thread):
+    """
+    Write synthetic segments to pg_wal and their .ready files to
+    archive_status at rate segments per second, all at once if rate is 0.
+    ready_at maps segment name to time its .ready file appeared.
+    """
+
+    def __init__(self, wal_dir, names, template, rate):
+        super(WalProducer, self).__init__()
+        self.daemon = True
+        self.wal_dir = wal_dir
+        self.names = names
+        self.template = template
+        self.rate = rate
+        self.ready_at = {}
+        self.error = None
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            start = time.time()
+            for i, name in enumerate(self.names):
+                if self.rate:
+                    delay = start + float(i) / self.rate - time.time()
+                    if delay > 0 and self.stopped.wait(delay):
+                        return
+                if self.stopped.is_set():
+                    return
+                self.write_segment(i, name)
+        except Exception as e:
+            self.error = e
+
+    def write_segment(self, i, name):
+        # segments differ, so archive-push can't skip them as duplicates
+        self.template[:16] = '{0:016X}'.format(i).encode()
+        path = os.path.join(self.wal_dir, name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(self.template)
+        os.rename(path + '.tmp', path)
+
+        open(os.path.join(
+            self.wal_dir, 'archive_status', name + '.ready'), 'w').close()
+        self.ready_at[name] = time.time()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class ArchiveBenchmark(BenchmarkTest, unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(ArchiveBenchmark, self).__init__(*args, **kwargs)
+        env = self.test_env
+        self.n_segments = env_int(env, 'PG_PROBACKUP_BENCHMARK_WAL_SEGMENTS', 64)
+        self.rates = [
+            float(rate) for rate in
+            env_list(env, 'PG_PROBACKUP_BENCHMARK_WAL_RATE', '0,4')]
+        self.batch_sizes = [
+            int(batch) for batch in
+            env_list(env, 'PG_PROBACKUP_BENCHMARK_WAL_BATCH', '1,10')]
+
+    def make_archive_node(self):
+        # pg_control is all pg_probackup needs, the node isn't started
+        node = self.make_simple_node(
+            base_dir=os.path.join(self.module_name, self.fname, 'node'))
+
+        backup_dir = os.path.join(
+            self.tmp_path, self.module_name, self.fname, 'backup')
+        self.init_pb(backup_dir)
+        self.add_instance(backup_dir, 'node', node)
+
+        seg_size = int(node.get_control_data()['Bytes per WAL segment'])
+        names = [
+            wal_segment_name(1, first_segno + i, seg_size)
+            for i in range(self.n_segments)]
+        return node, backup_dir, seg_size, names
+
+    def wal_compressions(self):
+        # archive-push supports zlib only
+        return [
+            compression for compression in self.compressions
+            if compression.partition(':')[0] in ('none', 'zlib')]
+
+    def reset_archive(self, backup_dir, node):
+        wal_dir = os.path.join(backup_dir, 'wal', 'node')
+        shutil.rmtree(wal_dir, ignore_errors=True)
+        os.makedirs(wal_dir)
+
+        status_dir = os.path.join(node.data_dir, xlog_dir(node), 'archive_status')
+        for name in os.listdir(status_dir):
+            os.remove(os.path.join(status_dir, name))
+
+    def archive_segments(self, backup_dir, node, names, template, rate, options):
+        """
+        Feed segments to archive-push like archiver does: the oldest
+        .ready segment is pushed, then its .ready file is renamed to .done.
+        Returns (ready_at, done_at) dicts of segment times.
+        """
+        wal_dir = os.path.join(node.data_dir, xlog_dir(node))
+        status_dir = os.path.join(wal_dir, 'archive_status')
+        producer = WalProducer(wal_dir, names, template, rate)
+        done_at = {}
+        producer.start()
+        try:
+            while len(done_at) < len(names):
+                if producer.error is not None:
+                    raise producer.error
+
+                ready = sorted(
+                    name[:-len('.ready')] for name in os.listdir(status_dir)
+                    if name.endswith('.ready'))
+                if not ready:
+                    time.sleep(0.005)
+                    continue
+
+                name = ready[0]
+                self.run_pb([
+                    'archive-push', '-B', backup_dir, '--instance=node',
+                    '--wal-file-name={0}'.format(name),
+                    '--wal-file-path={0}'.format(os.path.join(wal_dir, name))
+                    ] + options)
+                now = time.time()
+                os.rename(
+                    os.path.join(status_dir, name + '.ready'),
+                    os.path.join(status_dir, name + '.done'))
+
+                # batch pushes and renames following segments as well
+                for status in os.listdir(status_dir):
+                    if not status.endswith('.done'):
+                        continue
+                    done = status[:-len('.done')]
+                    done_at[done] = now
+                    os.remove(os.path.join(status_dir, status))
+                    # checkpoint would recycle archived segment
+                    os.remove(os.path.join(wal_dir, done))
+        finally:
+            producer.stop()
+        return producer.ready_at, done_at
+
+    def restore_segments(self, backup_dir, node, names, options):
+        """
+        Request segments from archive-get one by one like startup process
+        does during recovery. Returns latencies of calls.
+        """
+        wal_dir = os.path.join(node.data_dir, xlog_dir(node))
+        latencies = []
+        for name in names:
+            start = time.time()
+            self.run_pb([
+                'archive-get', '-B', backup_dir, '--instance=node',
+                '--wal-file-name={0}'.format(name),
+                '--wal-file-path={0}'.format(os.path.join(xlog_dir(node), 'RECOVERYXLOG'))
+                ] + options, cwd=node.data_dir)
+            latencies.append(time.time() - start)
+            os.remove(os.path.join(wal_dir, 'RECOVERYXLOG'))
+
+        shutil.rmtree(os.path.join(wal_dir, 'pbk_prefetch'), ignore_errors=True)
+        return latencies
+
+    def add_wal_record(self, operation, latencies, wall, seg_size, n_records, **params):
+        record = dict(params)
+        record.update(self.usage_since(n_records))
+        record.update(latency_stats(latencies))
+        record.update(
+            count=len(latencies), wall=wall, bytes=len(latencies) * seg_size,
+            segments_per_s=len(latencies) / wall if wall > 0 else 0.0,
+            mb_per_s=len(latencies) * seg_size / MB / wall if wall > 0 else 0.0)
+        return self.add_record(operation, record)
+
+    # @unittest.skip("skip")
+    def test_archive_push_latency(self):
+        """
+        Segments appear at controlled rate, archive-push is called for
+        them like archiver does. Latency is time from .ready to .done
+        of segment, sustained rate is segments from the first .ready
+        to the last .done per second.
+        """
+        node, backup_dir, seg_size, names = self.make_archive_node()
+        template = segment_template(seg_size)
+
+        for compression in self.wal_compressions():
+            combinations = set()
+            for batch in self.batch_sizes:
+                for threads in self.thread_counts:
+                    # archive-push never runs more threads than batch size
+                    combinations.add((batch, min(threads, batch)))
+
+            for batch, threads in sorted(combinations):
+                for rate in self.rates:
+                    self.reset_archive(backup_dir, node)
+                    options = [
+                        '-j', str(threads), '--batch-size', str(batch)
+                        ] + compression_options(compression)
+
+                    n_records = len(self.resource_usage.records)
+                    ready_at, done_at = self.archive_segments(
+                        backup_dir, node, names, template, rate, options)
+
+                    self.add_wal_record(
+                        'archive-push',
+                        [done_at[name] - ready_at[name] for name in names],
+                        max(done_at.values()) - min(ready_at.values()),
+                        seg_size, n_records,
+                        threads=threads, batch=batch, rate=rate,
+                        compression=compression, seg_size=seg_size,
+                        pg_version=node.major_version_str,
+                        # at fixed rate throughput is the rate itself
+                        metric='latency_p90' if rate else 'segments_per_s')
+
+        self.check_baseline()
+
+    # @unittest.skip("skip")
+    def test_archive_get_latency(self):
+        """
+        Segments are requested one by one from archive-get without
+        prefetch and with prefetch of batch size segments
+        """
+        node, backup_dir, seg_size, names = self.make_archive_node()
+        template = segment_template(seg_size)
+
+        for compression in self.wal_compressions():
+            self.reset_archive(backup_dir, node)
+            self.archive_segments(
+                backup_dir, node, names, template, 0,
+                ['-j', str(max(self.thread_counts)),
+                 '--batch-size', str(max(self.batch_sizes))] +
+                compression_options(compression))
+
+            runs = [(1, 1)]
+            for batch in self.batch_sizes:
+                for threads in self.thread_counts:
+                    if batch > 1:
+                        runs.append((batch, min(threads, batch)))
+
+            for batch, threads in sorted(set(runs)):
+                if batch > 1:
+                    options = [
+                        '-j', str(threads), '--batch-size', str(batch),
+                        '--no-validate-wal']
+                else:
+                    options = ['--batch-size=1']
+
+                n_records = len(self.resource_usage.records)
+                start = time.time()
+                latencies = self.restore_segments(
+                    backup_dir, node, names, options)
+
+                self.add_wal_record(
+                    'archive-get', latencies, time.time() - start,
+                    seg_size, n_records,
+                    threads=threads, batch=batch, prefetch=batch > 1,
+                    compression=compression, seg_size=seg_size,
+                    pg_version=node.major_version_str,
+                    metric='segments_per_s')
+
+        self.check_baseline()
@@ -0,0 +1,165 @@
+import math
+import time
+
+from ..helpers.ptrack_helpers import ProbackupTest
+from . import report
+
+MB = 1024.0 * 1024
+
+
+def env_int(env, name, default):
+    return int(env[name]) if name in env and env[name] else default
+
+
+def env_list(env, name, default):
+    value = env[name] if name in env and env[name] else default
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def compression_options(compression):
+    """ pg_probackup options of 'none' or 'algorithm[:level]' """
+    if compression == 'none':
+        return []
+    algorithm, _, level = compression.partition(':')
+    options = ['--compress-algorithm={0}'.format(algorithm)]
+    if level:
+        options.append('--compress-level={0}'.format(level))
+    return options
+
+
+def percentile(values, percent):
+    """ nearest-rank percentile of non-empty list """
+    values = sorted(values)
+    rank = max(1, int(math.ceil(percent / 100.0 * len(values))))
+    return values[rank - 1]
+
+
+def latency_stats(latencies):
+    """ latency percentiles in seconds """
+    return dict(
+        latency_p50=percentile(latencies, 50),
+        latency_p90=percentile(latencies, 90),
+        latency_p99=percentile(latencies, 99),
+        latency_max=max(latencies))
+
+
+class BenchmarkTest(ProbackupTest):
+    """
+    ProbackupTest which measures pg_probackup runs and writes results
+    to tmp_dirs/benchmarks.json, see Readme for settings
+    """
+    # records of the session
+    session_report = None
+
+    def __init__(self, *args, **kwargs):
+        super(BenchmarkTest, self).__init__(*args, **kwargs)
+        env = self.test_env
+
+        self.size_mb = env_int(env, 'PG_PROBACKUP_BENCHMARK_SIZE', 256)
+        self.n_files = env_int(env, 'PG_PROBACKUP_BENCHMARK_FILES', 16)
+        self.changed_percent = env_int(env, 'PG_PROBACKUP_BENCHMARK_CHANGED', 10)
+        self.thread_counts = [
+            int(threads) for threads in
+            env_list(env, 'PG_PROBACKUP_BENCHMARK_THREADS', '1,4')]
+        self.compressions = env_list(
+            env, 'PG_PROBACKUP_BENCHMARK_COMPRESSION', 'none,zlib:1')
+        self.baseline = env['PG_PROBACKUP_BENCHMARK_BASELINE'] \
+            if 'PG_PROBACKUP_BENCHMARK_BASELINE' in env else None
+        self.tolerance = float(
+            env['PG_PROBACKUP_BENCHMARK_TOLERANCE']
+            if 'PG_PROBACKUP_BENCHMARK_TOLERANCE' in env else 0.1)
+
+        if BenchmarkTest.session_report is None:
+            BenchmarkTest.session_report = report.Report(
+                env['PG_PROBACKUP_BENCHMARK_REPORT']
+                if 'PG_PROBACKUP_BENCHMARK_REPORT' in env else None)
+        self.records = []
+
+    def fill_node(self, node, size_mb=None, n_files=None):
+        """
+        size_mb of table data in n_files tables, rows are partly
+        compressible like real data
+        """
+        size_mb = self.size_mb if size_mb is None else size_mb
+        n_files = self.n_files if n_files is None else n_files
+        # about 160 bytes per row with tuple header and line pointer
+        rows = max(1, int(size_mb * MB / n_files / 160))
+        for i in range(n_files):
+            node.safe_psql(
+                'postgres',
+                'CREATE TABLE bench_{0} WITH (autovacuum_enabled = off) AS '
+                'SELECT g AS id, md5(g::text) || md5(random()::text) || '
+                'repeat(\'x\', 40) AS payload '
+                'FROM generate_series(1, {1}) g'.format(i, rows))
+        node.safe_psql('postgres', 'VACUUM')
+        node.safe_psql('postgres', 'CHECKPOINT')
+
+    def change_data(self, node, percent=None, n_files=None):
+        """ update percent of rows of every table of fill_node() """
+        percent = self.changed_percent if percent is None else percent
+        n_files = self.n_files if n_files is None else n_files
+        if percent <= 0:
+            return
+        for i in range(n_files):
+            node.safe_psql(
+                'postgres',
+                'UPDATE bench_{0} SET payload = md5(random()::text) || payload '
+                'WHERE id % {1} = 0'.format(i, max(1, int(100 / percent))))
+        node.safe_psql('postgres', 'CHECKPOINT')
+
+    def measure(self, operation, run, nbytes, **params):
+        """
+        run() and record its wall time and throughput of nbytes, which
+        may be a function of run() result. Resources of pg_probackup runs
+        made by run() are added, nbytes is computed after they are taken,
+        so its own runs aren't counted. Returns result of run().
+        """
+        n_records = len(self.resource_usage.records)
+        start = time.time()
+        result = run()
+        wall = time.time() - start
+        usage = self.usage_since(n_records)
+        if callable(nbytes):
+            nbytes = nbytes(result)
+
+        record = dict(params)
+        record.update(usage)
+        record.update(
+            wall=wall, bytes=nbytes,
+            mb_per_s=nbytes / MB / wall if wall > 0 else 0.0)
+        self.add_record(operation, record)
+        return result
+
+    def usage_since(self, n_records):
+        """ resources of pg_probackup runs recorded after n_records """
+        usage = {}
+        for record in self.resource_usage.records[n_records:]:
+            for field in ('user', 'sys', 'rchar', 'wchar'):
+                if field in record:
+                    usage[field] = usage.get(field, 0) + record[field]
+            if 'maxrss' in record:
+                usage['maxrss'] = max(usage.get('maxrss', 0), record['maxrss'])
+        return usage
+
+    def add_record(self, operation, record):
+        record = dict(record)
+        record.update(benchmark=self.fname, operation=operation)
+        self.records.append(record)
+        self.session_report.add(record)
+        return record
+
+    def check_baseline(self):
+        """ fail if records of this test regressed against baseline """
+        if not self.baseline:
+            return
+        regressions = report.compare(
+            report.load(self.baseline), self.records, self.tolerance)
+        self.assertFalse(
+            regressions,
+            'Throughput regressions against {0}:\n{1}'.format(
+                self.baseline, report.format_regressions(regressions)))
+
+    @staticmethod
+    def backup_bytes(backup):
+        """ bytes of PGDATA covered by backup, as shown by show_pb() """
+        return backup.get('pgdata-bytes') or backup.get('data-bytes') or 0
@@ -0,0 +1,70 @@
+import os
+import unittest
+
+from .bench import BenchmarkTest, env_list
+
+
+class CatalogBenchmark(BenchmarkTest, unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(CatalogBenchmark, self).__init__(*args, **kwargs)
+        self.backup_counts = [
+            int(count) for count in
+            env_list(self.test_env, 'PG_PROBACKUP_BENCHMARK_BACKUPS',
+                     '1000,10000')]
+
+    # @unittest.skip("skip")
+    def test_catalog_scaling(self):
+        """
+        show, show --archive, set-backup and delete --expired with WAL
+        purge of fabricated catalogs of hourly PAGE backups with daily
+        FULL ones. Retention removes about half of backups.
+        """
+        full_every = 24
+        for n_backups in sorted(self.backup_counts):
+            backup_dir = os.path.join(
+                self.tmp_path, self.module_name, self.fname,
+                'backup_{0}'.format(n_backups))
+            self.init_pb(backup_dir)
+            backups = self.synthetic_catalog(
+                backup_dir, 'node', n_backups=n_backups,
+                full_every=full_every, timeline_every=max(1, n_backups // 4),
+                error_every=50, segments_per_backup=1).generate()
+
+            params = dict(backups=n_backups, metric='wall')
+            base = ['-B', backup_dir, '--instance=node']
+
+            # run_pb() directly, as show_pb() may return cached result
+            self.measure(
+                'show', lambda: self.run_pb(['show'] + base), 0,
+                format='plain', **params)
+            self.measure(
+                'show',
+                lambda: self.run_pb(['show', '--format=json'] + base), 0,
+                format='json', **params)
+            self.measure(
+                'show-archive',
+                lambda: self.run_pb(
+                    ['show', '--archive', '--format=json'] + base), 0,
+                **params)
+            # ERROR backups have no recovery-time and can't be pinned
+            newest_ok = [
+                backup for backup in backups if backup['status'] == 'OK'][-1]
+            self.measure(
+                'set-backup',
+                lambda: self.run_pb(
+                    ['set-backup', '-i', newest_ok['id'], '--ttl=30d'] + base),
+                0, **params)
+
+            n_full = len([
+                backup for backup in backups
+                if backup['backup-mode'] == 'FULL' and backup['status'] == 'OK'])
+            self.measure(
+                'delete-expired',
+                lambda: self.run_pb([
+                    'delete', '--delete-expired', '--delete-wal',
+                    '--retention-redundancy={0}'.format(max(1, n_full // 2))
+                    ] + base),
+                0, **params)
+
+        self.check_baseline()
@@ -0,0 +1,38 @@
+import argparse
+import sys
+
+if __package__:
+    from .report import compare, default_report_path, format_regressions, load
+else:
+    # run as script, importing tests package would need PG_CONFIG
+    from report import compare, default_report_path, format_regressions, load
+
+# python tests/benchmarks/compare.py <baseline.json> [<current.json>]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare benchmark results with baseline')
+    parser.add_argument('baseline', help='JSON of baseline run')
+    parser.add_argument(
+        'current', nargs='?', default=default_report_path(),
+        help='JSON of current run, tmp_dirs/benchmarks.json by default')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.1,
+        help='allowed relative drop of metric, 0.1 by default')
+    parser.add_argument(
+        '--metric', default=None,
+        help='metric to compare instead of the one of each record')
+    args = parser.parse_args(argv)
+
+    regressions = compare(
+        load(args.baseline), load(args.current), args.tolerance, args.metric)
+    if regressions:
+        print(format_regressions(regressions))
+        return 1
+    print('No regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
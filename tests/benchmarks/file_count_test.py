@@ -0,0 +1,108 @@
+import os
+import shutil
+import unittest
+
+from ..helpers.pgdata_generator import SyntheticPgdata
+from .bench import BenchmarkTest, env_list
+
+
+class FileCountBenchmark(BenchmarkTest, unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(FileCountBenchmark, self).__init__(*args, **kwargs)
+        self.file_counts = [
+            int(count) for count in
+            env_list(self.test_env, 'PG_PROBACKUP_BENCHMARK_FILE_COUNTS',
+                     '10000,100000')]
+
+    def current_lsn(self, node):
+        if node.major_version >= 10:
+            query = 'SELECT pg_catalog.pg_current_wal_lsn()'
+        else:
+            query = 'SELECT pg_catalog.pg_current_xlog_location()'
+        return node.execute(query)[0][0]
+
+    # @unittest.skip("skip")
+    def test_file_count_scaling(self):
+        """
+        FULL and DELTA backups, show and restore of PGDATA with growing
+        number of synthetic relation files, each of main, fsm and vm
+        forks. Time and memory of file list handling dominate there.
+        """
+        node = self.make_simple_node(
+            base_dir=os.path.join(self.module_name, self.fname, 'node'),
+            set_replication=True,
+            initdb_params=['--data-checksums'])
+
+        backup_dir = os.path.join(
+            self.tmp_path, self.module_name, self.fname, 'backup')
+        self.init_pb(backup_dir)
+        self.add_instance(backup_dir, 'node', node)
+        node.slow_start()
+
+        restored = self.make_empty_node(
+            os.path.join(self.module_name, self.fname, 'node_restored'))
+
+        generator = None
+        for n_files in sorted(self.file_counts):
+            # passes share oids, so files of the previous one would be
+            # left over where relations are split differently
+            if generator is not None:
+                for db_oid in generator.database_oids():
+                    shutil.rmtree(generator.database_path(db_oid))
+
+            # relations are spread over databases of 10000 files at most
+            n_relations = max(1, n_files // 3)
+            n_databases = max(1, (n_relations + 3332) // 3333)
+            generator = SyntheticPgdata(
+                node.data_dir, n_databases=n_databases,
+                n_relations=n_relations // n_databases)
+            generator.generate(self.current_lsn(node))
+
+            for threads in self.thread_counts:
+                params = dict(
+                    threads=threads, files=generator.n_files(),
+                    pg_version=node.major_version_str, metric='wall')
+                options = ['--stream', '-j', str(threads)]
+
+                full_id = self.measure(
+                    'backup',
+                    lambda: self.backup_node(
+                        backup_dir, 'node', node, options=options),
+                    lambda backup_id: self.backup_bytes(
+                        self.show_pb(backup_dir, 'node', backup_id)),
+                    mode='full', **params)
+
+                node.safe_psql('postgres', 'CHECKPOINT')
+                generator.change(
+                    self.changed_percent / 100.0, self.current_lsn(node))
+                delta_id = self.measure(
+                    'backup',
+                    lambda: self.backup_node(
+                        backup_dir, 'node', node, backup_type='delta',
+                        options=options),
+                    lambda backup_id: self.backup_bytes(
+                        self.show_pb(backup_dir, 'node', backup_id)),
+                    mode='delta', **params)
+
+                # show_pb() may return cached result
+                self.measure(
+                    'show',
+                    lambda: self.run_pb([
+                        'show', '-B', backup_dir, '--instance=node',
+                        '--format=json']),
+                    0, **params)
+
+                self.measure(
+                    'restore',
+                    lambda: self.restore_node(
+                        backup_dir, 'node', restored, backup_id=delta_id,
+                        options=['-j', str(threads)]),
+                    self.backup_bytes(
+                        self.show_pb(backup_dir, 'node', delta_id)),
+                    **params)
+                shutil.rmtree(restored.data_dir, ignore_errors=True)
+
+                self.delete_pb(backup_dir, 'node', full_id)
+
+        self.check_baseline()
@@ -0,0 +1,93 @@
+import json
+import os
+
+# Machine-readable results of benchmarks and their comparison with
+# a baseline: records are dicts of parameters and metrics, records with
+# the same parameters are compared by metric, see higher_is_better.
+
+# record fields which are measured, everything else identifies the case
+metric_fields = frozenset((
+    'wall', 'user', 'sys', 'maxrss', 'rchar', 'wchar', 'read_bytes',
+    'write_bytes', 'mb_per_s', 'segments_per_s', 'latency_p50',
+    'latency_p90', 'latency_p99', 'latency_max', 'bytes', 'data_bytes',
+    'count'))
+
+# metric compared with baseline and whether higher is better
+default_metric = 'mb_per_s'
+higher_is_better = {
+    'mb_per_s': True, 'segments_per_s': True,
+    'wall': False, 'latency_p50': False, 'latency_p90': False,
+    'latency_p99': False, 'latency_max': False}
+
+
+def default_report_path():
+    return os.path.join(
+        os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+        'tmp_dirs', 'benchmarks.json')
+
+
+def case_key(record):
+    """ parameters of record as hashable key """
+    return tuple(sorted(
+        (field, str(value)) for field, value in record.items()
+        if field not in metric_fields))
+
+
+class Report(object):
+    """ Benchmark records of session, appended to JSON file as they come """
+
+    def __init__(self, path=None):
+        self.path = path or default_report_path()
+        self.records = []
+
+    def add(self, record):
+        self.records.append(record)
+        self.write()
+
+    def write(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.records, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, tolerance=0.1, metric=None):
+    """
+    Regressions of current records against baseline ones: list of
+    (key, metric, baseline value, current value). A case regresses when
+    its metric is worse than baseline by more than tolerance fraction.
+    Cases missing from either side are not compared. Each record may
+    name its own metric in 'metric' field.
+    """
+    baseline_by_key = dict((case_key(record), record) for record in baseline)
+    regressions = []
+    for record in current:
+        key = case_key(record)
+        base = baseline_by_key.get(key)
+        if base is None:
+            continue
+        name = metric or record.get('metric', default_metric)
+        if name not in record or name not in base or not base[name]:
+            continue
+        if higher_is_better.get(name, True):
+            worse = record[name] < base[name] * (1 - tolerance)
+        else:
+            worse = record[name] > base[name] * (1 + tolerance)
+        if worse:
+            regressions.append((key, name, base[name], record[name]))
+    return regressions
+
+
+def format_regressions(regressions):
+    lines = []
+    for key, name, base, current in regressions:
+        lines.append('{0}: {1} {2:.3f} -> {3:.3f} ({4:+.1f}%)'.format(
+            ', '.join('{0}={1}'.format(field, value) for field, value in key),
+            name, base, current, (current - base) * 100.0 / base))
+    return '\n'.join(lines)
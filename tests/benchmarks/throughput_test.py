@@ -0,0 +1,129 @@
+import os
+import shutil
+import unittest
+
+from .bench import BenchmarkTest, compression_options
+
+
+class ThroughputBenchmark(BenchmarkTest, unittest.TestCase):
+
+    def make_bench_node(self):
+        node = self.make_simple_node(
+            base_dir=os.path.join(self.module_name, self.fname, 'node'),
+            set_replication=True,
+            ptrack_enable=self.ptrack,
+            initdb_params=['--data-checksums'])
+
+        backup_dir = os.path.join(
+            self.tmp_path, self.module_name, self.fname, 'backup')
+        self.init_pb(backup_dir)
+        self.add_instance(backup_dir, 'node', node)
+        self.set_archiving(backup_dir, 'node', node)
+        node.slow_start()
+
+        if self.ptrack:
+            node.safe_psql("postgres", "CREATE EXTENSION ptrack")
+
+        self.fill_node(node)
+        return node, backup_dir
+
+    def backup_modes(self):
+        modes = ['delta', 'page']
+        if self.ptrack:
+            modes.append('ptrack')
+        return modes
+
+    def params(self, node, threads, compression, **kwargs):
+        params = dict(
+            threads=threads, compression=compression,
+            size_mb=self.size_mb, files=self.n_files,
+            pg_version=node.major_version_str)
+        params.update(kwargs)
+        return params
+
+    def take_backup(self, backup_dir, node, mode, options, params):
+        """ measured backup, returns its show_pb() record """
+        if mode != 'page':
+            options = options + ['--stream']
+        backup_id = self.measure(
+            'backup',
+            lambda: self.backup_node(
+                backup_dir, 'node', node, backup_type=mode, options=options),
+            lambda backup_id: self.backup_bytes(
+                self.show_pb(backup_dir, 'node', backup_id)),
+            mode=mode, **params)
+        return self.show_pb(backup_dir, 'node', backup_id)
+
+    # @unittest.skip("skip")
+    def test_backup_restore_throughput(self):
+        """
+        FULL and incremental backups, validate and restore of the chain
+        for every number of threads and compression
+        """
+        node, backup_dir = self.make_bench_node()
+        restored = self.make_empty_node(
+            os.path.join(self.module_name, self.fname, 'node_restored'))
+
+        for threads in self.thread_counts:
+            for compression in self.compressions:
+                params = self.params(node, threads, compression)
+                options = ['-j', str(threads)] + compression_options(compression)
+
+                chain = [self.take_backup(
+                    backup_dir, node, 'full', options, params)]
+                for mode in self.backup_modes():
+                    self.change_data(node)
+                    chain.append(self.take_backup(
+                        backup_dir, node, mode, options, params))
+
+                chain_bytes = sum(backup['data-bytes'] for backup in chain)
+                self.measure(
+                    'validate',
+                    lambda: self.validate_pb(
+                        backup_dir, 'node', chain[-1]['id'],
+                        options=['-j', str(threads)]),
+                    chain_bytes, **params)
+
+                self.measure(
+                    'restore',
+                    lambda: self.restore_node(
+                        backup_dir, 'node', restored,
+                        backup_id=chain[-1]['id'],
+                        options=['-j', str(threads)]),
+                    self.backup_bytes(chain[-1]), **params)
+                shutil.rmtree(restored.data_dir, ignore_errors=True)
+
+                self.delete_pb(backup_dir, 'node', chain[0]['id'])
+
+        self.check_baseline()
+
+    # @unittest.skip("skip")
+    def test_merge_throughput(self):
+        """ merge of FULL and incremental backup chain """
+        node, backup_dir = self.make_bench_node()
+
+        for threads in self.thread_counts:
+            for compression in self.compressions:
+                params = self.params(node, threads, compression)
+                options = ['-j', str(threads)] + compression_options(compression)
+
+                chain = [self.take_backup(
+                    backup_dir, node, 'full', options, params)]
+                for mode in self.backup_modes():
+                    self.change_data(node)
+                    chain.append(self.take_backup(
+                        backup_dir, node, mode, options, params))
+
+                self.measure(
+                    'merge',
+                    lambda: self.merge_backup(
+                        backup_dir, 'node', chain[-1]['id'],
+                        options=['-j', str(threads)]),
+                    sum(backup['data-bytes'] for backup in chain),
+                    chain=len(chain), **params)
+
+                # merged backup may take ID of the last one
+                self.delete_pb(
+                    backup_dir, 'node', self.show_pb(backup_dir, 'node')[0]['id'])
+
+        self.check_baseline()
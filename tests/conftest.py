@@ -0,0 +1,60 @@
+import os
+import pytest
+
+from .helpers.timings import TimingDatabase, unittest_id
+
+# pytest counterpart of load_tests() from __init__.py
+collect_ignore = []
+
+if not ('PG_PROBACKUP_PTRACK' in os.environ and
+        os.environ['PG_PROBACKUP_PTRACK'] == 'ON'):
+    collect_ignore.append('ptrack_test.py')
+
+if not ('PG_PROBACKUP_LONG' in os.environ and
+        os.environ['PG_PROBACKUP_LONG'] == 'ON'):
+    collect_ignore.append('time_consuming_test.py')
+
+if not ('PG_PROBACKUP_BENCHMARK' in os.environ and
+        os.environ['PG_PROBACKUP_BENCHMARK'] == 'ON'):
+    collect_ignore.append('benchmarks')
+
+if not ('PGPROBACKUPBIN_OLD' in os.environ and
+        os.environ['PGPROBACKUPBIN_OLD']):
+    collect_ignore.append('compatibility_test.py')
+
+
+def pytest_collection_modifyitems(config, items):
+    if 'PG_PROBACKUP_TEST_BASIC' in os.environ and \
+            os.environ['PG_PROBACKUP_TEST_BASIC'] == 'ON':
+        deselected = [i for i in items if not i.name.startswith('test_basic')]
+        items[:] = [i for i in items if i.name.startswith('test_basic')]
+        config.hook.pytest_deselected(items=deselected)
+
+    # longest tests first. xdist workers must collect the same order
+    # while durations change under them, ProbackupScheduling orders
+    # tests on the controller instead
+    if not hasattr(config, 'workerinput'):
+        items[:] = TimingDatabase().longest_first(
+            items, test_id=unittest_id, test_class=lambda item: item.cls)
+
+
+def pytest_sessionfinish(session):
+    if hasattr(session.config, 'workeroutput'):
+        # xdist worker, controller writes report of the whole session
+        from .helpers.ptrack_helpers import ProbackupTest
+        usage = ProbackupTest.resource_usage
+        session.config.workeroutput['resource_usage'] = usage.records
+        usage.records = []
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    from .helpers.ptrack_helpers import ProbackupTest
+    ProbackupTest.resource_usage.records.extend(
+        getattr(node, 'workeroutput', {}).get('resource_usage', []))
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_xdist_make_scheduler(config, log):
+    from .helpers.scheduling import ProbackupScheduling
+    return ProbackupScheduling(config, log)
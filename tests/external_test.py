@@ -1,6 +1,5 @@
 import unittest
 import os
-from time import sleep
 from .helpers.ptrack_helpers import ProbackupTest, ProbackupException
 from .helpers.cfs_helpers import find_by_name
 import shutil
@@ -56,8 +55,6 @@ class ExternalTest(ProbackupTest, unittest.TestCase):
                 '\n Unexpected Error Message: {0}\n CMD: {1}'.format(
                     repr(e.message), self.cmd))
 
-        sleep(1)
-
         # FULL backup
         self.backup_node(
             backup_dir, 'node', node, backup_type="full",
@@ -1878,8 +1875,6 @@ class ExternalTest(ProbackupTest, unittest.TestCase):
                 '\n Unexpected Error Message: {0}\n CMD: {1}'.format(
                     repr(e.message), self.cmd))
 
-        sleep(1)
-
         # take DELTA without external directories
         self.backup_node(
             backup_dir, 'node', node,
@@ -1959,8 +1954,6 @@ class ExternalTest(ProbackupTest, unittest.TestCase):
                 '\n Unexpected Error Message: {0}\n CMD: {1}'.format(
                     repr(e.message), self.cmd))
 
-        sleep(1)
-
         # take DELTA without external directories
         backup_id = self.backup_node(
             backup_dir, 'node', node,
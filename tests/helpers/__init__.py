@@ -1,4 +1,4 @@
-__all__ = ['ptrack_helpers', 'cfs_helpers', 'data_helpers']
+__all__ = ['ptrack_helpers', 'cfs_helpers', 'data_helpers', 'scheduling', 'trash', 'resource_usage', 'page_mask', 'ptrack_map', 'catalog', 'query_pool', 'auto_conf', 'faults', 'pgdata_generator', 'catalog_generator']
 
 import unittest
 
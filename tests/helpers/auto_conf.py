@@ -0,0 +1,156 @@
+import os
+import time
+
+# Batched changes of node configuration: options are written to config
+# file at once, then the node is reloaded or restarted, whichever is
+# enough for pg_settings.context of changed options.
+
+# pg_settings.context values which need server restart
+restart_contexts = frozenset(('postmaster', 'internal'))
+
+
+def read_conf(path, rm_options=()):
+    """ (dict of options, list of include directives) of config file """
+    with open(path, 'r') as f:
+        raw_content = f.read()
+
+    options = {}
+    directives = []
+    for line in raw_content.splitlines():
+
+        # ignore comments
+        if line.startswith('#'):
+            continue
+
+        if line == '':
+            continue
+
+        if line.startswith('include'):
+            directives.append(line)
+            continue
+
+        name, var = line.partition('=')[::2]
+        name = name.strip()
+        var = var.strip()
+        var = var.strip('"')
+        var = var.strip("'")
+
+        # remove options specified in rm_options list
+        if name in rm_options:
+            continue
+
+        options[name] = var
+    return options, directives
+
+
+def write_conf(path, options, directives):
+    auto_conf = ''
+    for option in options:
+        auto_conf += "{0} = '{1}'\n".format(option, options[option])
+
+    for directive in directives:
+        auto_conf += directive + "\n"
+
+    with open(path, 'wt') as f:
+        f.write(auto_conf)
+        f.flush()
+
+
+class ConfigTransaction(object):
+    """
+    Options to set in config file of node, collected by set(), update()
+    and remove(). apply() writes them and reloads or restarts running
+    node, write() only writes. Used as context manager it applies
+    changes on exit unless an exception was raised:
+
+        with self.auto_conf(node) as conf:
+            conf.set(archive_timeout='10s')
+            conf.remove('archive_command')
+    """
+
+    def __init__(self, node, config='postgresql.auto.conf', reload_timeout=30):
+        self.node = node
+        self.path = os.path.join(node.data_dir, config)
+        self.reload_timeout = reload_timeout
+        self.options = {}
+        self.rm_options = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.apply()
+
+    def set(self, **options):
+        return self.update(options)
+
+    def update(self, options):
+        for name in options:
+            self.options[name] = options[name]
+            self.rm_options.discard(name)
+        return self
+
+    def remove(self, *names):
+        for name in names:
+            self.options.pop(name, None)
+            self.rm_options.add(name)
+        return self
+
+    def write(self):
+        """ write config file once, return names of changed options """
+        current, directives = read_conf(self.path)
+        changed = [name for name in self.rm_options if name in current]
+        options = dict(
+            (name, value) for name, value in current.items()
+            if name not in self.rm_options)
+        for name in self.options:
+            if options.get(name) != str(self.options[name]):
+                changed.append(name)
+            options[name] = self.options[name]
+
+        if changed:
+            write_conf(self.path, options, directives)
+        self.options = {}
+        self.rm_options = set()
+        return changed
+
+    def required_action(self, names):
+        """ 'restart' if any of options can't be changed by reload, else 'reload' """
+        names = set(name.lower() for name in names)
+        rows = self.node.execute(
+            'SELECT name, context FROM pg_catalog.pg_settings '
+            'WHERE name IN ({0})'.format(
+                ', '.join("'{0}'".format(name) for name in sorted(names))))
+        contexts = dict((name, context) for name, context in rows)
+        # unknown options may belong to libraries which are not loaded yet
+        if any(contexts.get(name, 'postmaster') in restart_contexts
+               for name in names):
+            return 'restart'
+        return 'reload'
+
+    def reload(self):
+        """ reload node and wait until configuration is reloaded """
+        query = 'SELECT pg_catalog.pg_conf_load_time()'
+        load_time = self.node.execute(query)[0][0]
+        self.node.reload()
+        deadline = time.time() + self.reload_timeout
+        while self.node.execute(query)[0][0] == load_time and \
+                time.time() < deadline:
+            time.sleep(0.05)
+
+    def apply(self):
+        """
+        Write config file and make running node use it.
+        Return 'reload', 'restart' or None if nothing was done.
+        """
+        changed = self.write()
+        if not changed or not getattr(self.node, 'is_started', False):
+            return None
+
+        action = self.required_action(changed)
+        if action == 'restart':
+            self.node.restart()
+        else:
+            self.reload()
+        return action
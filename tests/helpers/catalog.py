@@ -0,0 +1,190 @@
+import collections
+import json
+import os
+import struct
+import zlib
+
+from .data_helpers import crc32c_update
+
+# Readers of backup catalog files, which don't need pg_probackup binary:
+# backup.control, backup_content.control and page_header_map.
+
+BACKUP_CONTROL = 'backup.control'
+BACKUP_CONTENT = 'backup_content.control'
+HEADER_MAP = 'page_header_map'
+
+# backup.control fields, other values are strings
+control_int_fields = frozenset((
+    'compress-level', 'block-size', 'xlog-block-size', 'checksum-version',
+    'timelineid', 'recovery-xid', 'data-bytes', 'wal-bytes',
+    'uncompressed-bytes', 'pgdata-bytes', 'content-crc'))
+control_bool_fields = frozenset(('stream', 'from-replica'))
+
+# backup_content.control fields, other values are strings
+content_int_fields = frozenset((
+    'size', 'mode', 'crc', 'external_dir_num', 'dbOid', 'full_size',
+    'segno', 'n_blocks', 'n_headers', 'hdr_crc', 'hdr_off', 'hdr_size'))
+content_bool_fields = frozenset(('is_datafile', 'is_cfs'))
+
+# BackupPageHeader2: lsn, block, pos, checksum and padding
+backup_page_header2 = struct.Struct('=QiiH6x')
+PageHeader = collections.namedtuple(
+    'PageHeader', ['lsn', 'block', 'pos', 'checksum'])
+
+
+def base36enc(number):
+    """Converts an integer to a base36 string."""
+    alphabet = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    base36 = ''
+    sign = ''
+
+    if number < 0:
+        sign = '-'
+        number = -number
+
+    if 0 <= number < len(alphabet):
+        return sign + alphabet[number]
+
+    while number != 0:
+        number, i = divmod(number, len(alphabet))
+        base36 = alphabet[i] + base36
+
+    return sign + base36
+
+
+def _typed(key, value, int_fields, bool_fields):
+    if key in int_fields:
+        return int(value)
+    if key in bool_fields:
+        return value in ('true', '1')
+    return value
+
+
+def read_backup_control(path):
+    """ dict of backup.control values, numbers and booleans are converted """
+    control = {}
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            key, value = (part.strip() for part in line.split('=', 1))
+            if len(value) >= 2 and value[0] == value[-1] == "'":
+                value = value[1:-1]
+            control[key] = _typed(
+                key, value, control_int_fields, control_bool_fields)
+    return control
+
+
+def iter_backup_content(path, typed=True):
+    """ dicts of backup_content.control lines, read one by one """
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if typed:
+                entry = dict(
+                    (key, _typed(key, value, content_int_fields, content_bool_fields))
+                    for key, value in entry.items())
+            yield entry
+
+
+def read_page_headers(path, n_headers, hdr_off, hdr_size, hdr_crc=None):
+    """
+    PageHeader of every block of data file from page_header_map, see
+    get_data_file_headers(). The map keeps n_headers + 1 headers, the last
+    one only gives end position of the last block, it is not returned.
+    """
+    with open(path, 'rb') as f:
+        f.seek(hdr_off)
+        compressed = f.read(hdr_size)
+    if len(compressed) != hdr_size:
+        raise ValueError('Cannot read {0} bytes at offset {1} of "{2}"'.format(
+            hdr_size, hdr_off, path))
+
+    raw = zlib.decompress(compressed)
+    if len(raw) != (n_headers + 1) * backup_page_header2.size:
+        raise ValueError('Unexpected size of headers at offset {0} of "{1}"'.format(
+            hdr_off, path))
+    if hdr_crc is not None and crc32c_update(0, raw) != hdr_crc:
+        raise ValueError('Header map crc mismatch at offset {0} of "{1}"'.format(
+            hdr_off, path))
+
+    return [PageHeader._make(header)
+            for header in backup_page_header2.iter_unpack(raw)][:n_headers]
+
+
+class Backup(object):
+    """ Backup directory of catalog, files are read on first access """
+
+    def __init__(self, path):
+        self.path = path
+        self.id = os.path.basename(path)
+        self._control = None
+
+    def __repr__(self):
+        return 'Backup({0!r})'.format(self.path)
+
+    @property
+    def control(self):
+        if self._control is None:
+            self._control = read_backup_control(
+                os.path.join(self.path, BACKUP_CONTROL))
+        return self._control
+
+    def __getitem__(self, key):
+        return self.control[key]
+
+    def get(self, key, default=None):
+        return self.control.get(key, default)
+
+    @property
+    def status(self):
+        return self.control['status']
+
+    def files(self, typed=True):
+        """ entries of backup_content.control """
+        return iter_backup_content(
+            os.path.join(self.path, BACKUP_CONTENT), typed)
+
+    def filelist(self, typed=True):
+        """ dict of backup_content.control entries by path """
+        return dict((entry['path'], entry) for entry in self.files(typed))
+
+    def page_headers(self, entry, verify=True):
+        """ PageHeader list of data file entry of filelist """
+        n_headers = int(entry.get('n_headers', 0))
+        if n_headers <= 0:
+            return []
+        return read_page_headers(
+            os.path.join(self.path, HEADER_MAP), n_headers,
+            int(entry['hdr_off']), int(entry['hdr_size']),
+            int(entry['hdr_crc']) if verify else None)
+
+
+class Catalog(object):
+    """ Backup catalog created by 'pg_probackup init' """
+
+    def __init__(self, backup_dir):
+        self.backup_dir = backup_dir
+
+    def instances(self):
+        path = os.path.join(self.backup_dir, 'backups')
+        return sorted(
+            name for name in os.listdir(path)
+            if os.path.isdir(os.path.join(path, name)))
+
+    def backups(self, instance):
+        """ Backup of every backup of instance, oldest first """
+        path = os.path.join(self.backup_dir, 'backups', instance)
+        backups = []
+        for name in os.listdir(path):
+            if os.path.exists(os.path.join(path, name, BACKUP_CONTROL)):
+                backups.append(Backup(os.path.join(path, name)))
+        backups.sort(key=lambda backup: int(backup.id, 36))
+        return backups
+
+    def backup(self, instance, backup_id):
+        return Backup(os.path.join(
+            self.backup_dir, 'backups', instance, backup_id))
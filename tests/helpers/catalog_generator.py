@@ -0,0 +1,245 @@
+import gzip
+import os
+import random
+import time
+
+from .catalog import BACKUP_CONTROL, BACKUP_CONTENT, base36enc
+
+# Fabricated backup catalog for catalog-scale tests and benchmarks:
+# backup.control chains of thousands of backups over several timelines
+# and WAL archive of matching segments, made without pg_probackup and
+# server. Backups have no data files, so show, set-backup, delete and
+# WAL purge work with them, while validate, merge and restore don't.
+
+DEFAULT_SEG_SIZE = 16 * 1024 * 1024
+# the first segment of initdb is not archived
+FIRST_SEGNO = 2
+# SizeOfXLogLongPHD, the first record of segment starts there
+LONG_PAGE_HEADER_SIZE = 0x28
+
+
+def wal_segment_name(tli, segno, seg_size=DEFAULT_SEG_SIZE):
+    segments_per_xlogid = 0x100000000 // seg_size
+    return '{0:08X}{1:08X}{2:08X}'.format(
+        tli, segno // segments_per_xlogid, segno % segments_per_xlogid)
+
+
+def format_lsn(lsn):
+    return '{0:X}/{1:X}'.format(lsn >> 32, lsn & 0xFFFFFFFF)
+
+
+def format_time(timestamp):
+    """ time2iso() with utc """
+    return time.strftime('%Y-%m-%d %H:%M:%S+00', time.gmtime(timestamp))
+
+
+def write_backup_control(path, backup):
+    """ backup.control in order of pgBackupWriteControl() """
+    lines = [
+        '#Configuration',
+        'backup-mode = {0}'.format(backup['backup-mode']),
+        'stream = {0}'.format('true' if backup['stream'] else 'false'),
+        'compress-alg = none',
+        'compress-level = 1',
+        'from-replica = false',
+        '',
+        '#Compatibility',
+        'block-size = 8192',
+        'xlog-block-size = 8192',
+        'checksum-version = 1',
+        'program-version = {0}'.format(backup['program-version']),
+        'server-version = {0}'.format(backup['server-version']),
+        '',
+        '#Result backup info',
+        'timelineid = {0}'.format(backup['timelineid']),
+        'start-lsn = {0}'.format(backup['start-lsn']),
+        'stop-lsn = {0}'.format(backup['stop-lsn']),
+        "start-time = '{0}'".format(format_time(backup['start-time'])),
+        "end-time = '{0}'".format(format_time(backup['end-time'])),
+        'recovery-xid = {0}'.format(backup['recovery-xid'])]
+    if backup['status'] == 'OK':
+        lines.append("recovery-time = '{0}'".format(
+            format_time(backup['end-time'])))
+    lines += [
+        'data-bytes = {0}'.format(backup['data-bytes']),
+        'wal-bytes = {0}'.format(backup['wal-bytes']),
+        'uncompressed-bytes = {0}'.format(backup['data-bytes']),
+        'pgdata-bytes = {0}'.format(backup['pgdata-bytes']),
+        'status = {0}'.format(backup['status'])]
+    if backup.get('parent-backup-id'):
+        lines.append("parent-backup-id = '{0}'".format(
+            backup['parent-backup-id']))
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+class SyntheticCatalog(object):
+    """
+    n_backups backups of instance taken every interval seconds: chains
+    of FULL and up to full_every - 1 incremental backups of backup_mode,
+    each of them is parent of the next one. Every timeline_every backups
+    the server is promoted to the next timeline, and the chain starts
+    over with FULL. Every error_every backup is ERROR, and the next
+    backup is taken from the same parent. Archive keeps
+    segments_per_backup segments per interval from the first backup on,
+    sparse or gzipped. Instance is added unless it exists.
+
+        catalog = SyntheticCatalog(
+            backup_dir, 'node', n_backups=5000, timeline_every=1000)
+        backups = catalog.generate()
+        self.show_pb(backup_dir, 'node')
+    """
+
+    def __init__(self, backup_dir, instance='node', n_backups=100,
+                 interval=3600, full_every=24, backup_mode='PAGE',
+                 timeline_every=0, error_every=0, segments_per_backup=4,
+                 seg_size=DEFAULT_SEG_SIZE, compress_wal=False,
+                 start_time=None, pgdata_bytes=1024 * 1024 * 1024,
+                 program_version='2.5.15', server_version='14',
+                 pgdata=None, system_identifier=None, config=None):
+        self.backup_dir = backup_dir
+        self.instance = instance
+        self.n_backups = n_backups
+        self.interval = interval
+        self.full_every = full_every
+        self.backup_mode = backup_mode.upper()
+        self.timeline_every = timeline_every
+        self.error_every = error_every
+        self.segments_per_backup = segments_per_backup
+        self.seg_size = seg_size
+        self.compress_wal = compress_wal
+        if start_time is None:
+            start_time = int(time.time()) - n_backups * interval
+        self.start_time = start_time
+        self.pgdata_bytes = pgdata_bytes
+        self.program_version = program_version
+        self.server_version = server_version
+        self.pgdata = pgdata or os.path.join(backup_dir, 'pgdata')
+        self.system_identifier = system_identifier or random.getrandbits(63)
+        self.config = config or {}
+
+    def instance_backup_dir(self):
+        return os.path.join(self.backup_dir, 'backups', self.instance)
+
+    def instance_wal_dir(self):
+        return os.path.join(self.backup_dir, 'wal', self.instance)
+
+    def add_instance(self):
+        """ pg_probackup.conf like add-instance writes, config options added """
+        os.makedirs(self.instance_backup_dir(), exist_ok=True)
+        os.makedirs(self.instance_wal_dir(), exist_ok=True)
+        path = os.path.join(self.instance_backup_dir(), 'pg_probackup.conf')
+        if os.path.exists(path):
+            return
+
+        options = [
+            ('pgdata', self.pgdata),
+            ('system-identifier', self.system_identifier),
+            ('xlog-seg-size', self.seg_size)]
+        options += sorted(self.config.items())
+        with open(path, 'w') as f:
+            f.write('# Backup instance information\n')
+            for name, value in options:
+                value = str(value)
+                if ' ' in value:
+                    value = "'{0}'".format(value)
+                f.write('{0} = {1}\n'.format(name, value))
+
+    def generate(self):
+        """
+        Write instance, backups and archive. Returns backup.control
+        values of backups, oldest first, with 'id' added.
+        """
+        self.add_instance()
+
+        backups = []
+        # (tli, first segno, last segno) of archived WAL
+        timelines = []
+        # (parent tli, switchpoint) of the current timeline history
+        history = []
+        tli = 1
+        tli_begin = FIRST_SEGNO
+        parent = None
+        chain_length = 0
+
+        for i in range(self.n_backups):
+            segno = FIRST_SEGNO + i * self.segments_per_backup
+
+            if self.timeline_every and i and i % self.timeline_every == 0:
+                timelines.append((tli, tli_begin, segno - 1))
+                history.append((tli, segno * self.seg_size))
+                tli += 1
+                tli_begin = segno
+                self.write_history(tli, history)
+                parent = None
+
+            if parent is None or chain_length >= self.full_every:
+                mode = 'FULL'
+            else:
+                mode = self.backup_mode
+            failed = self.error_every and (i + 1) % self.error_every == 0
+
+            start_lsn = segno * self.seg_size + LONG_PAGE_HEADER_SIZE
+            start_time = self.start_time + i * self.interval
+            backup = {
+                'id': base36enc(start_time),
+                'backup-mode': mode,
+                'stream': False,
+                'program-version': self.program_version,
+                'server-version': self.server_version,
+                'timelineid': tli,
+                'start-lsn': format_lsn(start_lsn),
+                'stop-lsn': format_lsn(0 if failed else start_lsn + 0x1000),
+                'start-time': start_time,
+                'end-time': start_time + max(1, self.interval // 10),
+                'recovery-xid': 0 if failed else 1000 * (i + 1),
+                'data-bytes': self.pgdata_bytes if mode == 'FULL'
+                else self.pgdata_bytes // 20,
+                'wal-bytes': self.seg_size,
+                'pgdata-bytes': self.pgdata_bytes,
+                'status': 'ERROR' if failed else 'OK',
+                'parent-backup-id': None if mode == 'FULL' else parent}
+            self.write_backup(backup)
+            backups.append(backup)
+
+            if not failed:
+                parent = backup['id']
+                chain_length = 1 if mode == 'FULL' else chain_length + 1
+
+        timelines.append((
+            tli, tli_begin,
+            FIRST_SEGNO + self.n_backups * self.segments_per_backup - 1))
+        for tli, begin, end in timelines:
+            self.write_segments(tli, begin, end)
+        return backups
+
+    def write_backup(self, backup):
+        path = os.path.join(self.instance_backup_dir(), backup['id'])
+        os.makedirs(os.path.join(path, 'database'), exist_ok=True)
+        write_backup_control(os.path.join(path, BACKUP_CONTROL), backup)
+        open(os.path.join(path, BACKUP_CONTENT), 'w').close()
+
+    def write_history(self, tli, history):
+        """ <tli>.history with switchpoints of all ancestor timelines """
+        path = os.path.join(
+            self.instance_wal_dir(), '{0:08X}.history'.format(tli))
+        with open(path, 'w') as f:
+            for parent_tli, switchpoint in history:
+                f.write('{0}\t{1}\tno recovery target specified\n'.format(
+                    parent_tli, format_lsn(switchpoint)))
+
+    def write_segments(self, tli, begin, end):
+        if self.compress_wal:
+            content = gzip.compress(bytes(self.seg_size), 1)
+        for segno in range(begin, end + 1):
+            path = os.path.join(
+                self.instance_wal_dir(),
+                wal_segment_name(tli, segno, self.seg_size))
+            if self.compress_wal:
+                with open(path + '.gz', 'wb') as f:
+                    f.write(content)
+            else:
+                # sparse, size is all that catalog operations look at
+                with open(path, 'wb') as f:
+                    f.truncate(self.seg_size)
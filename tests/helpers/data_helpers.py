@@ -1,19 +1,80 @@
+import ctypes
+import os
 import re
+import select
 import unittest
 import functools
 import time
 
-def _tail_file(file, linetimeout, totaltimeout):
+# sys/inotify.h
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+
+class file_watcher(object):
+    """
+    Wait for changes of a file or directory with inotify.
+    Where inotify is not available wait() just sleeps for poll_interval,
+    so callers must always recheck the condition they are waiting for.
+    """
+
+    def __init__(self, path, mask=IN_MODIFY | IN_CLOSE_WRITE,
+                 poll_interval=0.1):
+        self.poll_interval = poll_interval
+        self.fd = None
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                return
+            if libc.inotify_add_watch(fd, os.fsencode(path), mask) < 0:
+                os.close(fd)
+                return
+            self.fd = fd
+        except (OSError, AttributeError, TypeError):
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def wait(self, timeout):
+        """ Returns after some change or timeout seconds, whichever is first """
+        if timeout <= 0:
+            return
+        if self.fd is None:
+            time.sleep(min(timeout, self.poll_interval))
+            return
+        if select.select([self.fd], [], [], timeout)[0]:
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def _tail_file(file, linetimeout, totaltimeout, offset=0):
     start = time.time()
-    with open(file, 'r') as f:
-        waits = 0
-        while waits < linetimeout:
+    with open(file, 'r') as f, file_watcher(file) as watcher:
+        f.seek(offset)
+        last_line = time.time()
+        while time.time() - last_line < linetimeout:
             line = f.readline()
             if line == '':
-                waits += 1
-                time.sleep(1)
+                watcher.wait(min(1, linetimeout - (time.time() - last_line)))
                 continue
-            waits = 0
+            last_line = time.time()
             yield line
             if time.time() - start > totaltimeout:
                 raise TimeoutError("total timeout tailing %s" % (file,))
@@ -21,10 +82,36 @@ def _tail_file(file, linetimeout, totaltimeout):
             raise TimeoutError("line timeout tailing %s" % (file,))
 
 
+def wait_for_lines(file, patterns, offset=0, timeout=10):
+    """
+    Wait until line containing any of patterns appears in file after offset.
+    Returns matched line (None on timeout) and offset to continue from.
+    """
+    deadline = time.time() + timeout
+    with file_watcher(file) as watcher:
+        with open(file, 'rb') as f:
+            f.seek(offset)
+            while True:
+                line = f.readline()
+                # incomplete line is reread when writer finishes it
+                if line.endswith(b'\n'):
+                    offset = f.tell()
+                    text = line.decode('utf-8', 'replace')
+                    if any(pattern in text for pattern in patterns):
+                        return text, offset
+                    continue
+                f.seek(offset)
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None, offset
+                watcher.wait(remaining)
+
+
 class tail_file(object): # snake case to immitate function
-    def __init__(self, filename, *, linetimeout=10, totaltimeout=60, collect=False):
+    def __init__(self, filename, *, linetimeout=10, totaltimeout=60, collect=False,
+                 offset=0):
         self.filename = filename
-        self.tailer = _tail_file(filename, linetimeout, totaltimeout)
+        self.tailer = _tail_file(filename, linetimeout, totaltimeout, offset)
         self.collect = collect
         self.lines = []
         self._content = None
@@ -76,3 +163,27 @@ class tail_file(object): # snake case to immitate function
 
     def wait_shutdown(self):
         self.wait(contains='database system is shut down')
+
+
+def _make_crc32c_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0x82F63B78
+            else:
+                crc >>= 1
+        table.append(crc)
+    return table
+
+
+_crc32c_table = _make_crc32c_table()
+
+
+def crc32c_update(crc, data):
+    """Feed data into a running CRC-32C (pg_crc32c), pre/post inverted."""
+    crc ^= 0xFFFFFFFF
+    for byte in data:
+        crc = _crc32c_table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
@@ -0,0 +1,108 @@
+import mmap
+import os
+import signal
+import time
+
+# Fault injection points compiled into pg_probackup, see
+# fault_injection_point() in src/util.c. Unlike gdb breakpoints they
+# work with optimized builds and don't need ptrace.
+
+FAULTS_ENV = 'PGPROBACKUP_TESTS_FAULTS'
+
+# points of pg_probackup
+fault_points = frozenset((
+    'backup_file', 'stop_backup', 'merge_file', 'restore_file',
+    'push_file', 'delete_file'))
+
+
+def supports_fault_injection(binary_path):
+    """ True if pg_probackup binary knows PGPROBACKUP_TESTS_FAULTS """
+    try:
+        with open(binary_path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return data.find(FAULTS_ENV.encode()) != -1
+    except (IOError, OSError, ValueError):
+        return False
+
+
+def process_state(pid):
+    """ state letter of /proc/<pid>/stat, None if there is no such process """
+    try:
+        with open('/proc/{0}/stat'.format(pid)) as f:
+            stat = f.read()
+    except (IOError, OSError):
+        return None
+    # command name in parentheses may contain spaces
+    return stat[stat.rindex(')') + 2]
+
+
+class FaultPlan(object):
+    """
+    Actions to take at fault injection points of the next pg_probackup
+    run, see ProbackupTest.inject_faults(). Hit is the number of times
+    the point is reached, counted across all threads:
+
+        self.inject_faults(FaultPlan().pause('backup_file', hit=10))
+        proc = self.backup_node(..., asynchronous=True)
+        FaultPlan.wait_paused(proc)
+        ...
+        FaultPlan.resume(proc)
+    """
+
+    def __init__(self):
+        self.points = []
+
+    def _add(self, name, action, hit):
+        if name not in fault_points:
+            raise ValueError('Unknown fault injection point: {0}'.format(name))
+        if hit < 1:
+            raise ValueError('Hit must be positive: {0}'.format(hit))
+        self.points.append((name, action, hit))
+        return self
+
+    def pause(self, name, hit=1):
+        """ stop the process with SIGSTOP, see wait_paused() and resume() """
+        return self._add(name, 'pause', hit)
+
+    def kill(self, name, hit=1):
+        """ kill the process with SIGKILL """
+        return self._add(name, 'kill', hit)
+
+    def error(self, name, hit=1):
+        """ fail with ERROR """
+        return self._add(name, 'error', hit)
+
+    def __str__(self):
+        return ','.join(
+            '{0}:{1}:{2}'.format(name, action, hit)
+            for name, action, hit in self.points)
+
+    def env(self, env):
+        """ copy of env with the plan """
+        env = dict(env)
+        env[FAULTS_ENV] = str(self)
+        return env
+
+    @staticmethod
+    def wait_paused(proc, timeout=60):
+        """ wait until process started with pause reaches the point """
+        deadline = time.time() + timeout
+        while process_state(proc.pid) != 'T':
+            if proc.poll() is not None:
+                raise AssertionError(
+                    'pg_probackup exited with code {0} before pause'.format(
+                        proc.returncode))
+            if time.time() > deadline:
+                raise AssertionError(
+                    'pg_probackup did not pause in {0} seconds'.format(timeout))
+            time.sleep(0.05)
+
+    @staticmethod
+    def resume(proc):
+        os.kill(proc.pid, signal.SIGCONT)
+
+    @staticmethod
+    def kill_paused(proc):
+        """ kill paused process like gdb 'signal SIGKILL' does """
+        os.kill(proc.pid, signal.SIGKILL)
+        proc.wait()
@@ -0,0 +1,166 @@
+import re
+import struct
+
+# Masking of page contents which may legitimately differ between original
+# and restored data files, like PostgreSQL's wal_consistency_checking does
+# (src/backend/access/common/bufmask.c and *_mask() of access methods):
+# page LSN and checksum, hint bits, unused space, command ids.
+
+BLCKSZ = 8192
+# blocks in segment of relation, pg_config.h
+RELSEG_SIZE = 131072
+SIZE_OF_PAGE_HEADER = 24
+MASK_MARKER = 0
+
+# storage/bufpage.h
+PD_HAS_FREE_LINES = 0x0001
+PD_PAGE_FULL = 0x0002
+PD_ALL_VISIBLE = 0x0004
+
+# storage/itemid.h
+LP_UNUSED = 0
+LP_NORMAL = 1
+
+# access/htup_details.h
+HEAP_XMIN_COMMITTED = 0x0100
+HEAP_XMIN_INVALID = 0x0200
+HEAP_XMIN_FROZEN = HEAP_XMIN_COMMITTED | HEAP_XMIN_INVALID
+HEAP_XMAX_COMMITTED = 0x0400
+HEAP_XMAX_INVALID = 0x0800
+HEAP_XACT_MASK = 0xFFF0
+SPEC_TOKEN_OFFSET_NUMBER = 0xfffe
+
+# access/nbtree.h
+BTP_LEAF = 1 << 0
+BTP_SPLIT_END = 1 << 5
+BTP_HAS_GARBAGE = 1 << 6
+MAX_BT_CYCLE_ID = 0xFF7F
+
+# access/gist.h
+GIST_PAGE_ID = 0xFF81
+F_LEAF = 1 << 0
+F_FOLLOW_RIGHT = 1 << 3
+F_HAS_GARBAGE = 1 << 4
+
+# access/hash.h
+HASHO_PAGE_ID = 0xFF80
+LH_OVERFLOW_PAGE = 1 << 0
+LH_BUCKET_PAGE = 1 << 1
+LH_PAGE_HAS_DEAD_TUPLES = 1 << 7
+
+# pd_lsn, pd_checksum, pd_flags, pd_lower, pd_upper, pd_special,
+# pd_pagesize_version, pd_prune_xid
+page_header = struct.Struct('=QHHHHHHI')
+item_id = struct.Struct('=I')
+uint16 = struct.Struct('=H')
+uint32 = struct.Struct('=I')
+
+
+def segment_first_block(path):
+    """ absolute number of the first block of relation segment file """
+    match = re.search(r'\.(\d+)$', path)
+    return int(match.group(1)) * RELSEG_SIZE if match else 0
+
+
+def item_ids(page, lower):
+    """ (offset number, position of item id, lp_off, lp_flags, lp_len) """
+    for position in range(SIZE_OF_PAGE_HEADER, lower - 3, item_id.size):
+        lp, = item_id.unpack_from(page, position)
+        yield ((position - SIZE_OF_PAGE_HEADER) // item_id.size + 1,
+               position, lp & 0x7fff, (lp >> 15) & 0x3, lp >> 17)
+
+
+def mask_lp_flags(page, lower):
+    """ LP_DEAD of index tuples is a hint, see mask_lp_flags() """
+    for _, position, lp_off, lp_flags, lp_len in item_ids(page, lower):
+        if lp_flags != LP_UNUSED:
+            item_id.pack_into(page, position, lp_off | (lp_len << 17))
+
+
+def mask_heap_tuples(page, lower, special, blkno):
+    """ see heap_mask() """
+    for offnum, _, lp_off, lp_flags, lp_len in item_ids(page, lower):
+        # t_infomask is at offset 20 of tuple header
+        if lp_flags != LP_NORMAL or lp_off + 23 > special:
+            continue
+
+        infomask, = uint16.unpack_from(page, lp_off + 20)
+        if infomask & HEAP_XMIN_FROZEN != HEAP_XMIN_FROZEN:
+            infomask &= ~HEAP_XACT_MASK
+        else:
+            infomask &= ~(HEAP_XMAX_INVALID | HEAP_XMAX_COMMITTED)
+        uint16.pack_into(page, lp_off + 20, infomask)
+
+        # t_cid
+        uint32.pack_into(page, lp_off + 8, MASK_MARKER)
+
+        # speculative insertion token is stored in t_ctid
+        if uint16.unpack_from(page, lp_off + 16)[0] == SPEC_TOKEN_OFFSET_NUMBER:
+            struct.pack_into(
+                '=HHH', page, lp_off + 12, blkno >> 16, blkno & 0xffff, offnum)
+
+        # padding up to MAXALIGN
+        end = lp_off + lp_len
+        padded = min((end + 7) & ~7, special)
+        if end < padded:
+            page[end:padded] = bytes(padded - end)
+
+
+def mask_page(page, blkno=0):
+    """
+    Mask BLCKSZ bytes of writable page buffer in place, blkno is
+    absolute number of block in relation, see segment_first_block().
+    Pages which don't look like standard PostgreSQL pages are only
+    stripped of LSN and checksum.
+    """
+    (lsn, checksum, flags, lower, upper, special,
+     pagesize_version, prune_xid) = page_header.unpack_from(page)
+
+    # new page
+    if lower == 0 and upper == 0:
+        return
+
+    flags &= ~(PD_HAS_FREE_LINES | PD_PAGE_FULL | PD_ALL_VISIBLE)
+    page_header.pack_into(
+        page, 0, MASK_MARKER, MASK_MARKER, flags, lower, upper, special,
+        pagesize_version, MASK_MARKER)
+
+    if not (SIZE_OF_PAGE_HEADER <= lower <= upper <= special <= BLCKSZ):
+        return
+
+    # heap, there is no special space
+    if special == BLCKSZ:
+        page[lower:upper] = bytes(upper - lower)
+        mask_heap_tuples(page, lower, special, blkno)
+        return
+
+    # metapages of some access methods don't set pd_lower
+    if lower > SIZE_OF_PAGE_HEADER:
+        page[lower:upper] = bytes(upper - lower)
+
+    if BLCKSZ - special != 16:
+        return
+
+    page_id, = uint16.unpack_from(page, BLCKSZ - 2)
+    opaque_flags, = uint16.unpack_from(page, BLCKSZ - 4)
+    if page_id <= MAX_BT_CYCLE_ID:
+        # nbtree, page_id is btpo_cycleid
+        if opaque_flags & BTP_LEAF:
+            mask_lp_flags(page, lower)
+        uint16.pack_into(
+            page, BLCKSZ - 4,
+            opaque_flags & ~(BTP_SPLIT_END | BTP_HAS_GARBAGE))
+        uint16.pack_into(page, BLCKSZ - 2, MASK_MARKER)
+    elif page_id == GIST_PAGE_ID:
+        # NSN
+        page[special:special + 8] = bytes(8)
+        if opaque_flags & F_LEAF:
+            mask_lp_flags(page, lower)
+        uint16.pack_into(
+            page, BLCKSZ - 4,
+            opaque_flags & ~(F_FOLLOW_RIGHT | F_HAS_GARBAGE))
+    elif page_id == HASHO_PAGE_ID:
+        if opaque_flags & (LH_OVERFLOW_PAGE | LH_BUCKET_PAGE):
+            mask_lp_flags(page, lower)
+        uint16.pack_into(
+            page, BLCKSZ - 4, opaque_flags & ~LH_PAGE_HAS_DEAD_TUPLES)
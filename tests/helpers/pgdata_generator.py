@@ -0,0 +1,293 @@
+import os
+import random
+import struct
+
+from .page_mask import BLCKSZ, SIZE_OF_PAGE_HEADER, page_header
+
+# Synthetic relations for file count scaling tests: database directories
+# of relation files with valid page headers and data checksums, which
+# pg_probackup backs up, validates and restores like real ones. The server
+# ignores files missing from pg_class, so they may be added to data
+# directory of a node before it is started or while it runs.
+
+# storage/checksum_impl.h
+N_SUMS = 32
+FNV_PRIME = 16777619
+checksum_base_offsets = (
+    0x5B1F36E9, 0xB8525960, 0x02AB50AA, 0x1DE66D2A,
+    0x79FF467A, 0x9BB9F8A3, 0x217E7CD2, 0x83E13D2C,
+    0xF8D4474F, 0xE39EB970, 0x42C6AE16, 0x993216FA,
+    0x7B093B5D, 0x98DAFF3C, 0xF718902A, 0x0B1C9CDB,
+    0xE58F764B, 0x187636BC, 0x5D7B3BB1, 0xE73DE7DE,
+    0x92BEC979, 0xCCA6C0B2, 0x304A0979, 0x85AA43D4,
+    0x783125BB, 0x6CA8EAA2, 0xE407EAC6, 0x4B5CFC3E,
+    0x9FBF8C76, 0x15CA20BE, 0xF2CA9FFF, 0x3CE3B1F7)
+
+# blocks in segment of relation, pg_config.h
+RELSEG_SIZE = 131072
+# PD_CHECKSUM offset and pd_pagesize_version of bufpage.h
+CHECKSUM_OFFSET = 8
+PAGESIZE_VERSION = BLCKSZ | 4
+
+page_words = struct.Struct('={0}I'.format(BLCKSZ // 4))
+uint16 = struct.Struct('=H')
+
+# file name suffix of fork
+fork_suffixes = {'main': '', 'fsm': '_fsm', 'vm': '_vm', 'init': '_init'}
+
+# oids of synthetic databases and relations, far from real ones
+FIRST_DATABASE_OID = 1000000
+FIRST_RELATION_OID = 1000000
+
+
+def parse_lsn(lsn):
+    """ LSN as number, 'X/X' text of pg_current_wal_lsn() is accepted """
+    if isinstance(lsn, str):
+        high, low = lsn.split('/')
+        return (int(high, 16) << 32) | int(low, 16)
+    return lsn
+
+
+def checksum_block(page):
+    """ pg_checksum_block() of page with zeroed pd_checksum """
+    sums = list(checksum_base_offsets)
+    words = page_words.unpack(bytes(page))
+    for i in range(0, len(words), N_SUMS):
+        for j in range(N_SUMS):
+            tmp = sums[j] ^ words[i + j]
+            sums[j] = ((tmp * FNV_PRIME) & 0xFFFFFFFF) ^ (tmp >> 17)
+    # two rounds of zeroes for additional mixing
+    for _ in range(2):
+        for j in range(N_SUMS):
+            tmp = sums[j]
+            sums[j] = ((tmp * FNV_PRIME) & 0xFFFFFFFF) ^ (tmp >> 17)
+    result = 0
+    for value in sums:
+        result ^= value
+    return result
+
+
+def page_checksum(block_sum, blkno):
+    """ pg_checksum_page() by checksum_block() result and absolute blkno """
+    return ((block_sum ^ blkno) % 65535) + 1
+
+
+def page_checksum_of(page, blkno):
+    page = bytearray(page)
+    uint16.pack_into(page, CHECKSUM_OFFSET, 0)
+    return page_checksum(checksum_block(page), blkno)
+
+
+def make_page(rng, lsn, fill, tuple_size=128):
+    """
+    Heap-like page: line pointers and tuples, fill is a fraction of
+    tuple bytes which are random, the rest are zeroes.
+    pd_checksum is zero.
+    """
+    page = bytearray(BLCKSZ)
+    n_tuples = (BLCKSZ - SIZE_OF_PAGE_HEADER) // (tuple_size + 4)
+    upper = BLCKSZ - n_tuples * tuple_size
+    lower = SIZE_OF_PAGE_HEADER + n_tuples * 4
+    page_header.pack_into(
+        page, 0, lsn, 0, 0, lower, upper, BLCKSZ, PAGESIZE_VERSION, 0)
+
+    random_size = int(tuple_size * fill)
+    for i in range(n_tuples):
+        offset = upper + i * tuple_size
+        # lp_off, LP_NORMAL, lp_len
+        struct.pack_into(
+            '=I', page, SIZE_OF_PAGE_HEADER + i * 4,
+            offset | (1 << 15) | (tuple_size << 17))
+        if random_size:
+            page[offset:offset + random_size] = rng.getrandbits(
+                random_size * 8).to_bytes(random_size, 'little')
+    return page
+
+
+def make_empty_page(lsn):
+    """ page initialized by PageInit() without special space, like fsm and vm """
+    page = bytearray(BLCKSZ)
+    page_header.pack_into(
+        page, 0, lsn, 0, 0, SIZE_OF_PAGE_HEADER, BLCKSZ, BLCKSZ,
+        PAGESIZE_VERSION, 0)
+    return page
+
+
+class PageSource(object):
+    """
+    Pages of one LSN: a few distinct variants, each with precomputed
+    checksum_block(), so pages of any block number are cheap.
+    """
+
+    def __init__(self, lsn, variants=16, fill=0.5, seed=0):
+        rng = random.Random(seed ^ lsn)
+        self.pages = []
+        for _ in range(variants):
+            page = make_page(rng, lsn, fill)
+            self.pages.append((page, checksum_block(page)))
+        self.empty_page = make_empty_page(lsn)
+        self.empty_sum = checksum_block(self.empty_page)
+
+    def page(self, blkno, variant, checksums=True, empty=False):
+        if empty:
+            page, block_sum = self.empty_page, self.empty_sum
+        else:
+            page, block_sum = self.pages[variant % len(self.pages)]
+        if not checksums:
+            return bytes(page)
+        return b''.join((
+            page[:CHECKSUM_OFFSET],
+            uint16.pack(page_checksum(block_sum, blkno)),
+            page[CHECKSUM_OFFSET + 2:]))
+
+
+class SyntheticPgdata(object):
+    """
+    n_databases directories in base of data_dir, each of n_relations
+    relations with forks, main fork has blocks pages, fsm and vm have
+    one page. Relations larger than RELSEG_SIZE are split to segments.
+
+        generator = SyntheticPgdata(node.data_dir, n_databases=10, n_relations=10000)
+        generator.generate(node.execute('SELECT pg_current_wal_lsn()')[0][0])
+        self.backup_node(backup_dir, 'node', node, options=['--stream'])
+        generator.change(0.01, lsn=...)
+        self.backup_node(backup_dir, 'node', node, backup_type='delta', options=['--stream'])
+
+    Changed pages get newer LSN, so DELTA and PTRACK-less incremental
+    restore see them, PAGE backup doesn't as there is no WAL for them.
+    """
+
+    def __init__(self, data_dir, n_databases=1, n_relations=1000, blocks=1,
+                 forks=('main', 'fsm', 'vm'), checksums=True,
+                 variants=16, fill=0.5, seed=0,
+                 first_database_oid=FIRST_DATABASE_OID,
+                 first_relation_oid=FIRST_RELATION_OID):
+        for fork in forks:
+            if fork not in fork_suffixes:
+                raise ValueError('Unknown fork: {0}'.format(fork))
+        self.data_dir = data_dir
+        self.n_databases = n_databases
+        self.n_relations = n_relations
+        self.blocks = blocks
+        self.forks = forks
+        self.checksums = checksums
+        self.variants = variants
+        self.fill = fill
+        self.seed = seed
+        self.first_database_oid = first_database_oid
+        self.first_relation_oid = first_relation_oid
+        self.sources = {}
+
+    def source(self, lsn):
+        if lsn not in self.sources:
+            self.sources[lsn] = PageSource(
+                lsn, self.variants, self.fill, self.seed)
+        return self.sources[lsn]
+
+    def database_oids(self):
+        return range(
+            self.first_database_oid, self.first_database_oid + self.n_databases)
+
+    def relation_oids(self):
+        return range(
+            self.first_relation_oid, self.first_relation_oid + self.n_relations)
+
+    def database_path(self, db_oid):
+        return os.path.join(self.data_dir, 'base', str(db_oid))
+
+    def segment_path(self, db_oid, rel_oid, fork='main', segno=0):
+        path = os.path.join(
+            self.database_path(db_oid), str(rel_oid) + fork_suffixes[fork])
+        if segno:
+            path += '.{0}'.format(segno)
+        return path
+
+    def n_files(self):
+        per_relation = len([fork for fork in self.forks if fork != 'main'])
+        if 'main' in self.forks:
+            per_relation += max(1, (self.blocks + RELSEG_SIZE - 1) // RELSEG_SIZE)
+        return self.n_databases * self.n_relations * per_relation
+
+    def n_pages(self):
+        per_relation = len([fork for fork in self.forks if fork != 'main'])
+        if 'main' in self.forks:
+            per_relation += self.blocks
+        return self.n_databases * self.n_relations * per_relation
+
+    def generate(self, lsn):
+        """ write all files, pages get lsn. Returns number of files """
+        source = self.source(parse_lsn(lsn))
+        n_files = 0
+        version_path = os.path.join(self.data_dir, 'PG_VERSION')
+        version = None
+        if os.path.exists(version_path):
+            with open(version_path, 'rb') as f:
+                version = f.read()
+
+        for db_oid in self.database_oids():
+            os.makedirs(self.database_path(db_oid), exist_ok=True)
+            if version is not None:
+                with open(os.path.join(
+                        self.database_path(db_oid), 'PG_VERSION'), 'wb') as f:
+                    f.write(version)
+
+            for rel_oid in self.relation_oids():
+                for fork in self.forks:
+                    if fork == 'main':
+                        n_files += self.write_main_fork(source, db_oid, rel_oid)
+                    else:
+                        # the only page of fsm and vm
+                        with open(self.segment_path(db_oid, rel_oid, fork), 'wb') as f:
+                            f.write(source.page(0, 0, self.checksums, empty=True))
+                        n_files += 1
+        return n_files
+
+    def write_main_fork(self, source, db_oid, rel_oid):
+        n_segments = 0
+        for first in range(0, max(self.blocks, 1), RELSEG_SIZE):
+            last = min(first + RELSEG_SIZE, self.blocks)
+            with open(self.segment_path(
+                    db_oid, rel_oid, segno=first // RELSEG_SIZE), 'wb') as f:
+                for blkno in range(first, last):
+                    f.write(source.page(
+                        blkno, rel_oid + blkno, self.checksums))
+            n_segments += 1
+        return n_segments
+
+    def change(self, fraction, lsn, seed=None):
+        """
+        Rewrite fraction of main fork pages, chosen at random, with pages
+        of lsn. Returns list of (path, blkno) of changed pages.
+        """
+        source = self.source(parse_lsn(lsn))
+        rng = random.Random(self.seed if seed is None else seed)
+        per_database = self.n_relations * self.blocks
+        total = self.n_databases * per_database
+        if total == 0:
+            return []
+        chosen = sorted(rng.sample(range(total), int(total * fraction)))
+
+        changed = []
+        f = None
+        current_path = None
+        try:
+            for index in chosen:
+                db_oid = self.first_database_oid + index // per_database
+                rel_index, blkno = divmod(index % per_database, self.blocks)
+                rel_oid = self.first_relation_oid + rel_index
+                path = self.segment_path(
+                    db_oid, rel_oid, segno=blkno // RELSEG_SIZE)
+                if path != current_path:
+                    if f is not None:
+                        f.close()
+                    f = open(path, 'r+b')
+                    current_path = path
+                f.seek((blkno % RELSEG_SIZE) * BLCKSZ)
+                # another variant, so content changes along with LSN
+                f.write(source.page(
+                    blkno, rel_oid + blkno + 1, self.checksums))
+                changed.append((path, blkno))
+        finally:
+            if f is not None:
+                f.close()
+        return changed
@@ -8,6 +8,8 @@ import subprocess
 import shutil
 import six
 import testgres
+from testgres.decorators import method_decorator, positional_args_hack
+from testgres.defaults import default_dbname, default_username
 import hashlib
 import re
 import getpass
@@ -15,7 +17,27 @@ import select
 from time import sleep
 import re
 import json
+import mmap
 import random
+import socket
+import struct
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from .timings import TimingDatabase
+from .trash import Trash
+from .resource_usage import ResourceUsage, run_measured
+from .page_mask import mask_page, segment_first_block
+from .ptrack_map import PtrackMap, legacy_ptrack_bits
+from .catalog import Catalog, base36enc
+from .catalog_generator import SyntheticCatalog
+from .query_pool import QueryPool, NotPooled
+from .auto_conf import ConfigTransaction, read_conf, write_conf
+from .faults import FaultPlan, supports_fault_injection
+from .data_helpers import wait_for_lines, file_watcher, IN_CREATE, IN_MOVED_TO, \
+    crc32c_update
 
 idx_ptrack = {
     't_heap': {
@@ -120,24 +142,262 @@ def is_nls_enabled():
     return b'enable-nls' in result.stdout
 
 
-def base36enc(number):
-    """Converts an integer to a base36 string."""
-    alphabet = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
-    base36 = ''
-    sign = ''
+def generate_system_id():
+    """ Same recipe as GuessControlValues() in pg_resetwal.c """
+    now = time.time()
+    secs = int(now)
+    usecs = int((now - secs) * 1000000)
+    return (secs << 32) | (usecs << 12) | (os.getpid() & 0xFFF)
+
+
+def get_system_identifier(pgdata):
+    """ system_identifier from pg_control, it is the first field there """
+    with open(os.path.join(pgdata, 'global', 'pg_control'), 'rb') as f:
+        return struct.unpack('=Q', f.read(8))[0]
+
+
+def set_system_identifier(pgdata, system_id):
+    """
+    Stamp new system identifier into pg_control and WAL segments
+    of a cleanly shut down cluster.
+    Returns False if the layout was not recognized, nothing is changed then.
+    """
+    pg_control = os.path.join(pgdata, 'global', 'pg_control')
+    with open(pg_control, 'rb') as f:
+        control = bytearray(f.read())
+
+    # system_identifier is the first field of ControlFileData and crc
+    # is the last one, so look for the offset where the stored crc matches
+    # the crc of everything before it.
+    crc_offset = None
+    crc = 0
+    pos = 0
+    for offset in range(8, 1024, 4):
+        crc = crc32c_update(crc, control[pos:offset])
+        pos = offset
+        if struct.unpack_from('=I', control, offset)[0] == crc:
+            crc_offset = offset
+            break
+    if crc_offset is None:
+        return False
+
+    old_system_id = struct.unpack_from('=Q', control, 0)[0]
+
+    # first page of every WAL segment carries system id in its long header
+    wal_dir = os.path.join(pgdata, 'pg_wal')
+    if not os.path.isdir(wal_dir):
+        wal_dir = os.path.join(pgdata, 'pg_xlog')
+    segments = []
+    for name in os.listdir(wal_dir):
+        if len(name) != 24:
+            continue
+        with open(os.path.join(wal_dir, name), 'rb') as f:
+            header = f.read(32)
+        if len(header) < 32:
+            continue
+        # xlp_info & XLP_LONG_HEADER, xlp_sysid at SizeOfXLogShortPHD
+        if not struct.unpack_from('=H', header, 2)[0] & 0x0002:
+            continue
+        if struct.unpack_from('=Q', header, 24)[0] != old_system_id:
+            return False
+        segments.append(os.path.join(wal_dir, name))
+
+    struct.pack_into('=Q', control, 0, system_id)
+    struct.pack_into('=I', control, crc_offset,
+                     crc32c_update(0, control[:crc_offset]))
+    with open(pg_control, 'r+b') as f:
+        f.write(control)
+
+    for segment in segments:
+        with open(segment, 'r+b') as f:
+            f.seek(24)
+            f.write(struct.pack('=Q', system_id))
+
+    return True
+
+
+# ioctl(FICLONE) from linux/fs.h
+FICLONE = 0x40049409
+
+CLONE_REFLINK = 0
+CLONE_COPY_FILE_RANGE = 1
+CLONE_COPY = 2
+
+# (src st_dev, dst st_dev) -> cheapest method known to work
+_clone_methods = {}
+
+
+def clone_file(src, dst):
+    """
+    Copy file the cheapest way the filesystem allows: reflink (FICLONE),
+    then in-kernel copy_file_range(), then regular copy.
+    Metadata is copied the same way shutil.copy2() does.
+    Suitable as copy_function for shutil.copytree().
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        devs = (os.fstat(fsrc.fileno()).st_dev, os.fstat(fdst.fileno()).st_dev)
+        method = _clone_methods.get(devs, CLONE_REFLINK)
+
+        if method == CLONE_REFLINK:
+            try:
+                import fcntl
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            except (ImportError, OSError):
+                method = CLONE_COPY_FILE_RANGE
+
+        if method == CLONE_COPY_FILE_RANGE:
+            try:
+                while os.copy_file_range(
+                        fsrc.fileno(), fdst.fileno(), 1024*1024*1024):
+                    pass
+            except (AttributeError, OSError):
+                # start over with plain copy
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+                method = CLONE_COPY
+
+        if method == CLONE_COPY:
+            shutil.copyfileobj(fsrc, fdst, 1024*1024)
+
+        _clone_methods[devs] = method
+
+    shutil.copystat(src, dst)
+    return dst
+
+
+def clone_tree(src, dst):
+    """
+    Recursively clone directory src into dst with clone_file().
+    dst may already exist, existing files are overwritten.
+    """
+    return shutil.copytree(
+        src, dst, symlinks=True, copy_function=clone_file, dirs_exist_ok=True)
+
+
+class InitdbTemplateCache(object):
+    """
+    Pristine initdb results shared by every make_simple_node() call.
+    Templates are keyed by initdb binary and initdb parameters
+    (--data-checksums, --wal-segsize and so on) and kept in tmp_dirs,
+    so concurrent test processes reuse them too.
+    Disable with PG_PROBACKUP_INITDB_CACHE=OFF.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.templates = {}
+
+    def _key(self, initdb_params):
+        initdb = os.path.realpath(testgres.get_bin_path('initdb'))
+        key = '\0'.join(
+            [initdb, str(os.stat(initdb).st_mtime_ns)] + list(initdb_params))
+        return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def get_template(self, initdb_params):
+        key = self._key(initdb_params)
+        if key in self.templates:
+            return self.templates[key]
+
+        template = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(template):
+            tmp_template = '{0}.tmp.{1}'.format(template, os.getpid())
+            shutil.rmtree(tmp_template, ignore_errors=True)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            subprocess.run(
+                [testgres.get_bin_path('initdb'), '-D', tmp_template, '-N']
+                + list(initdb_params),
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True)
+            try:
+                os.rename(tmp_template, template)
+            except OSError:
+                # somebody else was faster
+                shutil.rmtree(tmp_template, ignore_errors=True)
+
+        self.templates[key] = template
+        return template
+
+    def _snapshot_path(self, name, initdb_params):
+        return os.path.join(
+            self.cache_dir, '{0}.{1}'.format(self._key(initdb_params), name))
+
+    def get_snapshot(self, name, initdb_params):
+        """ Path to stored snapshot of data directory or None """
+        path = self._snapshot_path(name, initdb_params)
+        if os.path.isdir(path):
+            return path
+        return None
+
+    def store_snapshot(self, name, initdb_params, pgdata, exclude=()):
+        """
+        Save stopped data directory, files and directories
+        with names from exclude are skipped.
+        """
+        path = self._snapshot_path(name, initdb_params)
+        tmp_path = '{0}.tmp.{1}'.format(path, os.getpid())
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        shutil.copytree(
+            pgdata, tmp_path, symlinks=True, copy_function=clone_file,
+            ignore=lambda dir, names: [n for n in names if n in exclude])
+
+        # check that system identifier can be changed in clones
+        if not set_system_identifier(tmp_path, generate_system_id()):
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return None
+
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return path
+
+    def clone(self, data_dir, initdb_params):
+        """
+        Copy template into data_dir and give it unique system identifier.
+        Returns False if data_dir should be created by plain initdb.
+        """
+        clone_tree(self.get_template(initdb_params), data_dir)
+        if not set_system_identifier(data_dir, generate_system_id()):
+            shutil.rmtree(data_dir, ignore_errors=True)
+            return False
+        return True
+
+
+# every pytest-xdist worker allocates node ports from its own range
+WORKER_PORT_BASE = 20000
+WORKER_PORT_RANGE = 200
 
-    if number < 0:
-        sign = '-'
-        number = -number
+_worker_ports = set()
 
-    if 0 <= number < len(alphabet):
-        return sign + alphabet[number]
 
-    while number != 0:
-        number, i = divmod(number, len(alphabet))
-        base36 = alphabet[i] + base36
+def get_worker_index():
+    """ Index of pytest-xdist worker, None if tests are run serially """
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    if not worker:
+        return None
+    return int(re.sub(r"[^\d]", "", worker))
+
+
+def reserve_worker_port(worker_index):
+    first_port = WORKER_PORT_BASE + worker_index * WORKER_PORT_RANGE
+    for port in range(first_port, first_port + WORKER_PORT_RANGE):
+        if port in _worker_ports:
+            continue
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            try:
+                sock.bind(('127.0.0.1', port))
+            except OSError:
+                continue
+        _worker_ports.add(port)
+        return port
 
-    return sign + base36
+    raise ProbackupException(
+        'No free ports left in range {0}-{1}'.format(
+            first_port, first_port + WORKER_PORT_RANGE - 1), None)
+
+
+def release_worker_port(port):
+    _worker_ports.discard(port)
 
 
 class ProbackupException(Exception):
@@ -150,9 +410,35 @@ class ProbackupException(Exception):
 
 class PostgresNodeExtended(testgres.PostgresNode):
 
+    # node's own files, they are not shared through data directory snapshots
+    snapshot_exclude = (
+        'postgresql.conf', 'postgresql.auto.conf', 'pg_hba.conf',
+        'pg_ident.conf', 'postmaster.pid', 'postmaster.opts',
+        'log', 'pg_log')
+
     def __init__(self, base_dir=None, *args, **kwargs):
         super(PostgresNodeExtended, self).__init__(name='test', base_dir=base_dir, *args, **kwargs)
         self.is_started = False
+        self.initdb_params = []
+        self.template_cache = None
+        # see safe_psql(), None disables pooling
+        self.query_pool = QueryPool(self)
+
+    def init(self, initdb_params=None, template_cache=None, **kwargs):
+        """
+        Same as testgres init(), but clone data directory
+        from template_cache if it is given
+        """
+        self.initdb_params = initdb_params or []
+        self.template_cache = template_cache
+
+        if template_cache is None or \
+                not template_cache.clone(self.data_dir, initdb_params or []):
+            return super(PostgresNodeExtended, self).init(
+                initdb_params=initdb_params, **kwargs)
+
+        self.default_conf(**kwargs)
+        return self
 
     def slow_start(self, replica=False):
 
@@ -164,8 +450,18 @@ class PostgresNodeExtended(testgres.PostgresNode):
         #       suppress={testgres.NodeConnection})
         if replica:
             query = 'SELECT pg_is_in_recovery()'
+            events = [
+                'database system is ready to accept read-only connections',
+                'consistent recovery state reached']
         else:
             query = 'SELECT not pg_is_in_recovery()'
+            events = ['database system is ready to accept connections']
+        # no point to wait any longer
+        events += ['database system is shut down', 'aborting startup']
+
+        log_offset = 0
+        if os.path.exists(self.pg_log_file):
+            log_offset = os.path.getsize(self.pg_log_file)
 
         self.start()
         while True:
@@ -185,7 +481,10 @@ class PostgresNodeExtended(testgres.PostgresNode):
                 else:
                     raise e
 
-            sleep(0.5)
+            # server log tells when it's time to ask again,
+            # timeout is a safety net for unexpected log messages
+            _, log_offset = wait_for_lines(
+                self.pg_log_file, events, log_offset, timeout=2)
 
     def start(self, *args, **kwargs):
         if not self.is_started:
@@ -193,7 +492,42 @@ class PostgresNodeExtended(testgres.PostgresNode):
             self.is_started = True
         return self
 
+    @method_decorator(positional_args_hack(['dbname', 'query']))
+    def safe_psql(self, query=None, use_psql=False, **kwargs):
+        """
+        Same as testgres safe_psql(), but single statements are run on
+        pooled connection instead of forking psql. Statements which need
+        psql (several statements, COPY, meta-commands, psql variables)
+        or use_psql=True are run by psql.
+        """
+        if self.query_pool and not use_psql and \
+                set(kwargs) <= set(('dbname', 'username')):
+            try:
+                return self.query_pool.psql(
+                    query, kwargs.get('dbname') or default_dbname(),
+                    kwargs.get('username') or default_username())
+            except NotPooled:
+                pass
+        return super(PostgresNodeExtended, self).safe_psql(query=query, **kwargs)
+
+    @method_decorator(positional_args_hack(['dbname', 'query']))
+    def execute(self, query, dbname=None, username=None, password=None,
+                commit=True, use_psql=False):
+        """ Same as testgres execute(), but on pooled connection """
+        if self.query_pool and not use_psql and password is None:
+            try:
+                return self.query_pool.execute(
+                    query, dbname or default_dbname(),
+                    username or default_username(), commit)
+            except NotPooled:
+                pass
+        return super(PostgresNodeExtended, self).execute(
+            query, dbname=dbname, username=username, password=password,
+            commit=commit)
+
     def stop(self, *args, **kwargs):
+        if self.query_pool:
+            self.query_pool.close()
         if self.is_started:
             result = super(PostgresNodeExtended, self).stop(*args, **kwargs)
             self.is_started = False
@@ -208,6 +542,82 @@ class PostgresNodeExtended(testgres.PostgresNode):
                 os.kill(self.auxiliary_pids[someone][0], sig)
             self.is_started = False
 
+    def pgbench_init_cached(self, scale=1, initdb_params=None, **kwargs):
+        """
+        pgbench_init() on a fresh node, but pgbench data is generated
+        only once per session: data directory is snapshotted after the
+        first run and later calls get a copy of the snapshot with
+        system identifier of the node, so instance added to backup
+        catalog before the call stays valid. Node configuration files
+        are kept.
+        Snapshots are shared by nodes with the same settings that
+        affect data directory content: wal_level, archive_mode, ptrack.
+        Node must be running and contain no data of its own.
+        """
+        if initdb_params is None:
+            initdb_params = self.initdb_params
+
+        # tablespaces live outside of data directory
+        if self.template_cache is None or \
+                os.listdir(os.path.join(self.data_dir, 'pg_tblspc')):
+            return self.pgbench_init(scale=scale, **kwargs)
+
+        settings = self.safe_psql(
+            'postgres',
+            "SELECT string_agg(name || '=' || setting, ',' ORDER BY name) "
+            "FROM pg_catalog.pg_settings WHERE name IN ("
+            "'wal_level', 'archive_mode', 'wal_log_hints', "
+            "'shared_preload_libraries', 'ptrack.map_size')"
+            ).decode('utf-8').rstrip()
+
+        # segments archived so far would be overwritten by
+        # segments of the snapshot with the same names
+        status_dir = os.path.join(self.data_dir, 'pg_wal', 'archive_status')
+        if not os.path.isdir(status_dir):
+            status_dir = os.path.join(self.data_dir, 'pg_xlog', 'archive_status')
+        if os.listdir(status_dir):
+            return self.pgbench_init(scale=scale, **kwargs)
+
+        name = 'pgbench-' + hashlib.md5(
+            repr([scale, settings] + sorted(kwargs.items())).encode('utf-8')
+            ).hexdigest()
+
+        snapshot = self.template_cache.get_snapshot(name, initdb_params)
+        if snapshot is None:
+            self.pgbench_init(scale=scale, **kwargs)
+            self.safe_psql('postgres', 'CHECKPOINT')
+            self.stop()
+            self.template_cache.store_snapshot(
+                name, initdb_params, self.data_dir,
+                exclude=self.snapshot_exclude)
+            self.slow_start()
+            return self
+
+        self.stop()
+        system_id = get_system_identifier(self.data_dir)
+        for entry in os.listdir(self.data_dir):
+            if entry in self.snapshot_exclude:
+                continue
+            path = os.path.join(self.data_dir, entry)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        clone_tree(snapshot, self.data_dir)
+        if not set_system_identifier(self.data_dir, system_id):
+            raise AssertionError(
+                'Failed to set system identifier in {0}'.format(self.data_dir))
+
+        # segments of the snapshot were archived by the node that made it,
+        # this node archives them once more, like after plain pgbench_init()
+        for status in os.listdir(status_dir):
+            if status.endswith('.done'):
+                os.rename(
+                    os.path.join(status_dir, status),
+                    os.path.join(status_dir, status[:-len('.done')] + '.ready'))
+        self.slow_start()
+        return self
+
     def table_checksum(self, table, dbname="postgres"):
         con = self.connect(dbname=dbname)
 
@@ -232,20 +642,81 @@ class PostgresNodeExtended(testgres.PostgresNode):
         con.close()
         return sum.hexdigest()
 
+    def server_table_checksum(self, table, dbname="postgres"):
+        """
+        Checksum of table computed by server: number of rows and sum of
+        64-bit hashes of rows text. Rows are not sent to client and their
+        order doesn't matter. Differs from table_checksum() of the same table.
+        """
+        con = self.connect(dbname=dbname)
+        try:
+            # hashtextextended() appeared in PostgreSQL 11
+            if con.execute("SELECT to_regproc('hashtextextended') IS NOT NULL")[0][0]:
+                row_hash = "hashtextextended(t::text, 0)"
+            else:
+                row_hash = "hashtext(t::text)::bigint"
+            # sum() of bigint is numeric, it doesn't overflow
+            count, total = con.execute(
+                "SELECT count(*), coalesce(sum(%s), 0) FROM %s as t" % (
+                    row_hash, table))[0]
+        finally:
+            con.close()
+        return "{0}:{1}".format(count, total)
+
+    def server_table_checksums(self, tables, dbname="postgres", max_workers=8):
+        """
+        server_table_checksum() of several tables, each table is scanned
+        on its own connection concurrently. Table is name of table in
+        dbname or (dbname, name) pair, result is dict by tables items.
+        """
+        def checksum(table):
+            if isinstance(table, tuple):
+                return self.server_table_checksum(table[1], dbname=table[0])
+            return self.server_table_checksum(table, dbname=dbname)
+
+        tables = list(tables)
+        if not tables:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(tables))) as pool:
+            return dict(zip(tables, pool.map(checksum, tables)))
+
 class ProbackupTest(object):
     # Class attributes
     enterprise = is_enterprise()
     enable_nls = is_nls_enabled()
     pgpro = is_pgpro()
+    # shared by all test cases of the session, see make_simple_node()
+    initdb_templates = None
+    # durations of passed tests, see load_tests()
+    timings = None
+    # background removal of directories of passed tests, see tearDown()
+    trash = None
+    # resources spent by pg_probackup, reported at exit, see run_pb()
+    resource_usage = ResourceUsage(report_at_exit=True)
+    # shift clock of backup and merge instead of waiting for the next
+    # second when backup IDs collide, see backup_clock_env()
+    backup_clock = True
+    # commands which don't change backup catalog, see show_pb()
+    read_only_commands = ('show', 'show-config', 'version', '--version', '-V',
+                          'help', '--help', '-?')
 
     def __init__(self, *args, **kwargs):
         super(ProbackupTest, self).__init__(*args, **kwargs)
 
         self.nodes_to_cleanup = []
 
+        # output of show_pb() is reused while catalog is not changed
+        self.show_cache = {}
+        self.catalog_generation = 0
+        self.pb_processes = []
+
+        # FaultPlan of the next run_pb(), see inject_faults()
+        self.pending_faults = None
+
         if isinstance(self, unittest.TestCase):
-            self.module_name = self.id().split('.')[1]
-            self.fname = self.id().split('.')[3]
+            # tests.<module>.<class>.<test> or tests.benchmarks.<module>...
+            self.module_name = self.id().split('.')[-3]
+            self.fname = self.id().split('.')[-1]
 
         if '-v' in argv or '--verbose' in argv:
             self.verbose = True
@@ -276,6 +747,7 @@ class ProbackupTest(object):
 
         self.test_env['LC_MESSAGES'] = 'C'
         self.test_env['LC_TIME'] = 'C'
+        self.test_env['PGAPPNAME'] = 'pg_probackup'
 
         self.gdb = 'PGPROBACKUP_GDB' in self.test_env and \
               self.test_env['PGPROBACKUP_GDB'] == 'ON'
@@ -283,6 +755,10 @@ class ProbackupTest(object):
         self.paranoia = 'PG_PROBACKUP_PARANOIA' in self.test_env and \
             self.test_env['PG_PROBACKUP_PARANOIA'] == 'ON'
 
+        # compare datafiles ignoring hint bits, LSN and checksum of pages
+        self.mask_pages = 'PG_PROBACKUP_PAGE_MASKING' in self.test_env and \
+            self.test_env['PG_PROBACKUP_PAGE_MASKING'] == 'ON'
+
         self.archive_compress = 'ARCHIVE_COMPRESSION' in self.test_env and \
             self.test_env['ARCHIVE_COMPRESSION'] == 'ON'
 
@@ -307,6 +783,38 @@ class ProbackupTest(object):
         except:
             pass
 
+        # pytest-xdist workers get separate tmp_dirs and port ranges
+        self.worker_index = get_worker_index()
+        if self.worker_index is not None:
+            self.tmp_path = os.path.join(
+                self.tmp_path, 'worker_{0}'.format(self.worker_index))
+            os.makedirs(self.tmp_path, exist_ok=True)
+
+        self.initdb_cache = not (
+            'PG_PROBACKUP_INITDB_CACHE' in self.test_env and
+            self.test_env['PG_PROBACKUP_INITDB_CACHE'] == 'OFF')
+
+        # digests of unchanged files are reused by pgdata_content()
+        self.content_cache = None
+        if not ('PG_PROBACKUP_CONTENT_CACHE' in self.test_env and
+                self.test_env['PG_PROBACKUP_CONTENT_CACHE'] == 'OFF'):
+            self.content_cache = ContentDigestCache(verify=self.paranoia)
+
+        # safe_psql() and execute() of nodes use persistent connections
+        self.query_pool = not (
+            'PG_PROBACKUP_QUERY_POOL' in self.test_env and
+            self.test_env['PG_PROBACKUP_QUERY_POOL'] == 'OFF')
+
+        if ProbackupTest.timings is None:
+            ProbackupTest.timings = TimingDatabase()
+
+        if ProbackupTest.trash is None:
+            ProbackupTest.trash = Trash(os.path.join(self.tmp_path, 'trash'))
+
+        if self.initdb_cache and ProbackupTest.initdb_templates is None:
+            ProbackupTest.initdb_templates = InitdbTemplateCache(
+                os.path.join(self.dir_path, 'tmp_dirs', 'initdb_templates'))
+
         self.user = self.get_username()
         self.probackup_path = None
         if 'PGPROBACKUPBIN' in self.test_env:
@@ -344,13 +852,13 @@ class ProbackupTest(object):
 
         if os.name == 'posix':
             self.EXTERNAL_DIRECTORY_DELIMITER = ':'
-            os.environ['PATH'] = os.path.dirname(
-                self.probackup_path) + ':' + os.environ['PATH']
+            self.test_env['PATH'] = os.path.dirname(
+                self.probackup_path) + ':' + self.test_env['PATH']
 
         elif os.name == 'nt':
             self.EXTERNAL_DIRECTORY_DELIMITER = ';'
-            os.environ['PATH'] = os.path.dirname(
-                self.probackup_path) + ';' + os.environ['PATH']
+            self.test_env['PATH'] = os.path.dirname(
+                self.probackup_path) + ';' + self.test_env['PATH']
 
         self.probackup_old_path = None
 
@@ -405,8 +913,6 @@ class ProbackupTest(object):
                 if self.pg_config_version >= self.version_to_num('11.0'):
                     self.ptrack = True
 
-        os.environ["PGAPPNAME"] = "pg_probackup"
-
     def is_test_result_ok(test_case):
         # sources of solution:
         # 1. python versions 2.7 - 3.10, verified on 3.10, 3.7, 2.7, taken from:
@@ -436,10 +942,17 @@ class ProbackupTest(object):
 
         return ok
 
+    def run(self, result=None):
+        self.start_time = time.time()
+        return super(ProbackupTest, self).run(result)
+
     def tearDown(self):
         if self.is_test_result_ok():
+            self.timings.record(self.id(), time.time() - self.start_time)
             for node in self.nodes_to_cleanup:
-                node.cleanup()
+                # same as node.cleanup(), but data is removed in background
+                node._try_shutdown(max_attempts=3)
+                self.trash.remove(node.data_dir)
             self.del_test_dir(self.module_name, self.fname)
 
         else:
@@ -448,6 +961,10 @@ class ProbackupTest(object):
                 node._try_shutdown(max_attempts=1)
                 # node.cleanup()
 
+        if self.worker_index is not None:
+            for node in self.nodes_to_cleanup:
+                release_worker_port(node.port)
+
         self.nodes_to_cleanup.clear()
 
     @property
@@ -480,8 +997,14 @@ class ProbackupTest(object):
         shutil.rmtree(real_base_dir, ignore_errors=True)
         os.makedirs(real_base_dir)
 
-        node = PostgresNodeExtended(base_dir=real_base_dir)
+        port = None
+        if self.worker_index is not None:
+            port = reserve_worker_port(self.worker_index)
+
+        node = PostgresNodeExtended(base_dir=real_base_dir, port=port)
         node.should_rm_dirs = True
+        if not self.query_pool:
+            node.query_pool = None
         self.nodes_to_cleanup.append(node)
 
         return node
@@ -496,7 +1019,8 @@ class ProbackupTest(object):
 
         node = self.make_empty_node(base_dir)
         node.init(
-           initdb_params=initdb_params, allow_streaming=set_replication)
+           initdb_params=initdb_params, allow_streaming=set_replication,
+           template_cache=self.initdb_templates if self.initdb_cache else None)
 
         # set major version
         with open(os.path.join(node.data_dir, 'PG_VERSION')) as f:
@@ -520,6 +1044,8 @@ class ProbackupTest(object):
         options['log_disconnections'] = 'on'
         options['restart_after_crash'] = 'off'
         options['autovacuum'] = 'off'
+        # slow_start() waits for english log messages
+        options['lc_messages'] = 'C'
 
         # Allow replication in pg_hba.conf
         if set_replication:
@@ -534,11 +1060,11 @@ class ProbackupTest(object):
         else:
             options['wal_keep_segments'] = '100'
 
-        # set default values
-        self.set_auto_conf(node, options)
-
-        # Apply given parameters
-        self.set_auto_conf(node, pg_options)
+        # set default values and apply given parameters
+        conf = self.auto_conf(node)
+        conf.update(options)
+        conf.update(pg_options)
+        conf.write()
 
         # kludge for testgres
         # https://github.com/postgrespro/testgres/issues/54
@@ -730,50 +1256,45 @@ class ProbackupTest(object):
 
         return md5_per_page
 
-    def get_ptrack_bits_per_page_for_fork(self, node, file, size=[]):
-
-        if self.get_pgpro_edition(node) == 'enterprise':
-            if self.get_version(node) < self.version_to_num('10.0'):
-                header_size = 48
-            else:
-                header_size = 24
-        else:
-            header_size = 24
-        ptrack_bits_for_fork = []
+    def get_ptrack_bits_per_page_for_fork(self, node, file, size=[], lsn=None):
+        """ BitArray of pages of file changed according to ptrack.
+        For ptrack 2.x map pages changed since lsn are marked"""
 
-        # TODO: use macro instead of hard coded 8KB
-        page_body_size = 8192-header_size
         # Check that if main fork file size is 0, it`s ok
         # to not having a _ptrack fork
         if os.path.getsize(file) == 0:
-            return ptrack_bits_for_fork
-        byte_size = os.path.getsize(file + '_ptrack')
-        npages = int(byte_size/8192)
-        if byte_size % 8192 != 0:
-            print('Ptrack page is not 8k aligned')
-            exit(1)
+            return []
 
-        file = os.open(file + '_ptrack', os.O_RDONLY)
-
-        for page in range(npages):
-            offset = 8192*page+header_size
-            os.lseek(file, offset, 0)
-            lots_of_bytes = os.read(file, page_body_size)
-            byte_list = [
-                lots_of_bytes[i:i+1] for i in range(len(lots_of_bytes))
-                ]
-            for byte in byte_list:
-                # byte_inverted = bin(int(byte, base=16))[2:][::-1]
-                # bits = (byte >> x) & 1 for x in range(7, -1, -1)
-                byte_inverted = bin(ord(byte))[2:].rjust(8, '0')[::-1]
-                for bit in byte_inverted:
-                    # if len(ptrack_bits_for_fork) < size:
-                    ptrack_bits_for_fork.append(int(bit))
-
-        os.close(file)
-        return ptrack_bits_for_fork
-
-    def check_ptrack_map_sanity(self, node, idx_ptrack):
+        if os.path.exists(file + '_ptrack'):
+            if self.get_pgpro_edition(node) == 'enterprise':
+                if self.get_version(node) < self.version_to_num('10.0'):
+                    header_size = 48
+                else:
+                    header_size = 24
+            else:
+                header_size = 24
+            return legacy_ptrack_bits(file + '_ptrack', header_size)
+
+        if lsn is None:
+            raise ValueError(
+                'ptrack 2.x map keeps LSNs of changes rather than bits, '
+                'pass start-lsn of the previous backup as lsn')
+        if isinstance(lsn, str):
+            lsn = self.lsn_to_num(lsn)
+
+        nblocks = max(size) if size else os.path.getsize(file) // 8192
+        with PtrackMap(os.path.join(node.data_dir, 'global', 'ptrack.map')) as ptrack_map:
+            return ptrack_map.pagemap(
+                os.path.relpath(file, node.data_dir), nblocks, lsn)
+
+    def lsn_to_num(self, lsn):
+        """ integer of LSN in 'X/X' form """
+        hi, lo = lsn.split('/')
+        return (int(hi, 16) << 32) + int(lo, 16)
+
+    def check_ptrack_map_sanity(self, node, idx_ptrack, lsn=None):
+        """ lsn is start LSN of the previous backup, it is required
+        for ptrack 2.x, which tracks LSN of the last change of block"""
         success = True
         for i in idx_ptrack:
             # get new size of heap and indexes. size calculated in pages
@@ -786,7 +1307,7 @@ class ProbackupTest(object):
             # get ptrack for every idx
             idx_ptrack[i]['ptrack'] = self.get_ptrack_bits_per_page_for_fork(
                 node, idx_ptrack[i]['path'],
-                [idx_ptrack[i]['old_size'], idx_ptrack[i]['new_size']])
+                [idx_ptrack[i]['old_size'], idx_ptrack[i]['new_size']], lsn)
 
             # compare pages and check ptrack sanity
             if not self.check_ptrack_sanity(idx_ptrack[i]):
@@ -883,21 +1404,14 @@ class ProbackupTest(object):
 
     def get_backup_filelist(self, backup_dir, instance, backup_id):
 
-        filelist_path = os.path.join(
-            backup_dir, 'backups',
-            instance, backup_id, 'backup_content.control')
-
-        with open(filelist_path, 'r') as f:
-                filelist_raw = f.read()
+        # values are kept as strings, see Backup.filelist() for typed ones
+        return Catalog(backup_dir).backup(instance, backup_id).filelist(typed=False)
 
-        filelist_splitted = filelist_raw.splitlines()
-
-        filelist = {}
-        for line in filelist_splitted:
-            line = json.loads(line)
-            filelist[line['path']] = line
-
-        return filelist
+    def synthetic_catalog(self, backup_dir, instance, **kwargs):
+        """ SyntheticCatalog of backups as if made by tested binary """
+        if self.probackup_version:
+            kwargs.setdefault('program_version', self.probackup_version)
+        return SyntheticCatalog(backup_dir, instance, **kwargs)
 
     # return dict of files from filelist A,
     # which are not exists in filelist_B
@@ -946,7 +1460,7 @@ class ProbackupTest(object):
                     )
                 )
 
-    def run_pb(self, command, asynchronous=False, gdb=False, old_binary=False, return_id=True, env=None):
+    def run_pb(self, command, asynchronous=False, gdb=False, old_binary=False, return_id=True, env=None, cwd=None):
         if not self.probackup_old_path and old_binary:
             print('PGPROBACKUPBIN_OLD is not set')
             exit(1)
@@ -959,25 +1473,40 @@ class ProbackupTest(object):
         if not env:
             env=self.test_env
 
+        # fault injection points are armed for one run only
+        if self.pending_faults is not None:
+            env = self.pending_faults.env(env)
+            self.pending_faults = None
+
+        if command and command[0] not in self.read_only_commands:
+            self.catalog_generation += 1
+
         try:
             self.cmd = [' '.join(map(str, [binary_path] + command))]
             if self.verbose:
                 print(self.cmd)
             if gdb:
-                return GDBobj([binary_path] + command, self)
+                gdb_obj = GDBobj([binary_path] + command, self)
+                self.pb_processes.append(gdb_obj.proc)
+                return gdb_obj
             if asynchronous:
-                return subprocess.Popen(
+                proc = subprocess.Popen(
                     [binary_path] + command,
                     stdout=subprocess.PIPE,
                     stderr=subprocess.PIPE,
-                    env=env
+                    env=env,
+                    cwd=cwd
                 )
+                self.pb_processes.append(proc)
+                return proc
             else:
-                self.output = subprocess.check_output(
-                    [binary_path] + command,
-                    stderr=subprocess.STDOUT,
-                    env=env
-                    ).decode('utf-8')
+                returncode, output, usage = run_measured(
+                    [binary_path] + command, env=env, cwd=cwd)
+                self.resource_usage.record(self.id(), command, usage)
+                if returncode != 0:
+                    raise subprocess.CalledProcessError(
+                        returncode, [binary_path] + command, output)
+                self.output = output.decode('utf-8')
                 if command[0] == 'backup' and return_id:
                     # return backup ID
                     for line in self.output.splitlines():
@@ -1088,6 +1617,14 @@ class ProbackupTest(object):
     def clean_pb(self, backup_dir):
         shutil.rmtree(backup_dir, ignore_errors=True)
 
+    def clone_backup_catalog(self, backup_dir, new_backup_dir):
+        """
+        Make independent copy of backup catalog or of its part, like WAL
+        archive of instance, see clone_file(). new_backup_dir is replaced.
+        """
+        shutil.rmtree(new_backup_dir, ignore_errors=True)
+        return clone_tree(backup_dir, new_backup_dir)
+
     def backup_node(
             self, backup_dir, instance, node, data_dir=False,
             backup_type='full', datname=False, options=[],
@@ -1126,8 +1663,48 @@ class ProbackupTest(object):
         if not old_binary:
             cmd_list += ['--no-sync']
 
+        env = self.backup_clock_env(
+            backup_dir, instance, env, old_binary=old_binary or gdb)
+
         return self.run_pb(cmd_list + options, asynchronous, gdb, old_binary, return_id, env=env)
 
+    def latest_backup_id(self, backup_dir, instance):
+        """ the greatest backup ID in instance catalog as integer, or 0 """
+        latest = 0
+        instance_dir = os.path.join(backup_dir, 'backups', instance)
+        if not os.path.isdir(instance_dir):
+            return latest
+        for name in os.listdir(instance_dir):
+            try:
+                latest = max(latest, int(name, 36))
+            except ValueError:
+                continue
+        return latest
+
+    def backup_clock_env(self, backup_dir, instance, env=None, old_binary=False):
+        """
+        Environment to run backup or merge with. Backup IDs are the start
+        time in seconds, so instead of waiting for the next second
+        pg_probackup clock is shifted past the latest backup ID with
+        PGPROBACKUP_TESTS_CLOCK_OFFSET. Binaries which do not know about the
+        offset (old binary, gdb) have to wait until wall clock catches up.
+        """
+        if not self.backup_clock:
+            return env
+
+        latest = self.latest_backup_id(backup_dir, instance)
+        offset = max(0, latest + 1 - int(time.time()))
+
+        if old_binary:
+            # ID equal to current time is retried by pg_probackup itself
+            while int(time.time()) < latest:
+                sleep(0.1)
+            return env
+
+        env = dict(env or self.test_env)
+        env['PGPROBACKUP_TESTS_CLOCK_OFFSET'] = str(offset)
+        return env
+
     def checkdb_node(
             self, backup_dir=False, instance=False, data_dir=False,
             options=[], asynchronous=False, gdb=False, old_binary=False
@@ -1156,7 +1733,10 @@ class ProbackupTest(object):
             '-i', backup_id
         ]
 
-        return self.run_pb(cmd_list + options, asynchronous, gdb, old_binary)
+        env = self.backup_clock_env(
+            backup_dir, instance, old_binary=old_binary or gdb)
+
+        return self.run_pb(cmd_list + options, asynchronous, gdb, old_binary, env=env)
 
     def restore_node(
             self, backup_dir, instance, node=False,
@@ -1210,6 +1790,61 @@ class ProbackupTest(object):
 
         return self.run_pb(cmd_list + options)
 
+    def catalog_fingerprint(self, backup_dir, instance=None):
+        """
+        Changes when backup catalog may have changed: pg_probackup was run,
+        backup was added or removed, backup.control was changed.
+        None if it can't be trusted.
+        """
+        # asynchronous or gdb run may change catalog at any moment
+        self.pb_processes = [
+            proc for proc in self.pb_processes if proc.poll() is None]
+        if self.pb_processes:
+            return None
+
+        backups_dir = os.path.join(backup_dir, 'backups')
+        try:
+            st = os.stat(backups_dir)
+            fingerprint = [self.catalog_generation, st.st_mtime_ns, st.st_ino]
+            if instance:
+                instances = [instance]
+            else:
+                instances = sorted(os.listdir(backups_dir))
+            for name in instances:
+                instance_dir = os.path.join(backups_dir, name)
+                st = os.stat(instance_dir)
+                fingerprint += [name, st.st_mtime_ns, st.st_ino]
+                for backup_id in sorted(os.listdir(instance_dir)):
+                    # tests edit backup.control in place, faster than mtime
+                    # resolution, so compare its content
+                    control = os.path.join(instance_dir, backup_id, 'backup.control')
+                    try:
+                        with open(control, 'rb') as f:
+                            fingerprint += [backup_id, f.read()]
+                    except (FileNotFoundError, NotADirectoryError):
+                        fingerprint.append(backup_id)
+        except OSError:
+            return None
+        return tuple(fingerprint)
+
+    def run_show_cached(self, backup_dir, instance, command, old_binary=False):
+        """ output of show command, reused while catalog_fingerprint() is the same """
+        # archive is changed by server
+        if '--archive' in command:
+            return self.run_pb(command, old_binary=old_binary)
+
+        key = (tuple(command), old_binary)
+        fingerprint = self.catalog_fingerprint(backup_dir, instance)
+        cached = self.show_cache.get(key)
+        if fingerprint is not None and cached is not None and cached[0] == fingerprint:
+            self.output = cached[1]
+            return cached[1]
+
+        output = self.run_pb(command, old_binary=old_binary)
+        if fingerprint is not None:
+            self.show_cache[key] = (fingerprint, output)
+        return output
+
     def show_pb(
             self, backup_dir, instance=None, backup_id=None,
             options=[], as_text=False, as_json=True, old_binary=False,
@@ -1238,7 +1873,8 @@ class ProbackupTest(object):
 
         # get show result as list of lines
         if as_json:
-            data = json.loads(self.run_pb(cmd_list + options, old_binary=old_binary))
+            data = json.loads(self.run_show_cached(
+                backup_dir, instance, cmd_list + options, old_binary))
         #    print(data)
             for instance_data in data:
                 # find specific instance if requested
@@ -1535,51 +2171,19 @@ class ProbackupTest(object):
         # parse postgresql.auto.conf
         path = os.path.join(node.data_dir, config)
 
-        with open(path, 'r') as f:
-            raw_content = f.read()
-
-        current_options = {}
-        current_directives = []
-        for line in raw_content.splitlines():
-
-            # ignore comments
-            if line.startswith('#'):
-                continue
-
-            if line == '':
-                continue
-
-            if line.startswith('include'):
-                current_directives.append(line)
-                continue
-
-            name, var = line.partition('=')[::2]
-            name = name.strip()
-            var = var.strip()
-            var = var.strip('"')
-            var = var.strip("'")
-
-            # remove options specified in rm_options list
-            if name in rm_options:
-                continue
-
-            current_options[name] = var
+        current_options, current_directives = read_conf(path, rm_options)
 
         for option in options:
             current_options[option] = options[option]
 
-        auto_conf = ''
-        for option in current_options:
-            auto_conf += "{0} = '{1}'\n".format(
-                option, current_options[option])
-
-        for directive in current_directives:
-            auto_conf += directive + "\n"
+        write_conf(path, current_options, current_directives)
 
-        with open(path, 'wt') as f:
-            f.write(auto_conf)
-            f.flush()
-            f.close()
+    def auto_conf(self, node, config='postgresql.auto.conf'):
+        """
+        ConfigTransaction of node: options are written at once and
+        running node is reloaded, or restarted if it is required
+        """
+        return ConfigTransaction(node, config)
 
     def set_replica(
             self, master, replica,
@@ -1619,13 +2223,10 @@ class ProbackupTest(object):
                         self.user, master.port, replica_name))
 
         if synchronous:
-            self.set_auto_conf(
-                master,
-                options={
-                    'synchronous_standby_names': replica_name,
-                    'synchronous_commit': 'remote_apply'})
-
-            master.reload()
+            with self.auto_conf(master) as conf:
+                conf.set(
+                    synchronous_standby_names=replica_name,
+                    synchronous_commit='remote_apply')
 
     def change_backup_status(self, backup_dir, instance, backup_id, status):
 
@@ -1701,29 +2302,115 @@ class ProbackupTest(object):
             num = num * 100 + int(re.sub(r"[^\d]", "", part))
         return num
 
-    def switch_wal_segment(self, node):
+    def switch_wal_segment(self, node, backup_dir=None, instance=None,
+                           timeout=60):
         """
-        Execute pg_switch_wal/xlog() in given node
+        Execute pg_switch_wal/xlog() in given node and wait until
+        the switched segment is archived, see wait_wal_archived()
 
         Args:
             node: an instance of PostgresNode or NodeConnection class
+            backup_dir, instance: wait for segment in backup catalog
+                instead of archive_status
+
+        Returns:
+            name of the switched segment
         """
         if isinstance(node, testgres.PostgresNode):
-            if self.version_to_num(
-                node.safe_psql('postgres', 'show server_version').decode('utf-8')
-                    ) >= self.version_to_num('10.0'):
-                node.safe_psql('postgres', 'select pg_switch_wal()')
-            else:
-                node.safe_psql('postgres', 'select pg_switch_xlog()')
+            pg_node = node
+            version = node.safe_psql(
+                'postgres', 'show server_version').decode('utf-8')
         else:
-            if self.version_to_num(
-                node.execute('show server_version')[0][0]
-                    ) >= self.version_to_num('10.0'):
-                node.execute('select pg_switch_wal()')
-            else:
-                node.execute('select pg_switch_xlog()')
+            pg_node = node.node
+            version = node.execute('show server_version')[0][0]
 
-        sleep(1)
+        if self.version_to_num(version) >= self.version_to_num('10.0'):
+            query = 'select pg_walfile_name(pg_switch_wal()), ' \
+                'current_setting(\'archive_mode\'), ' \
+                'current_setting(\'archive_command\')'
+        else:
+            query = 'select pg_xlogfile_name(pg_switch_xlog()), ' \
+                'current_setting(\'archive_mode\'), ' \
+                'current_setting(\'archive_command\')'
+
+        log_offset = os.path.getsize(pg_node.pg_log_file)
+        if isinstance(node, testgres.PostgresNode):
+            segment, archive_mode, archive_command = node.safe_psql(
+                'postgres', query).decode('utf-8').rstrip().split('|', 2)
+        else:
+            segment, archive_mode, archive_command = node.execute(query)[0]
+
+        if archive_mode == 'off' or not archive_command:
+            # nothing to wait for, give replicas and
+            # walreceivers some time to catch up
+            sleep(1)
+        elif not self.wait_wal_archived(
+                pg_node, segment, backup_dir, instance, timeout, log_offset):
+            # some tests make archive_command fail on purpose
+            warnings.warn(
+                'WAL segment {0} of node {1} is not archived'.format(
+                    segment, pg_node.name))
+
+        return segment
+
+    def wait_wal_archived(self, node, segment, backup_dir=None,
+                          instance=None, timeout=60, log_offset=None):
+        """
+        Wait until archive_status/<segment>.done appears in node or,
+        if backup_dir is given, until segment appears in wal/<instance>
+        of backup catalog. Without segment wait until there are
+        no .ready files left in archive_status.
+
+        Returns False on timeout or if archive_command has failed
+        after log_offset of server log (end of log by default).
+        Returns False at once if archiving is off or archive_command
+        is empty, as nothing is going to be archived.
+        """
+        archive_mode, archive_command = node.safe_psql(
+            'postgres',
+            "select current_setting('archive_mode'), "
+            "current_setting('archive_command')"
+            ).decode('utf-8').rstrip().split('|', 1)
+        if archive_mode == 'off' or not archive_command:
+            return False
+
+        status_dir = os.path.join(node.data_dir, 'pg_wal', 'archive_status')
+        if not os.path.isdir(status_dir):
+            status_dir = os.path.join(node.data_dir, 'pg_xlog', 'archive_status')
+
+        if backup_dir and segment:
+            watch_dir = os.path.join(backup_dir, 'wal', instance)
+            targets = [
+                os.path.join(watch_dir, segment),
+                os.path.join(watch_dir, segment + '.gz')]
+        else:
+            watch_dir = status_dir
+            targets = []
+            if segment:
+                targets = [os.path.join(status_dir, segment + '.done')]
+
+        def is_archived():
+            if targets:
+                return any(os.path.exists(target) for target in targets)
+            return not [
+                f for f in os.listdir(status_dir) if f.endswith('.ready')]
+
+        if log_offset is None:
+            log_offset = os.path.getsize(node.pg_log_file)
+
+        deadline = time.time() + timeout
+        with file_watcher(watch_dir, IN_CREATE | IN_MOVED_TO) as watcher:
+            while not is_archived():
+                failure, log_offset = wait_for_lines(
+                    node.pg_log_file,
+                    ['archive command failed', 'archive command was terminated'],
+                    log_offset, timeout=0)
+                if failure or time.time() > deadline:
+                    return False
+                # archive_command failures are noticed by rechecking the log
+                watcher.wait(min(0.5, deadline - time.time()))
+
+        return True
 
     def wait_until_replica_catch_with_master(self, master, replica):
 
@@ -1764,18 +2451,22 @@ class ProbackupTest(object):
     def del_test_dir(self, module_name, fname):
         """ Del testdir and optimistically try to del module dir"""
 
-        shutil.rmtree(
+        self.trash.remove(
             os.path.join(
                 self.tmp_path,
                 module_name,
                 fname
-            ),
-            ignore_errors=True
+            )
         )
 
-    def pgdata_content(self, pgdata, ignore_ptrack=True, exclude_dirs=None):
+    def pgdata_content(self, pgdata, ignore_ptrack=True, exclude_dirs=None, digests=True,
+                       mask_pages=None):
         """ return dict with directory content. "
-        " TAKE IT AFTER CHECKPOINT or BACKUP"""
+        " TAKE IT AFTER CHECKPOINT or BACKUP
+        " without digests only files, dirs and permissions are listed
+        " with mask_pages pages of datafiles are hashed masked, see mask_page()"""
+        if mask_pages is None:
+            mask_pages = self.mask_pages
         dirs_to_ignore = [
             'pg_xlog', 'pg_wal', 'pg_log',
             'pg_stat_tmp', 'pg_subtrans', 'pg_notify'
@@ -1799,6 +2490,8 @@ class ProbackupTest(object):
         directory_dict['pgdata'] = pgdata
         directory_dict['files'] = {}
         directory_dict['dirs'] = {}
+        # files are hashed in parallel after walk
+        files_to_hash = []
         for root, dirs, files in os.walk(pgdata, followlinks=True):
             dirs[:] = [d for d in dirs if d not in dirs_to_ignore]
             for file in files:
@@ -1812,33 +2505,7 @@ class ProbackupTest(object):
                 file_relpath = os.path.relpath(file_fullpath, pgdata)
                 cfile = ContentFile(file.isdigit())
                 directory_dict['files'][file_relpath] = cfile
-                with open(file_fullpath, 'rb') as f:
-                    # truncate cfm's content's zero tail
-                    if file_relpath.endswith('.cfm'):
-                        content = f.read()
-                        zero64 = b"\x00"*64
-                        l = len(content)
-                        while l > 64:
-                            s = (l - 1) & ~63
-                            if content[s:l] != zero64[:l-s]:
-                                break
-                            l = s
-                        content = content[:l]
-                        digest = hashlib.md5(content)
-                    else:
-                        digest = hashlib.md5()
-                        while True:
-                            b = f.read(64*1024)
-                            if not b: break
-                            digest.update(b)
-                    cfile.md5 = digest.hexdigest()
-
-                # crappy algorithm
-                if cfile.is_datafile:
-                    size_in_pages = os.path.getsize(file_fullpath)/8192
-                    cfile.md5_per_page = self.get_md5_per_page_for_fork(
-                            file_fullpath, size_in_pages
-                        )
+                files_to_hash.append((file_fullpath, cfile))
 
             for directory in dirs:
                 directory_path = os.path.join(root, directory)
@@ -1848,6 +2515,21 @@ class ProbackupTest(object):
                     del directory_dict['dirs'][parent]
                 directory_dict['dirs'][directory_relpath] = ContentDir()
 
+        if not digests:
+            files_to_hash = []
+
+        if self.content_cache:
+            files_to_hash = self.content_cache.lookup(files_to_hash, mask_pages)
+
+        # hashlib releases GIL, so threads read and hash files in parallel
+        with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4)) as pool:
+            list(pool.map(
+                lambda job: hash_content_file(job[0], job[1], mask_pages),
+                files_to_hash))
+
+        if self.content_cache:
+            self.content_cache.store(files_to_hash, mask_pages)
+
         # get permissions for every file and directory
         for dir, cdir in directory_dict['dirs'].items():
             full_path = os.path.join(pgdata, dir)
@@ -1877,12 +2559,9 @@ class ProbackupTest(object):
         return comparision_exclusion_dict
 
 
-    def compare_pgdata(self, original_pgdata, restored_pgdata, exclusion_dict = dict()):
-        """
-        return dict with directory content. DO IT BEFORE RECOVERY
-        exclusion_dict is used for exclude files (and it block_no) from comparision
-        it is a dict with relative filenames as keys and set of block numbers as values
-        """
+    def _compare_pgdata_layout(self, original_pgdata, restored_pgdata):
+        """ compare directories, list of files and permissions,
+        return (fail, error_message) """
         fail = False
         error_message = 'Restored PGDATA is not equal to original!\n'
 
@@ -1948,6 +2627,23 @@ class ProbackupTest(object):
                     os.path.join(restored_pgdata['pgdata'], file),
                     restored.mode)
 
+        return fail, error_message
+
+    def compare_pgdata(self, original_pgdata, restored_pgdata, exclusion_dict = dict()):
+        """
+        return dict with directory content. DO IT BEFORE RECOVERY
+        exclusion_dict is used for exclude files (and it block_no) from comparision
+        it is a dict with relative filenames as keys and set of block numbers as values
+        """
+        fail, error_message = self._compare_pgdata_layout(
+            original_pgdata, restored_pgdata)
+
+        restored_files = set(restored_pgdata['files'])
+        original_files = set(original_pgdata['files'])
+
+        for file in sorted(original_files & restored_files):
+            original = original_pgdata['files'][file]
+            restored = restored_pgdata['files'][file]
             if original.md5 != restored.md5:
                 if file not in exclusion_dict:
                     fail = True
@@ -2000,9 +2696,58 @@ class ProbackupTest(object):
 
         self.assertFalse(fail, error_message)
 
+    def compare_pgdata_dirs(self, original_dir, restored_dir, exclusion_dict = dict(),
+                            ignore_ptrack=True, exclude_dirs=None, mask_pages=None):
+        """
+        compare_pgdata() of two directories on disk without hashing them.
+        Files are mapped into memory and compared directly, only the first
+        differing page of datafile is reported.
+        Both directories must not change until comparison is finished.
+        """
+        if mask_pages is None:
+            mask_pages = self.mask_pages
+        original_pgdata = self.pgdata_content(
+            original_dir, ignore_ptrack, exclude_dirs, digests=False)
+        restored_pgdata = self.pgdata_content(
+            restored_dir, ignore_ptrack, exclude_dirs, digests=False)
+
+        fail, error_message = self._compare_pgdata_layout(
+            original_pgdata, restored_pgdata)
+
+        restored_files = set(restored_pgdata['files'])
+        original_files = set(original_pgdata['files'])
+
+        for file in sorted(original_files & restored_files):
+            original = original_pgdata['files'][file]
+            excluded = exclusion_dict.get(file)
+            if excluded is not None and not original.is_datafile:
+                continue
+
+            difference = compare_files(
+                os.path.join(original_dir, file),
+                os.path.join(restored_dir, file),
+                original.is_datafile, excluded, mask_pages)
+            if difference:
+                fail = True
+                error_message += '\n{0}\n File_old: {1}\n File_new: {2}\n'.format(
+                    difference,
+                    os.path.join(original_dir, file),
+                    os.path.join(restored_dir, file))
+
+        self.assertFalse(fail, error_message)
+
     def gdb_attach(self, pid):
         return GDBobj([str(pid)], self, attach=True)
 
+    def inject_faults(self, plan):
+        """ arm FaultPlan for the next run of pg_probackup """
+        self.pending_faults = plan
+
+    def _check_fault_injection_or_skip_test(self):
+        if not supports_fault_injection(self.probackup_path):
+            self.skipTest(
+                "pg_probackup is built without fault injection points")
+
     def _check_gdb_flag_or_skip_test(self):
         if not self.gdb:
             self.skipTest(
@@ -2257,3 +3002,220 @@ class ContentFile(object):
 
 class ContentDir(object):
     __slots__ = ('mode')
+
+
+# buffer of hash_content_file(), one per thread
+_hash_buffers = threading.local()
+
+
+def hash_content_file(path, cfile, mask_pages=False):
+    """
+    Set md5 of file and, for datafile, md5 of every whole 8KB page.
+    File is read once into reusable buffer of the thread.
+    With mask_pages pages of datafile are masked before hashing.
+    """
+    # truncate cfm's content's zero tail
+    if path.endswith('.cfm'):
+        cfile.md5 = hashlib.md5(read_cfm(path)).hexdigest()
+        return
+
+    with open(path, 'rb') as f:
+        buf = getattr(_hash_buffers, 'buf', None)
+        if buf is None:
+            # multiple of page size, so chunks are split on page boundaries
+            buf = _hash_buffers.buf = memoryview(bytearray(128 * 8192))
+
+        digest = hashlib.md5()
+        md5_per_page = {}
+        page = 0
+        while True:
+            # fill whole buffer unless EOF
+            size = 0
+            while size < len(buf):
+                n = f.readinto(buf[size:])
+                if not n:
+                    break
+                size += n
+            if size == 0:
+                break
+
+            if cfile.is_datafile and mask_pages:
+                first_block = segment_first_block(path) + page
+                for offset in range(0, size - 8191, 8192):
+                    mask_page(
+                        buf[offset:offset + 8192], first_block + offset // 8192)
+
+            digest.update(buf[:size])
+            if cfile.is_datafile:
+                # partial page at the end of file is not hashed
+                for offset in range(0, size - 8191, 8192):
+                    md5_per_page[page] = hashlib.md5(
+                        buf[offset:offset + 8192]).hexdigest()
+                    page += 1
+            if size < len(buf):
+                break
+
+    cfile.md5 = digest.hexdigest()
+    if cfile.is_datafile:
+        cfile.md5_per_page = md5_per_page
+
+
+def read_cfm(path):
+    """ content of cfm file without zero tail """
+    with open(path, 'rb') as f:
+        content = f.read()
+    zero64 = b"\x00"*64
+    l = len(content)
+    while l > 64:
+        s = (l - 1) & ~63
+        if content[s:l] != zero64[:l-s]:
+            break
+        l = s
+    return content[:l]
+
+
+def compare_files(original_path, restored_path, is_datafile, excluded_pages=None,
+                  mask_pages=False):
+    """
+    Compare files mapped into memory, return None if they are equal or
+    description of the first difference. Datafiles are compared by pages,
+    pages from excluded_pages are skipped. If excluded_pages is given,
+    only pages are compared, like compare_pgdata() does.
+    With mask_pages differing pages are compared once more masked.
+    """
+    if original_path.endswith('.cfm'):
+        if read_cfm(original_path) != read_cfm(restored_path):
+            return 'File content mismatch'
+        return None
+
+    with open(original_path, 'rb') as original_file, \
+            open(restored_path, 'rb') as restored_file:
+        original_size = os.fstat(original_file.fileno()).st_size
+        restored_size = os.fstat(restored_file.fileno()).st_size
+        size = min(original_size, restored_size)
+        if size == 0:
+            original = restored = b''
+        else:
+            original = mmap.mmap(
+                original_file.fileno(), 0, access=mmap.ACCESS_READ)
+            restored = mmap.mmap(
+                restored_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if is_datafile:
+                # partial page at the end of file is ignored, as in pgdata_content()
+                original_pages = original_size // 8192
+                restored_pages = restored_size // 8192
+                chunk = 128 * 8192
+                for chunk_start in range(0, min(original_pages, restored_pages) * 8192, chunk):
+                    chunk_end = min(chunk_start + chunk, size - size % 8192)
+                    # compare by pages only if chunk differs
+                    if original[chunk_start:chunk_end] == restored[chunk_start:chunk_end]:
+                        continue
+                    for offset in range(chunk_start, chunk_end, 8192):
+                        page = offset // 8192
+                        if excluded_pages and page in excluded_pages:
+                            continue
+                        original_page = original[offset:offset + 8192]
+                        restored_page = restored[offset:offset + 8192]
+                        if original_page == restored_page:
+                            continue
+                        if mask_pages:
+                            original_page = bytearray(original_page)
+                            restored_page = bytearray(restored_page)
+                            blkno = segment_first_block(original_path) + page
+                            mask_page(original_page, blkno)
+                            mask_page(restored_page, blkno)
+                            if original_page == restored_page:
+                                continue
+                        return 'Page {0} mismatch'.format(page)
+
+                if original_pages > restored_pages:
+                    return 'Pages {0}-{1} dissappeared'.format(
+                        restored_pages, original_pages - 1)
+                if restored_pages > original_pages:
+                    return 'Extra pages {0}-{1}'.format(
+                        original_pages, restored_pages - 1)
+                if excluded_pages is None and (
+                        original_size != restored_size or
+                        original[size - size % 8192:size] != restored[size - size % 8192:size]):
+                    return 'File content mismatch after page {0}'.format(
+                        original_pages - 1)
+                return None
+
+            if original_size != restored_size:
+                return 'File size mismatch: {0} != {1}'.format(
+                    original_size, restored_size)
+            chunk = 1024 * 1024
+            for offset in range(0, size, chunk):
+                if original[offset:offset + chunk] != restored[offset:offset + chunk]:
+                    return 'File content mismatch'
+            return None
+        finally:
+            if size != 0:
+                original.close()
+                restored.close()
+
+
+class ContentDigestCache(object):
+    """
+    Digests of files computed by previous pgdata_content() calls.
+    Digest is reused while (dev, inode, size, mtime_ns, ctime_ns) of file
+    stay the same. File modified shortly before it was hashed is not
+    cached: timestamps are too coarse to notice its next modification.
+    With verify, random sample of reused digests is recomputed to make
+    sure cache doesn't hide any change.
+    """
+
+    # younger files are not cached, in nanoseconds
+    racy_interval = 2 * 10**9
+    # fraction of reused digests to recompute with verify
+    verify_fraction = 0.1
+
+    def __init__(self, verify=False):
+        self.verify = verify
+        self.entries = {}
+
+    @staticmethod
+    def stat_key(path):
+        st = os.stat(path)
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+    def lookup(self, files, mask_pages=False):
+        """
+        Fill digests of (path, cfile) from cache, return list of
+        (path, cfile, key) for files still to be hashed, see store()
+        """
+        to_hash = []
+        reused = []
+        now = time.time_ns()
+        for path, cfile in files:
+            key = self.stat_key(path)
+            entry = self.entries.get((path, mask_pages))
+            if entry is not None and entry[0] == key:
+                cfile.md5 = entry[1]
+                if cfile.is_datafile:
+                    cfile.md5_per_page = entry[2]
+                reused.append((path, cfile))
+            elif now - key[3] > self.racy_interval:
+                to_hash.append((path, cfile, key))
+            else:
+                to_hash.append((path, cfile, None))
+
+        if self.verify and reused:
+            for path, cfile in random.sample(
+                    reused, max(1, int(len(reused) * self.verify_fraction))):
+                check = ContentFile(cfile.is_datafile)
+                hash_content_file(path, check, mask_pages)
+                if check.md5 != cfile.md5:
+                    raise AssertionError(
+                        'pgdata_content cache is stale for {0}'.format(path))
+        return to_hash
+
+    def store(self, hashed, mask_pages=False):
+        for path, cfile, key in hashed:
+            if key is None:
+                self.entries.pop((path, mask_pages), None)
+            else:
+                self.entries[(path, mask_pages)] = (
+                    key, cfile.md5, getattr(cfile, 'md5_per_page', None))
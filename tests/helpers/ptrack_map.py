@@ -0,0 +1,261 @@
+import mmap
+import os
+import re
+import struct
+
+# Reader of ptrack 2.x map (global/ptrack.map) and of bitmaps of
+# legacy ptrack 1.x forks.
+
+RELSEG_SIZE = 131072
+DEFAULTTABLESPACE_OID = 1663
+GLOBALTABLESPACE_OID = 1664
+FORK_NUMBERS = {'': 0, 'fsm': 1, 'vm': 2, 'init': 3}
+
+PTRACK_MAGIC = b'ptk\x00'
+# magic, version_num, init_lsn
+ptrack_map_header = struct.Struct('=4sIQ')
+ptrack_map_entry = struct.Struct('=Q')
+# RelFileNode, ForkNumber, BlockNumber
+pt_block_id = struct.Struct('=IIIiI')
+PG_CRC32C_SIZE = 4
+
+MASK32 = 0xffffffff
+
+
+# bits of every byte value, lowest first
+BYTE_BITS = [tuple((byte >> bit) & 1 for bit in range(8)) for byte in range(256)]
+
+
+class BitArray(object):
+    """
+    Read-only bits stored in bytes, bit i is (data[i // 8] >> (i % 8)) & 1,
+    which is numpy.unpackbits(data, bitorder='little')[i]
+    """
+
+    def __init__(self, data, nbits=None):
+        self.data = bytes(data)
+        self.nbits = len(self.data) * 8 if nbits is None else nbits
+
+    def __len__(self):
+        return self.nbits
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.nbits
+        if not 0 <= i < self.nbits:
+            raise IndexError('bit index out of range')
+        return (self.data[i >> 3] >> (i & 7)) & 1
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self):
+        """ list of bits, unpacked a byte at a time """
+        bits = []
+        for byte in self.data:
+            bits.extend(BYTE_BITS[byte])
+        del bits[self.nbits:]
+        return bits
+
+    def __eq__(self, other):
+        if isinstance(other, BitArray):
+            return self.nbits == other.nbits and self.count_xor(other) == 0
+        return self.tolist() == list(other)
+
+    def __repr__(self):
+        return 'BitArray({0})'.format(''.join(map(str, self.tolist())))
+
+    def as_int(self):
+        """ bits as a number, bit i of the array is bit i of the number """
+        return int.from_bytes(self.data, 'little') & ((1 << self.nbits) - 1)
+
+    def count(self):
+        """ number of set bits """
+        return bin(self.as_int()).count('1')
+
+    def count_xor(self, other):
+        """ number of bits which differ from the other BitArray """
+        return bin(self.as_int() ^ other.as_int()).count('1')
+
+
+def _rot(x, k):
+    return ((x << k) | (x >> (32 - k))) & MASK32
+
+
+def _mix(a, b, c):
+    a = (a - c) & MASK32; a ^= _rot(c, 4);  c = (c + b) & MASK32
+    b = (b - a) & MASK32; b ^= _rot(a, 6);  a = (a + c) & MASK32
+    c = (c - b) & MASK32; c ^= _rot(b, 8);  b = (b + a) & MASK32
+    a = (a - c) & MASK32; a ^= _rot(c, 16); c = (c + b) & MASK32
+    b = (b - a) & MASK32; b ^= _rot(a, 19); a = (a + c) & MASK32
+    c = (c - b) & MASK32; c ^= _rot(b, 4);  b = (b + a) & MASK32
+    return a, b, c
+
+
+def _final(a, b, c):
+    c ^= b; c = (c - _rot(b, 14)) & MASK32
+    a ^= c; a = (a - _rot(c, 11)) & MASK32
+    b ^= a; b = (b - _rot(a, 25)) & MASK32
+    c ^= b; c = (c - _rot(b, 16)) & MASK32
+    a ^= c; a = (a - _rot(c, 4)) & MASK32
+    b ^= a; b = (b - _rot(a, 14)) & MASK32
+    c ^= b; c = (c - _rot(b, 24)) & MASK32
+    return a, b, c
+
+
+def hash_bytes_extended(k, seed=0):
+    """ hash_bytes_extended() of src/common/hashfn.c, little-endian """
+    length = len(k)
+    a = b = c = (0x9e3779b9 + length + 3923095) & MASK32
+    if seed != 0:
+        a = (a + (seed >> 32)) & MASK32
+        b = (b + (seed & MASK32)) & MASK32
+        a, b, c = _mix(a, b, c)
+
+    pos = 0
+    while length - pos >= 12:
+        ka, kb, kc = struct.unpack_from('<III', k, pos)
+        a = (a + ka) & MASK32
+        b = (b + kb) & MASK32
+        c = (c + kc) & MASK32
+        a, b, c = _mix(a, b, c)
+        pos += 12
+
+    tail = k[pos:]
+    a = (a + int.from_bytes(tail[0:4], 'little')) & MASK32
+    b = (b + int.from_bytes(tail[4:8], 'little')) & MASK32
+    # the lowest byte of c is reserved for the length
+    c = (c + (int.from_bytes(tail[8:11], 'little') << 8)) & MASK32
+
+    a, b, c = _final(a, b, c)
+    return (b << 32) | c
+
+
+def hash_block_ids(spc, db, rel, forknum, blknos):
+    """
+    hash_bytes_extended() of PtBlockId of every block of blknos. The
+    RelFileNode fills the first 12 bytes of 20 byte key, so the mix of
+    them is shared by all blocks of relation and just forknum and blkno
+    of the tail are hashed per block.
+    """
+    a = b = c = (0x9e3779b9 + pt_block_id.size + 3923095) & MASK32
+    a = (a + spc) & MASK32
+    b = (b + db) & MASK32
+    c = (c + rel) & MASK32
+    a, b, c = _mix(a, b, c)
+    a = (a + forknum) & MASK32
+
+    hashes = []
+    for blkno in blknos:
+        _, hb, hc = _final(a, (b + blkno) & MASK32, c)
+        hashes.append((hb << 32) | hc)
+    return hashes
+
+
+def relation_of_path(relpath):
+    """
+    (spcNode, dbNode, relNode, forknum, first block) of data file
+    path relative to PGDATA, like returned by pg_relation_filepath()
+    """
+    parts = relpath.replace(os.sep, '/').split('/')
+    match = re.match(r'^(\d+)(?:_(fsm|vm|init))?(?:\.(\d+))?$', parts[-1])
+    if not match:
+        raise ValueError('not a data file: {0}'.format(relpath))
+    rel = int(match.group(1))
+    forknum = FORK_NUMBERS[match.group(2) or '']
+    segno = int(match.group(3) or 0)
+
+    if parts[0] == 'global':
+        spc, db = GLOBALTABLESPACE_OID, 0
+    elif parts[0] == 'base':
+        spc, db = DEFAULTTABLESPACE_OID, int(parts[1])
+    elif parts[0] == 'pg_tblspc':
+        spc, db = int(parts[1]), int(parts[3])
+    else:
+        raise ValueError('not a data file: {0}'.format(relpath))
+    return spc, db, rel, forknum, segno * RELSEG_SIZE
+
+
+class PtrackMap(object):
+    """
+    Copy of global/ptrack.map of ptrack 2.x: header, LSNs of the last
+    change of hashed block ids and CRC. Since ptrack 2.3 a block is
+    tracked in two slots and is changed if both of them are changed.
+    The map file is rewritten on checkpoint.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version_num, self.init_lsn = \
+            ptrack_map_header.unpack_from(self.data)
+        if magic != PTRACK_MAGIC:
+            raise ValueError('{0} is not a ptrack map'.format(path))
+        self.nentries = (
+            len(self.data) - ptrack_map_header.size - PG_CRC32C_SIZE
+            ) // ptrack_map_entry.size
+        self.two_slots = self.version_num >= 230
+        self._entries = None
+
+    def close(self):
+        # the map can't be closed while a view of it exists
+        if self._entries is not None:
+            self._entries.release()
+            self._entries = None
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def entries(self):
+        """ LSN entries as a memoryview of uint64, no copy of the map """
+        if self._entries is None:
+            begin = ptrack_map_header.size
+            self._entries = memoryview(self.data)[
+                begin:begin + self.nentries * ptrack_map_entry.size].cast('Q')
+        return self._entries
+
+    def block_lsn(self, spc, db, rel, forknum, blkno):
+        """ LSN of the last change of the block as tracked by the map """
+        return self.block_lsns(spc, db, rel, forknum, [blkno])[0]
+
+    def block_lsns(self, spc, db, rel, forknum, blknos):
+        """ LSNs of the last change of blocks of relation fork """
+        entries = self.entries()
+        nentries = self.nentries
+        hashes = hash_block_ids(spc, db, rel, forknum, blknos)
+        if not self.two_slots:
+            return [entries[hash % nentries] for hash in hashes]
+        return [
+            min(entries[hash % nentries],
+                entries[(((hash << 32) | (hash >> 32)) & 0xffffffffffffffff)
+                        % nentries])
+            for hash in hashes]
+
+    def pagemap(self, relpath, nblocks, lsn):
+        """
+        BitArray of blocks of data file changed since lsn,
+        relpath is relative to PGDATA
+        """
+        spc, db, rel, forknum, first = relation_of_path(relpath)
+        lsns = self.block_lsns(
+            spc, db, rel, forknum, range(first, first + nblocks))
+        bits = bytearray((nblocks + 7) // 8)
+        for i, block_lsn in enumerate(lsns):
+            if block_lsn >= lsn:
+                bits[i >> 3] |= 1 << (i & 7)
+        return BitArray(bits, nblocks)
+
+
+def legacy_ptrack_bits(path, header_size):
+    """ BitArray of ptrack 1.x fork, page headers are skipped """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) % 8192 != 0:
+        raise ValueError('Ptrack page is not 8k aligned')
+    return BitArray(b''.join(
+        data[offset + header_size:offset + 8192]
+        for offset in range(0, len(data), 8192)))
@@ -0,0 +1,221 @@
+import os
+import re
+import select
+from collections import defaultdict
+
+import testgres
+
+# same driver as testgres uses
+try:
+    import psycopg2 as pglib
+    import psycopg2.extensions
+except ImportError:
+    import pg8000 as pglib
+
+# Persistent connections used by PostgresNodeExtended.safe_psql() and
+# execute() instead of forking psql or connecting for every query.
+
+# databases which are never pooled: connections to template databases
+# break CREATE DATABASE
+unpooled_databases = frozenset(('template0', 'template1'))
+
+# COPY from or to client and meta-commands need psql
+psql_only_statement = re.compile(r'^\s*(\\|copy\b)', re.IGNORECASE)
+# statements which can't run while other sessions use the database
+database_statement = re.compile(r'\bdatabase\b', re.IGNORECASE)
+
+
+class NotPooled(Exception):
+    """ query should be run the usual way """
+
+
+def is_single_statement(query):
+    """ no semicolon except trailing ones, literals are not parsed """
+    return ';' not in query.rstrip().rstrip(';')
+
+
+def psql_output(rows):
+    """ rows formatted like 'psql -A -t' does """
+    return ''.join(
+        '|'.join('' if value is None else value for value in row) + '\n'
+        for row in rows).encode('utf-8')
+
+
+def error_message(e):
+    """ server error formatted like psql prints it """
+    # psycopg2
+    if getattr(e, 'pgerror', None):
+        return e.pgerror
+    # pg8000 gives dict of error fields
+    fields = e.args[0] if e.args and isinstance(e.args[0], dict) else None
+    if not fields:
+        return str(e)
+    message = '{0}:  {1}\n'.format(fields.get('S', 'ERROR'), fields.get('M', ''))
+    for code, label in (('D', 'DETAIL'), ('H', 'HINT')):
+        if code in fields:
+            message += '{0}:  {1}\n'.format(label, fields[code])
+    return message
+
+
+def use_text_values(con):
+    """ return values as text sent by server, like psql prints them """
+    if pglib.__name__ == 'psycopg2':
+        oids = tuple(psycopg2.extensions.string_types)
+        psycopg2.extensions.register_type(
+            psycopg2.extensions.new_type(oids, 'PSQL_TEXT', lambda value, cur: value),
+            con)
+    else:
+        con.pg_types = defaultdict(lambda: str)
+
+
+class QueryPool(object):
+    """
+    Idle connections of node, one per (dbname, username, text values).
+    Connection is taken out of pool while a query runs and is returned
+    after DISCARD ALL, so session state doesn't leak between queries.
+    All connections are dropped when postmaster is restarted.
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.connections = {}
+        self.postmaster_pid = None
+
+    def close(self):
+        connections, self.connections = self.connections, {}
+        for con in connections.values():
+            self._close(con)
+
+    @staticmethod
+    def _close(con):
+        try:
+            con.close()
+        except Exception:
+            pass
+
+    def _read_postmaster_pid(self):
+        try:
+            with open(os.path.join(self.node.data_dir, 'postmaster.pid')) as f:
+                return f.readline().strip()
+        except (IOError, OSError):
+            return None
+
+    @staticmethod
+    def _is_idle(con):
+        """ server sends nothing to idle session unless it is terminated """
+        if pglib.__name__ == 'psycopg2':
+            if con.closed:
+                return False
+            sock = con.fileno()
+        else:
+            sock = getattr(con, '_usock', None)
+            if sock is None:
+                return True
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (ValueError, OSError):
+            return False
+        return not readable
+
+    def _take(self, key):
+        pid = self._read_postmaster_pid()
+        if pid is None:
+            self.close()
+            return None
+        if pid != self.postmaster_pid:
+            self.close()
+            self.postmaster_pid = pid
+
+        con = self.connections.pop(key, None)
+        if con is not None and not self._is_idle(con):
+            self._close(con)
+            con = None
+        if con is None:
+            dbname, username, text_values = key
+            try:
+                con = pglib.connect(
+                    database=dbname, user=username,
+                    host=self.node.host, port=self.node.port)
+            except Exception:
+                # let caller report it the usual way
+                return None
+            con.autocommit = True
+            if text_values:
+                use_text_values(con)
+        return con
+
+    def _release(self, key, con):
+        try:
+            cursor = con.cursor()
+            cursor.execute('DISCARD ALL')
+            cursor.close()
+        except Exception:
+            self._close(con)
+            return
+        if key in self.connections:
+            self._close(con)
+        else:
+            self.connections[key] = con
+
+    def _run(self, key, query, commit=True):
+        """
+        rows of query, None if query returns no rows.
+        NotPooled if connection can't be established.
+        """
+        con = self._take(key)
+        if con is None:
+            raise NotPooled()
+        try:
+            cursor = con.cursor()
+            if not commit:
+                cursor.execute('BEGIN')
+            try:
+                if key[2]:
+                    cursor.execute(query)
+                else:
+                    # testgres passes no parameters, but psycopg2 still
+                    # interpolates them, keep it
+                    cursor.execute(query, ())
+                rows = cursor.fetchall() if cursor.description else None
+            finally:
+                if not commit:
+                    cursor.execute('ROLLBACK')
+                cursor.close()
+        except pglib.DatabaseError as e:
+            self._release(key, con)
+            # execute() of testgres raises driver errors as they are
+            if not key[2]:
+                raise
+            raise testgres.QueryException(error_message(e), query)
+        except Exception:
+            self._close(con)
+            raise
+        self._release(key, con)
+        if rows is None:
+            return None
+        return [tuple(row) for row in rows]
+
+    def poolable(self, dbname, query):
+        if dbname in unpooled_databases:
+            return False
+        if not isinstance(query, str) or not is_single_statement(query):
+            return False
+        if psql_only_statement.match(query):
+            return False
+        if database_statement.search(query):
+            # e.g. DROP DATABASE fails while pooled connections are open
+            self.close()
+            return False
+        return True
+
+    def psql(self, query, dbname, username):
+        """ output of query as of safe_psql(), NotPooled if it is not pooled """
+        if not self.poolable(dbname, query):
+            raise NotPooled()
+        return psql_output(self._run((dbname, username, True), query) or [])
+
+    def execute(self, query, dbname, username, commit=True):
+        """ rows of query as of execute(), NotPooled if it is not pooled """
+        if not self.poolable(dbname, query):
+            raise NotPooled()
+        return self._run((dbname, username, False), query, commit)
@@ -0,0 +1,151 @@
+import atexit
+import json
+import os
+import subprocess
+import sys
+import time
+
+# fields of /proc/<pid>/io
+proc_io_fields = ('rchar', 'wchar', 'read_bytes', 'write_bytes')
+
+
+def default_report_path():
+    return os.path.join(
+        os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+        'tmp_dirs', 'resource_usage')
+
+
+def read_proc_io(pid):
+    """ I/O counters of process, empty dict if not available """
+    try:
+        with open('/proc/{0}/io'.format(pid)) as f:
+            lines = f.read().splitlines()
+    except (IOError, OSError):
+        return {}
+    counters = dict(line.split(': ', 1) for line in lines if ': ' in line)
+    return dict(
+        (field, int(counters[field]))
+        for field in proc_io_fields if field in counters)
+
+
+def run_measured(args, env=None, cwd=None):
+    """
+    Run command and wait for it like subprocess.check_output() with
+    stderr=STDOUT, but return (returncode, output, usage), where usage is
+    dict with wall time, CPU time and max RSS of the command and its
+    children, and I/O counters from /proc if available.
+    """
+    start = time.time()
+    proc = subprocess.Popen(
+        args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env,
+        cwd=cwd)
+    # single pipe, so reading it till EOF can't deadlock
+    output = proc.stdout.read()
+    proc.stdout.close()
+
+    usage = {}
+    if not hasattr(os, 'wait4'):
+        proc.wait()
+        usage['wall'] = time.time() - start
+        return proc.returncode, output, usage
+
+    if hasattr(os, 'waitid'):
+        # wait without reaping, /proc/<pid> of zombie is still there
+        os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+        usage.update(read_proc_io(proc.pid))
+
+    _, status, rusage = os.wait4(proc.pid, 0)
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+
+    usage['wall'] = time.time() - start
+    usage['user'] = rusage.ru_utime
+    usage['sys'] = rusage.ru_stime
+    # kilobytes everywhere but macOS. It includes memory of the forked
+    # python process before exec, so compare it between runs only
+    usage['maxrss'] = rusage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    return proc.returncode, output, usage
+
+
+def command_tag(command):
+    """
+    (subcommand, backup mode, option names) of pg_probackup command line,
+    option values are dropped as they are mostly paths and ports
+    """
+    subcommand = str(command[0]) if command else ''
+    mode = None
+    options = set()
+    for i, arg in enumerate(map(str, command)):
+        if not arg.startswith('-'):
+            continue
+        name = arg.split('=', 1)[0]
+        options.add(name)
+        if name in ('-b', '--backup-mode'):
+            if '=' in arg:
+                mode = arg.split('=', 1)[1]
+            elif i + 1 < len(command):
+                mode = str(command[i + 1])
+    return subcommand, mode, ' '.join(sorted(options))
+
+
+class ResourceUsage(object):
+    """
+    Resources spent by pg_probackup invocations of test session,
+    see ProbackupTest.run_pb().
+    """
+
+    def __init__(self, report_at_exit=False):
+        self.records = []
+        if report_at_exit:
+            atexit.register(self.write_report)
+
+    def record(self, test_id, command, usage):
+        subcommand, mode, options = command_tag(command)
+        record = dict(usage)
+        record.update(
+            test=test_id, command=subcommand, mode=mode, options=options)
+        self.records.append(record)
+
+    def summary(self):
+        """ totals by subcommand and backup mode """
+        groups = {}
+        for record in self.records:
+            key = (record['command'], record['mode'] or '')
+            group = groups.setdefault(key, {
+                'count': 0, 'wall': 0.0,
+                'user': 0.0, 'sys': 0.0, 'maxrss': 0,
+                'rchar': 0, 'wchar': 0})
+            group['count'] += 1
+            group['maxrss'] = max(group['maxrss'], record.get('maxrss', 0))
+            for field in ('wall', 'user', 'sys', 'rchar', 'wchar'):
+                group[field] += record.get(field, 0)
+        return groups
+
+    def format_summary(self):
+        header = '{0:<16} {1:<8} {2:>6} {3:>10} {4:>9} {5:>9} {6:>9} {7:>9} {8:>10} {9:>10}'
+        row = '{0:<16} {1:<8} {2:>6} {3:>10.1f} {4:>9.2f} {5:>9.1f} {6:>9.1f} {7:>9.1f} {8:>10.1f} {9:>10.1f}'
+        mb = 1024.0 * 1024
+        lines = [header.format(
+            'command', 'mode', 'count', 'wall, s', 'avg, s', 'user, s',
+            'sys, s', 'rss, MB', 'read, MB', 'write, MB')]
+        groups = self.summary()
+        for key in sorted(groups, key=lambda key: -groups[key]['wall']):
+            group = groups[key]
+            lines.append(row.format(
+                key[0], key[1], group['count'], group['wall'],
+                group['wall'] / group['count'], group['user'], group['sys'],
+                group['maxrss'] / mb, group['rchar'] / mb, group['wchar'] / mb))
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, path=None):
+        """ write records to <path>.json and summary to <path>.txt """
+        if not self.records:
+            return
+        path = path or default_report_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.json', 'w') as f:
+            json.dump(self.records, f, indent=1)
+        with open(path + '.txt', 'w') as f:
+            f.write(self.format_summary())
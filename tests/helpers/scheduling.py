@@ -0,0 +1,83 @@
+import os
+
+from xdist.scheduler import LoadScheduling
+
+from .timings import TimingDatabase
+
+# modules with tests that are long by design, see PG_PROBACKUP_LONG
+long_test_modules = ('time_consuming_test.py',)
+
+
+class ProbackupScheduling(LoadScheduling):
+    """
+    pytest-xdist load scheduling which starts long tests first
+    and gives a worker second long test only if it has nothing
+    else to do, that is one pending test at most. Other tests are
+    sent longest first by durations of previous runs, ordered once
+    here, as workers must collect tests in the same order.
+    """
+
+    def __init__(self, config, log=None):
+        super(ProbackupScheduling, self).__init__(config, log)
+        self.long_tests = None
+        self.ranks = None
+
+    def _is_long(self, index):
+        if self.long_tests is None:
+            self.long_tests = set(
+                i for i, nodeid in enumerate(self.collection)
+                if nodeid.split('::')[0].endswith(long_test_modules))
+        return index in self.long_tests
+
+    def _rank(self, index):
+        """ position of test in longest first order, unknown ones first """
+        if self.ranks is None:
+            durations = dict(
+                (tuple(test_id.split('.')[-3:]), duration)
+                for test_id, duration in TimingDatabase().durations().items())
+
+            def duration(nodeid):
+                path, _, names = nodeid.partition('::')
+                module = os.path.splitext(os.path.basename(path))[0]
+                return durations.get(
+                    tuple([module] + names.split('::')), float('inf'))
+
+            # sort is stable, so tests with equal duration keep their order
+            order = sorted(
+                range(len(self.collection)),
+                key=lambda i: duration(self.collection[i]), reverse=True)
+            self.ranks = dict((index, rank) for rank, index in enumerate(order))
+        return self.ranks[index]
+
+    def _has_long(self, node):
+        # completed tests are removed from node2pending by
+        # mark_test_complete() before new ones are sent
+        return any(self._is_long(index) for index in self.node2pending[node])
+
+    # overrides private method of pytest-xdist, its version is pinned
+    # in requirements.txt
+    def _send_tests(self, node, num):
+        has_long = self._has_long(node)
+        tests = []
+        pending = sorted(
+            self.pending, key=lambda i: (not self._is_long(i), self._rank(i)))
+        for index in pending:
+            if len(tests) >= num:
+                break
+            if self._is_long(index):
+                if has_long:
+                    continue
+                has_long = True
+            tests.append(index)
+
+        # only long tests are left. Worker runs its last pending test only
+        # after it gets another one or shutdown, so with one pending
+        # test the node would hang rather than idle
+        if not tests and len(self.node2pending[node]) <= 1 and pending:
+            tests = [pending[0]]
+
+        if tests:
+            for index in tests:
+                self.pending.remove(index)
+            self.node2pending[node].extend(tests)
+            node.send_runtest_some(tests)
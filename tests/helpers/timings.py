@@ -0,0 +1,94 @@
+import os
+import sqlite3
+import unittest
+
+# environment variables which noticeably change duration of tests
+timing_flags = (
+    'PG_PROBACKUP_PTRACK',
+    'PGPROBACKUP_SSH_REMOTE',
+    'ARCHIVE_COMPRESSION',
+)
+
+
+def default_timings_path():
+    return os.path.join(
+        os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+        'tmp_dirs', 'test_timings.sqlite')
+
+
+def environment_flags(env=os.environ):
+    return ','.join(
+        '{0}={1}'.format(flag, env.get(flag, 'OFF')) for flag in timing_flags)
+
+
+def unittest_id(item):
+    """ unittest-style test id of pytest item """
+    return '{0}.{1}.{2}'.format(
+        item.module.__name__, item.cls.__name__, item.name)
+
+
+class TimingDatabase(object):
+    """
+    Durations of successfully finished tests from previous runs,
+    keyed by unittest test id and environment_flags().
+    Used to run the longest tests first.
+    """
+
+    def __init__(self, path=None, flags=None):
+        self.path = path or default_timings_path()
+        self.flags = flags or environment_flags()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # parallel workers write into the same file
+            self._conn = sqlite3.connect(self.path, timeout=60)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS timings ('
+                'test_id TEXT, flags TEXT, duration REAL, '
+                'PRIMARY KEY (test_id, flags))')
+        return self._conn
+
+    def record(self, test_id, duration):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO timings VALUES (?, ?, ?)',
+                (test_id, self.flags, duration))
+
+    def durations(self):
+        """ dict of test_id -> duration in seconds """
+        if not os.path.exists(self.path):
+            return {}
+        return dict(self._connect().execute(
+            'SELECT test_id, duration FROM timings WHERE flags = ?',
+            (self.flags,)))
+
+    def longest_first(self, tests, test_id=lambda test: test.id(),
+                      test_class=type):
+        """
+        Order tests by descending duration.
+        Tests without history go first, they may be the long ones.
+        Tests of classes with setUpClass() are kept together so that
+        class fixtures are not set up twice.
+        """
+        durations = self.durations()
+        units = {}
+        for test in tests:
+            cls = test_class(test)
+            if cls.setUpClass.__func__ is unittest.TestCase.setUpClass.__func__:
+                unit = test_id(test)
+            else:
+                unit = cls
+            units.setdefault(unit, []).append(test)
+
+        def unit_duration(unit_tests):
+            return sum(
+                durations.get(test_id(test), float('inf'))
+                for test in unit_tests)
+
+        ordered = []
+        # sort is stable, so tests with equal duration keep their order
+        for unit_tests in sorted(units.values(), key=unit_duration, reverse=True):
+            ordered.extend(unit_tests)
+        return ordered
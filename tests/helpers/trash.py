@@ -0,0 +1,74 @@
+import atexit
+import os
+import queue
+import shutil
+import tempfile
+import threading
+
+
+class Trash(object):
+    """
+    Deferred removal of directories of passed tests.
+
+    Directory is renamed into trash_dir, which is cheap, and removed by
+    a background thread while the next test runs. At most max_queued
+    directories wait for removal, remove() blocks when the queue is full
+    or when free disk space drops below min_free bytes.
+    Everything left is removed at interpreter exit, see drain().
+    """
+
+    def __init__(self, trash_dir, max_queued=8, min_free=1024 ** 3):
+        self.trash_dir = trash_dir
+        self.min_free = min_free
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = None
+        self._lock = threading.Lock()
+        os.makedirs(self.trash_dir, exist_ok=True)
+        atexit.register(self.drain)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._worker, name='trash', daemon=True)
+            self._thread.start()
+
+        # leftovers of interrupted sessions
+        for name in os.listdir(self.trash_dir):
+            self._queue.put(os.path.join(self.trash_dir, name))
+
+    def _worker(self):
+        while True:
+            path = self._queue.get()
+            try:
+                shutil.rmtree(path, ignore_errors=True)
+            finally:
+                self._queue.task_done()
+
+    def remove(self, path):
+        """ Remove directory in background, nonexistent path is ignored """
+        path = os.path.normpath(path)
+        if not os.path.lexists(path):
+            return
+
+        self._start()
+        target = tempfile.mkdtemp(
+            prefix=os.path.basename(path) + '.', dir=self.trash_dir)
+        try:
+            os.rename(path, os.path.join(target, 'content'))
+        except OSError:
+            # e.g. trash is on another filesystem
+            shutil.rmtree(target, ignore_errors=True)
+            shutil.rmtree(path, ignore_errors=True)
+            return
+
+        self._queue.put(target)
+
+        if shutil.disk_usage(self.trash_dir).free < self.min_free:
+            self.drain()
+
+    def drain(self):
+        """ Wait until all queued directories are removed """
+        if self._thread is not None:
+            self._queue.join()
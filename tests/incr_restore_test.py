@@ -1955,8 +1955,6 @@ class IncrRestoreTest(ProbackupTest, unittest.TestCase):
                 "--db-exclude=db1",
                 "--db-exclude=db5"])
 
-        pgdata1 = self.pgdata_content(node1.data_dir)
-
         # partial incremental restore backup into node2
         self.restore_node(
             backup_dir, 'node',
@@ -1967,9 +1965,7 @@ class IncrRestoreTest(ProbackupTest, unittest.TestCase):
                 "--destroy-all-other-dbs",
             ])
 
-        pgdata2 = self.pgdata_content(node2.data_dir)
-
-        self.compare_pgdata(pgdata1, pgdata2)
+        self.compare_pgdata_dirs(node1.data_dir, node2.data_dir)
 
         self.set_auto_conf(node2, {'port': node2.port})
 
@@ -2060,8 +2056,6 @@ class IncrRestoreTest(ProbackupTest, unittest.TestCase):
                 "--db-exclude=db1",
                 "--db-exclude=db5"])
 
-        pgdata1 = self.pgdata_content(node1.data_dir)
-
         # partial incremental restore backup into node2
         node2.port = node.port
         node2.slow_start()
@@ -2075,9 +2069,7 @@ class IncrRestoreTest(ProbackupTest, unittest.TestCase):
                 "--destroy-all-other-dbs",
             ])
 
-        pgdata2 = self.pgdata_content(node2.data_dir)
-
-        self.compare_pgdata(pgdata1, pgdata2)
+        self.compare_pgdata_dirs(node1.data_dir, node2.data_dir)
 
         self.set_auto_conf(node2, {'port': node2.port})
 
@@ -3,6 +3,7 @@
 import unittest
 import os
 from .helpers.ptrack_helpers import ProbackupTest, ProbackupException
+from .helpers.faults import FaultPlan
 from testgres import QueryException
 import shutil
 from datetime import datetime, timedelta
@@ -987,6 +988,64 @@ class MergeTest(ProbackupTest, unittest.TestCase):
         node.cleanup()
         self.restore_node(backup_dir, 'node', node)
 
+    # @unittest.skip("skip")
+    def test_continue_merge_killed_at_fault_injection_point(self):
+        """
+        Kill MERGE at fault injection point, check that it can be continued
+        """
+        self._check_fault_injection_or_skip_test()
+
+        backup_dir = os.path.join(self.tmp_path, self.module_name, self.fname, 'backup')
+        node = self.make_simple_node(
+            base_dir=os.path.join(self.module_name, self.fname, 'node'),
+            set_replication=True, initdb_params=['--data-checksums'])
+
+        self.init_pb(backup_dir)
+        self.add_instance(backup_dir, 'node', node)
+        self.set_archiving(backup_dir, 'node', node)
+        node.slow_start()
+
+        # FULL backup
+        self.backup_node(backup_dir, 'node', node)
+
+        node.safe_psql(
+            "postgres",
+            "create table t_heap as select i as id,"
+            " md5(i::text) as text, md5(i::text)::tsvector as tsvector"
+            " from generate_series(0,1000) i")
+
+        # DELTA BACKUP
+        backup_id = self.backup_node(
+            backup_dir, 'node', node, backup_type='delta')
+
+        pgdata = self.pgdata_content(node.data_dir)
+
+        self.inject_faults(FaultPlan().kill('merge_file', hit=5))
+        try:
+            self.merge_backup(backup_dir, "node", backup_id)
+            self.assertEqual(
+                1, 0,
+                "Expecting Error because of killed merge.\n "
+                "Output: {0} \n CMD: {1}".format(
+                    repr(self.output), self.cmd))
+        except ProbackupException:
+            pass
+
+        self.assertEqual(
+            'MERGING', self.show_pb(backup_dir, 'node')[0]['status'])
+
+        # Try to continue failed MERGE
+        self.merge_backup(backup_dir, "node", backup_id)
+        self.assertEqual(
+            'OK', self.show_pb(backup_dir, 'node')[0]['status'])
+
+        # Drop node and restore it
+        node.cleanup()
+        self.restore_node(backup_dir, 'node', node)
+
+        pgdata_restored = self.pgdata_content(node.data_dir)
+        self.compare_pgdata(pgdata, pgdata_restored)
+
     # @unittest.skip("skip")
     def test_continue_failed_merge_with_corrupted_delta_backup(self):
         """
@@ -2437,17 +2437,16 @@ class PtrackTest(ProbackupTest, unittest.TestCase):
         node.safe_psql('postgres', 'vacuum t_heap')
         node.safe_psql('postgres', 'checkpoint')
 
-        if node.major_version < 11:
-            for i in idx_ptrack:
-                # get size of heap and indexes. size calculated in pages
-                idx_ptrack[i]['old_size'] = self.get_fork_size(node, i)
-                # get path to heap and index files
-                idx_ptrack[i]['path'] = self.get_fork_path(node, i)
-                # calculate md5sums of pages
-                idx_ptrack[i]['old_pages'] = self.get_md5_per_page_for_fork(
-                    idx_ptrack[i]['path'], idx_ptrack[i]['old_size'])
+        for i in idx_ptrack:
+            # get size of heap and indexes. size calculated in pages
+            idx_ptrack[i]['old_size'] = self.get_fork_size(node, i)
+            # get path to heap and index files
+            idx_ptrack[i]['path'] = self.get_fork_path(node, i)
+            # calculate md5sums of pages
+            idx_ptrack[i]['old_pages'] = self.get_md5_per_page_for_fork(
+                idx_ptrack[i]['path'], idx_ptrack[i]['old_size'])
 
-        self.backup_node(
+        backup_id = self.backup_node(
             backup_dir, 'node', node, options=['-j10', '--stream'])
 
         node.safe_psql('postgres', 'delete from t_heap where id%2 = 1')
@@ -2455,8 +2454,10 @@ class PtrackTest(ProbackupTest, unittest.TestCase):
         node.safe_psql('postgres', 'checkpoint')
 
         # CHECK PTRACK SANITY
-        if node.major_version < 11:
-            self.check_ptrack_map_sanity(node, idx_ptrack)
+        # ptrack map marks pages changed since start of FULL backup
+        self.check_ptrack_map_sanity(
+            node, idx_ptrack,
+            self.show_pb(backup_dir, 'node', backup_id)['start-lsn'])
 
     # @unittest.skip("skip")
     def test_ptrack_cluster_on_gist(self):
@@ -2503,7 +2504,7 @@ class PtrackTest(ProbackupTest, unittest.TestCase):
             idx_ptrack[i]['old_pages'] = self.get_md5_per_page_for_fork(
                 idx_ptrack[i]['path'], idx_ptrack[i]['old_size'])
 
-        self.backup_node(
+        backup_id = self.backup_node(
             backup_dir, 'node', node, options=['-j10', '--stream'])
 
         node.safe_psql('postgres', 'delete from t_heap where id%2 = 1')
@@ -2511,8 +2512,10 @@ class PtrackTest(ProbackupTest, unittest.TestCase):
         node.safe_psql('postgres', 'checkpoint')
 
         # CHECK PTRACK SANITY
-        if node.major_version < 11:
-            self.check_ptrack_map_sanity(node, idx_ptrack)
+        # ptrack map marks pages changed since start of FULL backup
+        self.check_ptrack_map_sanity(
+            node, idx_ptrack,
+            self.show_pb(backup_dir, 'node', backup_id)['start-lsn'])
 
         self.backup_node(
             backup_dir, 'node', node,
@@ -4395,3 +4398,66 @@ class PtrackTest(ProbackupTest, unittest.TestCase):
 
         # make sure that backup size is exactly the same
         self.assertEqual(delta_bytes, ptrack_bytes)
+
+    # @unittest.skip("skip")
+    def test_ptrack_map_marks_changed_pages(self):
+        """
+        Pages of heap changed after FULL backup are marked in ptrack map
+        as changed since start-lsn of the backup, the rest are not
+        """
+        node = self.make_simple_node(
+            base_dir=os.path.join(self.module_name, self.fname, 'node'),
+            set_replication=True,
+            ptrack_enable=True,
+            initdb_params=['--data-checksums'])
+
+        backup_dir = os.path.join(self.tmp_path, self.module_name, self.fname, 'backup')
+        self.init_pb(backup_dir)
+        self.add_instance(backup_dir, 'node', node)
+        node.slow_start()
+
+        node.safe_psql(
+            "postgres",
+            "CREATE EXTENSION ptrack")
+
+        node.safe_psql(
+            "postgres",
+            "create table t_heap as select i as id, md5(i::text) as text "
+            "from generate_series(0,20000) i")
+        node.safe_psql("postgres", "create index t_btree on t_heap(id)")
+        # set hint bits now, so that the update below doesn't touch
+        # every page of table
+        node.safe_psql("postgres", "vacuum t_heap")
+        node.safe_psql("postgres", "checkpoint")
+
+        path = self.get_fork_path(node, 't_heap')
+        old_size = self.get_fork_size(node, 't_heap')
+        old_pages = self.get_md5_per_page_for_fork(path, old_size)
+
+        backup_id = self.backup_node(
+            backup_dir, 'node', node, options=['--stream'])
+        start_lsn = self.show_pb(backup_dir, 'node', backup_id)['start-lsn']
+
+        node.safe_psql(
+            "postgres",
+            "update t_heap set text = 'changed' where id in (10, 10000)")
+        node.safe_psql("postgres", "checkpoint")
+
+        new_size = self.get_fork_size(node, 't_heap')
+        new_pages = self.get_md5_per_page_for_fork(path, new_size)
+
+        self.assertFalse(os.path.exists(path + '_ptrack'))
+        ptrack_bits = self.get_ptrack_bits_per_page_for_fork(
+            node, path, [old_size, new_size], start_lsn)
+
+        changed = [
+            page for page in range(new_size)
+            if page not in old_pages or old_pages[page] != new_pages[page]]
+        self.assertTrue(changed, 'Update has not changed any page')
+        for page in changed:
+            self.assertEqual(
+                ptrack_bits[page], 1,
+                'Page {0} is changed, but not marked in ptrack map'.format(page))
+        self.assertLess(
+            ptrack_bits.count(), new_size,
+            'Every page is marked in ptrack map')
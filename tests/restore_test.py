@@ -1,17 +1,26 @@
 import os
 import unittest
-from .helpers.ptrack_helpers import ProbackupTest, ProbackupException
+from .helpers.ptrack_helpers import ProbackupTest, ProbackupException, compare_files
+from .helpers.page_mask import HEAP_XMIN_COMMITTED, RELSEG_SIZE, SIZE_OF_PAGE_HEADER
+from .helpers.page_mask import mask_page, segment_first_block
+from .helpers.pgdata_generator import make_page
 import subprocess
 import sys
 from datetime import datetime, timedelta, timezone
 import hashlib
 import shutil
 import json
+import random
 import stat
+import struct
 from shutil import copyfile
 from testgres import QueryException, StartNodeException
 from stat import S_ISDIR
 
+pgbench_tables = [
+    'pgbench_accounts', 'pgbench_branches',
+    'pgbench_history', 'pgbench_tellers']
+
 
 class RestoreTest(ProbackupTest, unittest.TestCase):
 
@@ -29,12 +38,12 @@ class RestoreTest(ProbackupTest, unittest.TestCase):
         self.set_archiving(backup_dir, 'node', node)
         node.slow_start()
 
-        node.pgbench_init(scale=2)
+        node.pgbench_init_cached(scale=2)
         pgbench = node.pgbench(
             stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
         pgbench.wait()
         pgbench.stdout.close()
-        before = node.table_checksum("pgbench_branches")
+        before = node.server_table_checksums(pgbench_tables)
         backup_id = self.backup_node(backup_dir, 'node', node)
 
         node.stop()
@@ -60,7 +69,7 @@ class RestoreTest(ProbackupTest, unittest.TestCase):
 
         node.slow_start()
 
-        after = node.table_checksum("pgbench_branches")
+        after = node.server_table_checksums(pgbench_tables)
         self.assertEqual(before, after)
 
     # @unittest.skip("skip")
@@ -76,7 +85,7 @@ class RestoreTest(ProbackupTest, unittest.TestCase):
         self.set_archiving(backup_dir, 'node', node)
         node.slow_start()
 
-        node.pgbench_init(scale=2)
+        node.pgbench_init_cached(scale=2)
 
         self.backup_node(backup_dir, 'node', node)
 
@@ -118,7 +127,7 @@ class RestoreTest(ProbackupTest, unittest.TestCase):
         self.set_archiving(backup_dir, 'node', node)
         node.slow_start()
 
-        node.pgbench_init(scale=2)
+        node.pgbench_init_cached(scale=2)
 
         before = node.table_checksum("pgbench_branches")
 
@@ -181,7 +190,7 @@ class RestoreTest(ProbackupTest, unittest.TestCase):
         self.set_archiving(backup_dir, 'node', node)
         node.slow_start()
 
-        node.pgbench_init(scale=2)
+        node.pgbench_init_cached(scale=2)
         before = node.table_checksum("pgbench_branches")
 
         backup_id = self.backup_node(backup_dir, 'node', node)
@@ -226,7 +235,7 @@ class RestoreTest(ProbackupTest, unittest.TestCase):
         self.set_archiving(backup_dir, 'node', node)
         node.slow_start()
 
-        node.pgbench_init(scale=2)
+        node.pgbench_init_cached(scale=2)
         with node.connect("postgres") as con:
             con.execute("CREATE TABLE tbl0005 (a text)")
             con.commit()
@@ -282,7 +291,7 @@ class RestoreTest(ProbackupTest, unittest.TestCase):
         self.set_archiving(backup_dir, 'node', node)
         node.slow_start()
 
-        node.pgbench_init(scale=2)
+        node.pgbench_init_cached(scale=2)
         with node.connect("postgres") as con:
             con.execute("CREATE TABLE tbl0005 (a text)")
             con.commit()
@@ -3930,3 +3939,208 @@ class RestoreTest(ProbackupTest, unittest.TestCase):
                 self.assertIn(
                     "PANIC:  could not read from control file",
                     f.read())
+
+    # @unittest.skip("skip")
+    def test_compare_pgdata_dirs_detects_changed_page(self):
+        """
+        compare_pgdata_dirs() passes for two restores of the same backup
+        and reports the page when one byte of it is changed
+        """
+        node = self.make_simple_node(
+            base_dir=os.path.join(self.module_name, self.fname, 'node'),
+            set_replication=True,
+            initdb_params=['--data-checksums'])
+
+        backup_dir = os.path.join(self.tmp_path, self.module_name, self.fname, 'backup')
+        self.init_pb(backup_dir)
+        self.add_instance(backup_dir, 'node', node)
+        node.slow_start()
+
+        node.safe_psql(
+            "postgres",
+            "create table t_heap as select i as id, md5(i::text) as text "
+            "from generate_series(0,10000) i")
+        relpath = node.safe_psql(
+            "postgres",
+            "select pg_relation_filepath('t_heap')").decode('utf-8').rstrip()
+
+        self.backup_node(backup_dir, 'node', node, options=['--stream'])
+
+        node_a = self.make_simple_node(
+            base_dir=os.path.join(self.module_name, self.fname, 'node_a'))
+        node_a.cleanup()
+        self.restore_node(backup_dir, 'node', node_a)
+
+        node_b = self.make_simple_node(
+            base_dir=os.path.join(self.module_name, self.fname, 'node_b'))
+        node_b.cleanup()
+        self.restore_node(backup_dir, 'node', node_b)
+
+        self.compare_pgdata_dirs(node_a.data_dir, node_b.data_dir)
+
+        # the last byte of page 1 is tuple data, it is never masked
+        with open(os.path.join(node_b.data_dir, relpath), 'r+b') as f:
+            f.seek(2 * 8192 - 1)
+            byte = f.read(1)
+            f.seek(2 * 8192 - 1)
+            f.write(bytes([byte[0] ^ 0xFF]))
+
+        with self.assertRaises(AssertionError) as context:
+            self.compare_pgdata_dirs(node_a.data_dir, node_b.data_dir)
+        self.assertIn('Page 1 mismatch', str(context.exception))
+        self.assertIn(
+            os.path.join(node_b.data_dir, relpath), str(context.exception))
+
+    # @unittest.skip("skip")
+    def test_server_table_checksums_detect_changed_row(self):
+        """
+        server_table_checksums() of restored tables match the original
+        ones and change if a single row of one table is updated
+        """
+        node = self.make_simple_node(
+            base_dir=os.path.join(self.module_name, self.fname, 'node'),
+            set_replication=True,
+            initdb_params=['--data-checksums'])
+
+        backup_dir = os.path.join(self.tmp_path, self.module_name, self.fname, 'backup')
+        self.init_pb(backup_dir)
+        self.add_instance(backup_dir, 'node', node)
+        node.slow_start()
+
+        node.pgbench_init(scale=1)
+        node.safe_psql("postgres", "create database db1")
+        node.safe_psql(
+            "db1",
+            "create table t_heap as select i as id, md5(i::text) as text "
+            "from generate_series(0,1000) i")
+        tables = pgbench_tables + [('db1', 't_heap')]
+        before = node.server_table_checksums(tables)
+        self.assertEqual(sorted(before), sorted(tables))
+
+        self.backup_node(backup_dir, 'node', node, options=['--stream'])
+
+        node_restored = self.make_simple_node(
+            base_dir=os.path.join(self.module_name, self.fname, 'node_restored'))
+        node_restored.cleanup()
+        self.restore_node(backup_dir, 'node', node_restored)
+        self.set_auto_conf(node_restored, {'port': node_restored.port})
+        node_restored.slow_start()
+
+        self.assertEqual(before, node_restored.server_table_checksums(tables))
+
+        node_restored.safe_psql(
+            "postgres",
+            "update pgbench_accounts set abalance = abalance + 1 where aid = 1")
+        node_restored.safe_psql(
+            "db1", "update t_heap set text = 'changed' where id = 500")
+        after = node_restored.server_table_checksums(tables)
+
+        for table in tables:
+            if table in ('pgbench_accounts', ('db1', 't_heap')):
+                self.assertNotEqual(before[table], after[table], table)
+            else:
+                self.assertEqual(before[table], after[table], table)
+
+        node_restored.stop()
+
+    # @unittest.skip("skip")
+    def test_pgbench_init_cached_clone(self):
+        """
+        Node which got pgbench data from snapshot of another node has
+        the same tables, its own system identifier and archives WAL
+        of the snapshot to its own instance
+        """
+        backup_dir = os.path.join(self.tmp_path, self.module_name, self.fname, 'backup')
+        self.init_pb(backup_dir)
+
+        nodes = []
+        for name in ('node1', 'node2'):
+            node = self.make_simple_node(
+                base_dir=os.path.join(self.module_name, self.fname, name),
+                initdb_params=['--data-checksums'])
+            self.add_instance(backup_dir, name, node)
+            self.set_archiving(backup_dir, name, node)
+            node.slow_start()
+            system_id = node.get_control_data()['Database system identifier']
+            node.pgbench_init_cached(scale=1)
+            # add_instance() has recorded it in pg_probackup.conf
+            self.assertEqual(
+                system_id,
+                node.get_control_data()['Database system identifier'])
+            nodes.append(node)
+        node1, node2 = nodes
+
+        self.assertEqual(
+            node1.server_table_checksums(pgbench_tables),
+            node2.server_table_checksums(pgbench_tables))
+        self.assertNotEqual(
+            node1.get_control_data()['Database system identifier'],
+            node2.get_control_data()['Database system identifier'])
+
+        self.backup_node(backup_dir, 'node2', node2)
+        pgbench = node2.pgbench(options=['-T', '5', '-c', '1'])
+        pgbench.wait()
+        self.backup_node(backup_dir, 'node2', node2, backup_type='page')
+        before = node2.server_table_checksums(pgbench_tables)
+        self.validate_pb(backup_dir, 'node2')
+
+        node_restored = self.make_simple_node(
+            base_dir=os.path.join(self.module_name, self.fname, 'node_restored'))
+        node_restored.cleanup()
+        self.restore_node(backup_dir, 'node2', node_restored)
+        self.set_auto_conf(node_restored, {'port': node_restored.port})
+        node_restored.slow_start()
+
+        self.assertEqual(
+            before, node_restored.server_table_checksums(pgbench_tables))
+
+    # @unittest.skip("skip")
+    def test_compare_files_page_masking(self):
+        """
+        With page masking pages which differ in LSN and hint bits only
+        compare equal, changed tuple is still reported. Speculative
+        insertion token is masked with block number counted from
+        the beginning of relation, not of segment file.
+        """
+        test_dir = os.path.join(self.tmp_path, self.module_name, self.fname)
+        shutil.rmtree(test_dir, ignore_errors=True)
+        os.makedirs(test_dir)
+
+        # heap page of zeroed tuples, t_infomask has no hint bits
+        page = make_page(random.Random(0), 0x1000000, fill=0)
+        lp_off = struct.unpack_from('=I', page, SIZE_OF_PAGE_HEADER)[0] & 0x7fff
+
+        hinted = bytearray(page)
+        struct.pack_into('=Q', hinted, 0, 0x2000000)
+        struct.pack_into('=H', hinted, lp_off + 20, HEAP_XMIN_COMMITTED)
+
+        changed = bytearray(page)
+        changed[lp_off + 100] ^= 0xFF
+
+        paths = {}
+        for name, second_page in (
+                ('original', page), ('hinted', hinted), ('changed', changed)):
+            paths[name] = os.path.join(test_dir, name)
+            with open(paths[name], 'wb') as f:
+                f.write(page + second_page)
+
+        self.assertEqual(
+            compare_files(paths['original'], paths['hinted'], True),
+            'Page 1 mismatch')
+        self.assertIsNone(compare_files(
+            paths['original'], paths['hinted'], True, mask_pages=True))
+        self.assertEqual(
+            compare_files(
+                paths['original'], paths['changed'], True, mask_pages=True),
+            'Page 1 mismatch')
+
+        # block 1 of the second segment of relation
+        self.assertEqual(segment_first_block('base/5/16384'), 0)
+        self.assertEqual(segment_first_block('base/5/16384.1'), RELSEG_SIZE)
+        speculative = bytearray(page)
+        struct.pack_into('=HHH', speculative, lp_off + 12, 0, 7, 0xfffe)
+        mask_page(speculative, segment_first_block('base/5/16384.1') + 1)
+        blkno = RELSEG_SIZE + 1
+        self.assertEqual(
+            struct.unpack_from('=HHH', speculative, lp_off + 12),
+            (blkno >> 16, blkno & 0xffff, 1))
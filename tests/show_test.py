@@ -1,6 +1,7 @@
 import os
 import unittest
 from .helpers.ptrack_helpers import ProbackupTest, ProbackupException
+from .helpers.catalog_generator import wal_segment_name, FIRST_SEGNO
 
 
 class ShowTest(ProbackupTest, unittest.TestCase):
@@ -543,3 +544,44 @@ class ShowTest(ProbackupTest, unittest.TestCase):
         self.assertIn(tblspc_path, self.show_pb(backup_dir, 'node', backup_id=full_backup_id, as_text=True, as_json=False))
         # Check that tablespace info NOT exists if backup id not provided. PLAIN
         self.assertNotIn("tablespace_map", self.show_pb(backup_dir, 'node', as_text=True, as_json=False))
+
+    # @unittest.skip("skip")
+    def test_show_synthetic_catalog(self):
+        """
+        show and show --archive of fabricated catalog of backup chains
+        on two timelines with failed backups among them
+        """
+        backup_dir = os.path.join(self.tmp_path, self.module_name, self.fname, 'backup')
+        self.init_pb(backup_dir)
+
+        backups = self.synthetic_catalog(
+            backup_dir, 'node', n_backups=200, full_every=10,
+            timeline_every=100, error_every=17).generate()
+
+        show = self.show_pb(backup_dir, 'node')
+        self.assertEqual(
+            [backup['id'] for backup in show],
+            [backup['id'] for backup in backups])
+        for shown, backup in zip(show, backups):
+            self.assertEqual(shown['status'], backup['status'])
+            self.assertEqual(shown['backup-mode'], backup['backup-mode'])
+            self.assertEqual(shown['current-tli'], backup['timelineid'])
+            self.assertEqual(
+                shown.get('parent-backup-id'), backup['parent-backup-id'])
+
+        timelines = self.show_archive(backup_dir, 'node')
+        self.assertEqual(len(timelines), 2)
+        for timeline in timelines:
+            self.assertEqual(timeline['status'], 'OK')
+            self.assertEqual(timeline['n-segments'], 400)
+            self.assertEqual(len(timeline['backups']), 100)
+
+        timeline_1 = self.show_archive(backup_dir, 'node', tli=1)
+        timeline_2 = self.show_archive(backup_dir, 'node', tli=2)
+        self.assertEqual(timeline_2['parent-tli'], 1)
+        self.assertEqual(
+            timeline_1['min-segno'], wal_segment_name(1, FIRST_SEGNO))
+        self.assertEqual(
+            timeline_1['max-segno'], wal_segment_name(1, FIRST_SEGNO + 399))
+        self.assertEqual(
+            timeline_2['min-segno'], wal_segment_name(2, FIRST_SEGNO + 400))